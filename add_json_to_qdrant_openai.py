@@ -1,23 +1,31 @@
 import json
 import os
-import time
-from typing import List, Dict, Any
+import threading
+from typing import List, Optional
 from openai import OpenAI
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-import numpy as np
+from collection_config import get_collection_config
+from embedding_cache import get_embedding_cache
+from embedding_engine import EmbeddingEngine, EmbeddingResult
+from ingest_manifest import IngestManifest, content_digest, point_id_for_digest
+from ingest_pipeline import Stage, chunked, format_stage_stats, run_pipeline
+from lexical_index import LEXICAL_INDEX_PATH, build_from_collection
 """
 this script is used to add a jsonl from EDA CORPUS  file to a qdrant collection using openai embeddings.
 """
 # --- Configuration ---
 JSONL_FILE_PATH = "/home/german/Desktop/cse291/camel/query_dataset.jsonl"  # Path to your source JSONL
-QDRANT_PATH = "vector_db/"  # Path to your Qdrant data directory
-COLLECTION_NAME = "documents_collection"  # The collection name you used
-EMBEDDING_MODEL = "text-embedding-3-large"  # OpenAI's embedding model
-OPENAI_BATCH_SIZE = 20  # OpenAI recommends smaller batches for embeddings
+COLLECTION_CONFIG = get_collection_config()  # Path, collection, model, dimension and quantization (collection_config.py)
+QDRANT_PATH = COLLECTION_CONFIG.path  # Path to your Qdrant data directory
+COLLECTION_NAME = COLLECTION_CONFIG.name  # The collection name you used
+EMBEDDING_MODEL = COLLECTION_CONFIG.model  # OpenAI's embedding model
 QDRANT_BATCH_SIZE = 100  # For Qdrant uploads
+EMBED_CHUNK_SIZE = 256  # Items handed from the reader to the embedding stage at once
+EMBED_STAGE_WORKERS = 2  # Chunks embedded concurrently (each also fans out inside EmbeddingEngine)
 QDRANT_TEXT_PAYLOAD_KEY = "text"  # Payload field in Qdrant that stores the text
-EMBEDDING_DIMENSION = 3072  # Dimension for text-embedding-ada-002
+EMBEDDING_DIMENSION = COLLECTION_CONFIG.dimension  # 3072 unless shortened via EMBEDDING_DIMENSION
+QDRANT_DELETE_BATCH_SIZE = 1000  # Stale point IDs removed per delete request
 # ---------------------
 from dotenv import load_dotenv
 import os
@@ -26,73 +34,124 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+_openai_client: Optional[OpenAI] = None
 
-def load_jsonl(file_path):
-    """Load JSONL file and return list of items."""
-    items = []
-    if not os.path.exists(file_path):
-        print(f"Error: JSONL file '{file_path}' not found.")
-        return items
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        items.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        print(f"Warning: Skipping malformed JSON line: {line[:100]}...")
-        print(f"Loaded {len(items)} items from '{file_path}'")
-        return items
-    except Exception as e:
-        print(f"Error reading JSONL file '{file_path}': {e}")
-        return []
 
-def get_openai_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
+def request_openai_embeddings(texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
     """Get embeddings for a list of texts using OpenAI's API."""
+    global _openai_client
     if not OPENAI_API_KEY:
         raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable.")
     
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    if _openai_client is None:
+        # Retries are handled by EmbeddingEngine, which also adapts to 429s.
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
     
-    try:
-        response = client.embeddings.create(
-            model=model,
-            input=texts
+    response = _openai_client.embeddings.create(
+        model=model,
+        input=texts,
+        **COLLECTION_CONFIG.embedding_kwargs()
+    )
+    return [embedding_data.embedding for embedding_data in sorted(response.data, key=lambda d: d.index)]
+
+def batch_get_embeddings(texts: List[str], engine: Optional[EmbeddingEngine] = None) -> EmbeddingResult:
+    """
+    Embed texts concurrently with the rate-limit-aware engine. Cached texts are
+    never sent to the API. Returns vectors aligned with `texts` (None where an
+    item failed) together with an explicit failure report.
+    """
+    cache = get_embedding_cache()
+    engine = engine or EmbeddingEngine(request_openai_embeddings)
+    cached = cache.get_many(EMBEDDING_MODEL, EMBEDDING_DIMENSION, texts)
+    missing = [i for i, embedding in enumerate(cached) if embedding is None]
+
+    result = engine.embed(
+        [texts[i] for i in missing],
+        on_batch=lambda batch, vectors: cache.put_many(EMBEDDING_MODEL, EMBEDDING_DIMENSION, batch, vectors),
+    )
+    for i, vector in zip(missing, result.vectors):
+        cached[i] = vector
+    for failure in result.failures:
+        failure.index = missing[failure.index]
+    result.vectors = cached
+    return result
+
+def iter_jsonl(file_path):
+    """Stream (line_number, payload_text) pairs from a JSONL file without loading it."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:  # Skip empty lines
+                continue
+            try:
+                yield line_number, json.dumps(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping malformed JSON line {line_number}: {line[:100]}...")
+
+def ensure_collection(client) -> bool:
+    """Create COLLECTION_NAME if needed; return False if an incompatible one exists."""
+    collections = client.get_collections().collections
+    collection_names = [c.name for c in collections]
+    
+    if COLLECTION_NAME in collection_names:
+        # Check if vector size matches
+        collection_info = client.get_collection(COLLECTION_NAME)
+        existing_vector_size = collection_info.config.params.vectors.size
+        if existing_vector_size != EMBEDDING_DIMENSION:
+            print(f"Error: Existing collection has vector size {existing_vector_size}, but OpenAI embeddings have size {EMBEDDING_DIMENSION}")
+            print("Use a new collection (QDRANT_COLLECTION) or set EMBEDDING_DIMENSION to match the existing one.")
+            return False
+        if COLLECTION_CONFIG.mismatches(collection_info):
+            # Quantization can be changed in place; Qdrant rebuilds the compressed vectors.
+            client.update_collection(
+                collection_name=COLLECTION_NAME,
+                quantization_config=COLLECTION_CONFIG.quantization_config() or models.Disabled.DISABLED
+            )
+            print(f"Switched collection '{COLLECTION_NAME}' to quantization '{COLLECTION_CONFIG.quantization}'")
+        print(f"Found existing collection '{COLLECTION_NAME}' with {collection_info.points_count} points")
+    else:
+        # Create new collection
+        COLLECTION_CONFIG.create_collection(client)
+        print(f"Created new collection '{COLLECTION_NAME}' ({COLLECTION_CONFIG.describe()})")
+    return True
+
+def delete_stale_points(client, manifest: IngestManifest, source: str, run_id: int) -> int:
+    """Remove points whose source lines disappeared since the last complete run."""
+    digests, point_ids = manifest.stale_entries(COLLECTION_NAME, source, run_id)
+    for start in range(0, len(point_ids), QDRANT_DELETE_BATCH_SIZE):
+        client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=point_ids[start:start + QDRANT_DELETE_BATCH_SIZE])
         )
-        return [embedding_data.embedding for embedding_data in response.data]
-    except Exception as e:
-        print(f"Error getting embeddings from OpenAI: {e}")
-        raise
-
-def batch_get_embeddings(texts: List[str], batch_size: int = OPENAI_BATCH_SIZE) -> List[List[float]]:
-    """Process texts in batches to avoid rate limits."""
-    all_embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        print(f"Getting embeddings for batch {i//batch_size + 1} ({len(batch)} items)")
-        try:
-            batch_embeddings = get_openai_embeddings(batch)
-            all_embeddings.extend(batch_embeddings)
-            # Small delay to avoid rate limits
-            if i + batch_size < len(texts):
-                time.sleep(0.5)
-        except Exception as e:
-            print(f"Error on batch starting at index {i}: {e}")
-            # Add placeholder embeddings (all zeros) for failed batch
-            all_embeddings.extend([[0.0] * EMBEDDING_DIMENSION] * len(batch))
-    return all_embeddings
-
-def ingest_to_qdrant():
-    """Ingest JSONL content into Qdrant using OpenAI embeddings."""
-    print(f"Starting ingestion of '{JSONL_FILE_PATH}' to Qdrant collection '{COLLECTION_NAME}'")
+    manifest.forget(COLLECTION_NAME, source, digests)
+    return len(point_ids)
+
+def ingest_to_qdrant(
+    jsonl_path: str = JSONL_FILE_PATH,
+    chunk_size: int = EMBED_CHUNK_SIZE,
+    full: bool = False,
+    delete_stale: bool = True,
+    build_lexical: bool = True,
+):
+    """
+    Stream JSONL content into Qdrant using OpenAI embeddings.
+    Reading, embedding and upserting run as overlapping stages connected by
+    bounded queues, so only a few chunks are in memory at any time.
+
+    Point IDs are derived from each line's content and committed lines are
+    recorded in the ingestion manifest, so by default only new or changed lines
+    are embedded and upserted, an interrupted run resumes where it stopped, and
+    points whose lines disappeared are deleted. `full=True` re-upserts every line.
+    Afterwards the BM25 index used for hybrid retrieval is rebuilt from the
+    collection (`build_lexical=False` skips it).
+    """
+    print(f"Starting ingestion of '{jsonl_path}' to Qdrant collection '{COLLECTION_NAME}'")
     
-    # 1. Load data from JSONL
-    items = load_jsonl(JSONL_FILE_PATH)
-    if not items:
-        print("No items loaded. Aborting.")
+    # 1. Check the source exists
+    if not os.path.exists(jsonl_path):
+        print(f"Error: JSONL file '{jsonl_path}' not found. Aborting.")
         return
+    source = os.path.abspath(jsonl_path)
     
     # 2. Initialize Qdrant client
     try:
@@ -104,98 +163,146 @@ def ingest_to_qdrant():
     
     # 3. Check if collection exists, create if it doesn't
     try:
-        collections = client.get_collections().collections
-        collection_names = [c.name for c in collections]
-        
-        if COLLECTION_NAME in collection_names:
-            # Check if vector size matches
-            collection_info = client.get_collection(COLLECTION_NAME)
-            existing_vector_size = collection_info.config.params.vectors.size
-            if existing_vector_size != EMBEDDING_DIMENSION:
-                print(f"Error: Existing collection has vector size {existing_vector_size}, but OpenAI embeddings have size {EMBEDDING_DIMENSION}")
-                print("To use OpenAI embeddings, you need to create a new collection with matching vector size.")
-                return
-            print(f"Found existing collection '{COLLECTION_NAME}' with {collection_info.points_count} points")
-        else:
-            # Create new collection
-            client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=models.VectorParams(
-                    size=EMBEDDING_DIMENSION,
-                    distance=models.Distance.COSINE
-                )
-            )
-            print(f"Created new collection '{COLLECTION_NAME}'")
+        if not ensure_collection(client):
+            return
     except Exception as e:
         print(f"Error checking/creating collection: {e}")
         return
     
-    # 4. Prepare items for embedding
-    item_strings = [json.dumps(item) for item in items]
-    print(f"Getting embeddings for {len(item_strings)} items using OpenAI API...")
-    
-    # 5. Get embeddings from OpenAI in batches
-    try:
-        embeddings = batch_get_embeddings(item_strings)
-        if len(embeddings) != len(items):
-            print(f"Warning: Got {len(embeddings)} embeddings for {len(items)} items")
-            print("Proceeding with available embeddings only")
-    except Exception as e:
-        print(f"Fatal error getting embeddings: {e}")
-        return
-    
-    # 6. Process items and upsert to Qdrant
-    batch = []
-    total_processed = 0
+    # 4. Open the manifest and start a run
+    manifest = IngestManifest()
+    previous = manifest.last_run(COLLECTION_NAME, source)
+    if previous and previous[1] == "running":
+        print(f"Previous run {previous[0]} did not finish; resuming from its checkpoint")
+    known = manifest.count(COLLECTION_NAME, source)
+    print(f"Manifest has {known} committed lines for this source ({'full' if full else 'incremental'} mode)")
+    run_id = manifest.start_run(COLLECTION_NAME, source)
     
-    for i, (item_str, embedding) in enumerate(zip(item_strings, embeddings)):
-        try:
-            # Skip items with zero embeddings (failed to embed)
-            if np.all(np.array(embedding) == 0):
-                print(f"Skipping item {i} due to embedding failure")
+    # 5. Stages: read chunks -> diff against manifest -> embed concurrently -> upsert + checkpoint
+    engine = EmbeddingEngine(request_openai_embeddings)
+    failures = []
+    api_stats = {"requests": 0, "retries": 0, "rate_limited": 0}
+    counters_lock = threading.Lock()
+    counts = {"unchanged": 0, "upserted": 0}
+
+    def diff_chunk(records):
+        digests = [content_digest(text) for _, text in records]
+        committed = manifest.mark_seen(COLLECTION_NAME, source, digests, run_id)
+        fresh = {}
+        for (line_number, text), digest in zip(records, digests):
+            if digest in fresh:
                 continue
-                
-            # Create point
-            point = models.PointStruct(
-                id=i+1,  # Use index+1 as ID
-                vector=embedding,
-                payload={
-                    QDRANT_TEXT_PAYLOAD_KEY: item_str
-                }
-            )
-            batch.append(point)
-            
-            # Process batch if batch size reached
-            if len(batch) >= QDRANT_BATCH_SIZE:
-                client.upsert(
-                    collection_name=COLLECTION_NAME,
-                    points=batch
+            if committed[digest] and not full:
+                with counters_lock:
+                    counts["unchanged"] += 1
+                continue
+            fresh[digest] = (line_number, text, digest)
+        return list(fresh.values()) or None
+
+    def embed_chunk(records):
+        result = batch_get_embeddings([text for _, text, _ in records], engine)
+        with counters_lock:
+            for key in api_stats:
+                api_stats[key] += getattr(result, key)
+            for failure in result.failures:
+                failures.append((records[failure.index][0], failure))
+        return [(record, vector) for record, vector in zip(records, result.vectors) if vector is not None] or None
+
+    def upsert_chunk(embedded):
+        for start in range(0, len(embedded), QDRANT_BATCH_SIZE):
+            batch = embedded[start:start + QDRANT_BATCH_SIZE]
+            points = [
+                models.PointStruct(
+                    id=point_id_for_digest(digest),  # Content-derived, stable across reorders
+                    vector=vector,
+                    payload={
+                        QDRANT_TEXT_PAYLOAD_KEY: text
+                    }
                 )
-                print(f"Processed {total_processed + len(batch)} / {len(items)} items")
-                total_processed += len(batch)
-                batch = []
-        except Exception as e:
-            print(f"Error processing item {i}: {e}")
-    
-    # Process remaining batch
-    if batch:
-        try:
+                for (_, text, digest), vector in batch
+            ]
             client.upsert(
                 collection_name=COLLECTION_NAME,
-                points=batch
+                points=points
             )
-            total_processed += len(batch)
+            manifest.commit(COLLECTION_NAME, source, [(digest, str(line)) for (line, _, digest), _ in batch], run_id)
+            with counters_lock:
+                counts["upserted"] += len(points)
+
+    stats = run_pipeline(
+        chunked(iter_jsonl(jsonl_path), chunk_size),
+        [
+            Stage("diff", diff_chunk),
+            Stage("embed", embed_chunk, workers=EMBED_STAGE_WORKERS),
+            Stage("upsert", upsert_chunk),
+        ],
+    )
+    engine.shutdown()
+    
+    # 6. Remove points for lines that disappeared, but only if every line was read and diffed
+    read_complete = stats[0].errors == 0 and stats[1].errors == 0
+    deleted = 0
+    if read_complete and delete_stale:
+        try:
+            deleted = delete_stale_points(client, manifest, source, run_id)
         except Exception as e:
-            print(f"Error processing final batch: {e}")
+            print(f"Error deleting stale points: {e}")
+            read_complete = False
+    elif not read_complete:
+        print("Warning: source was not fully read; stale points were not deleted")
+    clean = read_complete and not failures and all(s.errors == 0 for s in stats)
+    manifest.finish_run(run_id, "complete" if clean else "partial")
     
-    print(f"Ingestion complete. Successfully processed {total_processed} / {len(items)} items.")
+    total_read = stats[0].items
+    print(f"Ingestion complete. Read {total_read} lines: {counts['unchanged']} unchanged, "
+          f"{counts['upserted']} upserted, {deleted} stale points deleted.")
+    print("Stage throughput:")
+    print(format_stage_stats(stats))
+    print(f"Embedding API: {api_stats['requests']} requests, {api_stats['retries']} retries, "
+          f"{api_stats['rate_limited']} rate-limited")
+    if failures:
+        print(f"Warning: {len(failures)} items could not be embedded and were not ingested "
+              f"(they will be retried on the next run):")
+        for line_number, failure in sorted(failures, key=lambda f: f[0]):
+            print(f"  Line {line_number} ({failure.attempts} attempts): {failure.error}")
+    cache_stats = get_embedding_cache().stats()
+    print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+          f"({cache_stats['entries']} entries, {cache_stats['bytes'] / 1e6:.1f} MB)")
     
     # 7. Verify results
     try:
         collection_info = client.get_collection(COLLECTION_NAME)
         print(f"Collection '{COLLECTION_NAME}' now has {collection_info.points_count} points")
+        tracked = manifest.count(COLLECTION_NAME)
+        if collection_info.points_count > tracked:
+            print(f"Note: {collection_info.points_count - tracked} points are not tracked by the manifest "
+                  f"(e.g. written by an older ingestion with sequential IDs); recreate the collection to drop them.")
     except Exception as e:
         print(f"Error getting collection info: {e}")
+    if build_lexical:
+        try:
+            build_from_collection(client, COLLECTION_NAME, LEXICAL_INDEX_PATH)
+        except Exception as e:
+            print(f"Error building lexical index (retrieval falls back to vector-only): {e}")
+    manifest.close()
 
 if __name__ == "__main__":
-    ingest_to_qdrant()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream a JSONL corpus into Qdrant with OpenAI embeddings.")
+    parser.add_argument("--jsonl", default=JSONL_FILE_PATH, help="Source JSONL file")
+    parser.add_argument("--chunk_size", type=int, default=EMBED_CHUNK_SIZE,
+                        help="Items passed between pipeline stages at once")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-embed and upsert every line instead of only new or changed ones")
+    parser.add_argument("--keep_stale", action="store_true",
+                        help="Do not delete points whose source lines disappeared")
+    parser.add_argument("--no_lexical", action="store_true",
+                        help=f"Do not rebuild the BM25 index ({LEXICAL_INDEX_PATH}) after ingesting")
+    args = parser.parse_args()
+    ingest_to_qdrant(
+        jsonl_path=args.jsonl,
+        chunk_size=args.chunk_size,
+        full=args.full,
+        delete_stale=not args.keep_stale,
+        build_lexical=not args.no_lexical,
+    )
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""
+Offline end-to-end latency benchmark.
+
+Drives the real answer_vlsi_query / answer_and_execute code over a fixed
+question set, with OpenAI, Qdrant and Neo4j replaced by the deterministic
+stand-ins from stand_ins.py. The vector store is a local-path Qdrant
+collection by default, a memory-mapped index (mmap_index.py) with
+--vector_store mmap, or in-memory with --vector_store memory. The pipeline's
+stage functions are wrapped with timers, so the report breaks every question
+down into:
+    cache_lookup, vector, entities, kg, context, llm, execution, total
+with p50/p95/p99 per stage, throughput at the chosen concurrency and peak RSS.
+Results can be saved as a baseline and later runs compared against it; a
+stage whose p50 or p95 regressed by more than --tolerance fails the run.
+
+    python benchmark.py --save_baseline                       # record benchmark_baseline.json
+    python benchmark.py --compare                             # exit 1 on a regression
+    python benchmark.py --mode answer --concurrency 8 --llm_latency 0.5
+"""
+
+import concurrent.futures
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import context_builder
+import executor
+import pipeline
+import stand_ins
+from tracing import percentile
+
+# --- Configuration ---
+BENCHMARK_BASELINE = "benchmark_baseline.json"
+BENCHMARK_TOLERANCE = 0.20  # Relative slowdown allowed before a stage counts as regressed
+BENCHMARK_SLACK_MS = 5.0  # Absolute slack so microsecond-scale stages don't flap
+BENCHMARK_QUESTIONS = [
+    "How does OpenROAD perform global placement with RePlAce?",
+    "What does TritonCTS do after placement?",
+    "Explain how TritonRoute handles detailed routing and antenna violations.",
+    "How do I read setup and hold slack from OpenSTA?",
+    "What is decided during floorplanning?",
+    "How is the power distribution network generated?",
+    "Write a script that runs the OpenROAD flow from synthesis to GDSII.",
+    "Which tool produces the gate-level netlist from RTL?",
+    "Write a script that reports timing after clock tree synthesis.",
+    "How are IO pins placed in OpenROAD?",
+]
+STAGES = ["cache_lookup", "vector", "lexical", "entities", "kg", "context", "llm", "execution", "total"]
+# ---------------------
+
+
+class StageTimer:
+    """Thread-safe collection of per-stage durations (seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        timed.__wrapped__ = fn
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage in STAGES:
+            values = self.samples.get(stage)
+            if not values:
+                continue
+            out[stage] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            }
+        return out
+
+
+def instrument(timer: StageTimer) -> Callable[[], None]:
+    """Wrap the pipeline's stage functions with `timer`; returns a function that undoes it."""
+    targets = [
+        (pipeline, "semantic_cache_lookup", "cache_lookup"),
+        (executor, "semantic_cache_lookup", "cache_lookup"),
+        (pipeline, "retrieve_vector_context", "vector"),
+        (pipeline, "retrieve_lexical_context", "lexical"),
+        (pipeline, "extract_entities", "entities"),
+        (pipeline, "retrieve_kg_context", "kg"),
+        (context_builder, "build_context", "context"),
+        (pipeline, "ask_agent", "llm"),
+        (executor, "ask_agent", "llm"),
+        (executor, "run_code", "execution"),
+    ]
+    originals = []
+    for module, name, stage in targets:
+        original = getattr(module, name)
+        originals.append((module, name, original))
+        setattr(module, name, timer.wrap(stage, original))
+
+    def restore():
+        for module, name, original in originals:
+            setattr(module, name, original)
+    return restore
+
+
+def synthetic_docs(n: int, seed: int = 0) -> List[str]:
+    """`n` deterministic documents built from the stand-in samples, for larger collections."""
+    rng = random.Random(seed)
+    base = list(stand_ins.SAMPLE_DOCS)
+    docs = base[:n]
+    while len(docs) < n:
+        a, b = rng.sample(base, 2)
+        docs.append(f"{a} {b} (variant {len(docs)})")
+    return docs
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak RSS of this process and of its (waited-for) children, in MB (Linux reports KB)."""
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def run_benchmark(
+    questions: Sequence[str] = BENCHMARK_QUESTIONS,
+    mode: str = "execute",
+    repeat: int = 3,
+    concurrency: int = 1,
+    latency: float = 0.0,
+    llm_latency: float = 0.05,
+    docs: int = len(stand_ins.SAMPLE_DOCS),
+    vector_store: str = "qdrant",
+    use_cache: bool = False,
+    warmup: int = 1,
+) -> dict:
+    """Run every question `repeat` times and return the report dict."""
+    store_dir = tempfile.mkdtemp(prefix=f"bench_{vector_store}_") if vector_store != "memory" else None
+    try:
+        stand_ins.install(latency=latency, chat_latency=llm_latency, docs=synthetic_docs(docs),
+                          qdrant_path=store_dir if vector_store == "qdrant" else None,
+                          mmap_path=os.path.join(store_dir, "index") if vector_store == "mmap" else None)
+        limits = executor.ExecLimits(wall_timeout=60)
+
+        def one(question: str):
+            if mode == "answer":
+                return pipeline.answer_vlsi_query(question, use_cache=use_cache)
+            return executor.answer_and_execute(question, use_cache=use_cache, exec_limits=limits, verbose=False)
+
+        for question in list(questions)[:warmup]:
+            one(question)  # Build the entity matcher etc. outside the measurement
+
+        timer = StageTimer()
+        restore = instrument(timer)
+        work = [q for _ in range(repeat) for q in questions]
+        total = timer.wrap("total", one)
+        started = time.perf_counter()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+                list(pool.map(total, work))
+        finally:
+            restore()
+        elapsed = time.perf_counter() - started
+    finally:
+        if store_dir:
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+    return {
+        "config": {
+            "mode": mode, "questions": len(questions), "repeat": repeat, "concurrency": concurrency,
+            "latency": latency, "llm_latency": llm_latency, "docs": docs,
+            "vector_store": vector_store, "use_cache": use_cache,
+        },
+        "stages": timer.summary(),
+        "throughput_qps": round(len(work) / elapsed, 3) if elapsed > 0 else 0.0,
+        "wall_seconds": round(elapsed, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = BENCHMARK_TOLERANCE,
+            slack_ms: float = BENCHMARK_SLACK_MS) -> List[str]:
+    """Regressions of `report` against `baseline`, one line each (empty when none)."""
+    problems = []
+    if report.get("config") != baseline.get("config"):
+        problems.append(f"config differs from baseline: {baseline.get('config')} -> {report.get('config')}")
+    for stage, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            limit = base[key] * (1 + tolerance) + slack_ms
+            if stats[key] > limit:
+                problems.append(f"{stage} {key}: {stats[key]:.1f} ms vs baseline {base[key]:.1f} ms")
+    base_qps = baseline.get("throughput_qps")
+    if base_qps and report["throughput_qps"] < base_qps / (1 + tolerance):
+        problems.append(f"throughput: {report['throughput_qps']:.2f}/s vs baseline {base_qps:.2f}/s")
+    return problems
+
+
+def format_report(report: dict, baseline: Optional[dict] = None) -> str:
+    lines = [f"{'stage':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" + ("  baseline p50/p95" if baseline else "")]
+    for stage, s in report["stages"].items():
+        line = f"{stage:<14}{s['count']:>6}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+        base = (baseline or {}).get("stages", {}).get(stage)
+        if base:
+            line += f"  {base['p50_ms']:.1f}/{base['p95_ms']:.1f}"
+        lines.append(line)
+    rss = report["peak_rss_mb"]
+    lines.append(f"Throughput {report['throughput_qps']:.2f} questions/s "
+                 f"(concurrency {report['config']['concurrency']}, {report['wall_seconds']:.1f}s); "
+                 f"peak RSS {rss['self']:.0f} MB, scripts {rss['children']:.0f} MB")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Offline pipeline latency benchmark with local stand-ins")
+    parser.add_argument("--mode", choices=["answer", "execute"], default="execute")
+    parser.add_argument("--questions", help="JSONL of questions (default: built-in set)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in embedding/vector/graph latency (s)")
+    parser.add_argument("--llm_latency", type=float, default=0.05, help="Stand-in chat reply latency (s)")
+    parser.add_argument("--docs", type=int, default=len(stand_ins.SAMPLE_DOCS), help="Documents in the collection")
+    parser.add_argument("--vector_store", choices=["qdrant", "mmap", "memory"], default="qdrant")
+    parser.add_argument("--use_cache", action="store_true", help="Leave the semantic cache on")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE)
+    parser.add_argument("--save_baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Fail if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    questions = BENCHMARK_QUESTIONS
+    if args.questions:
+        questions = [q for _, q in executor.read_questions(args.questions)]
+    report = run_benchmark(
+        questions, mode=args.mode, repeat=args.repeat, concurrency=args.concurrency,
+        latency=args.latency, llm_latency=args.llm_latency, docs=args.docs,
+        vector_store=args.vector_store, use_cache=args.use_cache,
+    )
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif args.compare:
+        if baseline is None:
+            sys.exit(f"No baseline at {args.baseline}; run with --save_baseline first")
+        problems = compare(report, baseline, tolerance=args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,277 @@
+"""
+Resource-bounded subprocess execution with streaming output.
+
+Scripts run under a wall-clock timeout plus RLIMIT_CPU / RLIMIT_AS limits,
+their stdout/stderr are forwarded to a callback as they are produced, and
+only the head and tail of each stream are retained. The structured
+ExecutionResult records exit code, duration, peak RSS and whether anything
+was truncated or killed.
+"""
+
+import codecs
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits are then wall-clock only
+    resource = None
+
+# --- Configuration ---
+EXEC_WALL_TIMEOUT = float(os.getenv("EXEC_WALL_TIMEOUT", "300"))  # Seconds; 0 disables
+EXEC_CPU_SECONDS = int(os.getenv("EXEC_CPU_SECONDS", "240"))  # CPU seconds; 0 disables
+EXEC_MEMORY_MB = int(os.getenv("EXEC_MEMORY_MB", "4096"))  # Address-space cap; 0 disables
+EXEC_OUTPUT_HEAD_BYTES = 8 * 1024  # Kept from the start of each stream
+EXEC_OUTPUT_TAIL_BYTES = 8 * 1024  # Kept from the end of each stream
+READ_CHUNK = 4096
+# ---------------------
+
+
+@dataclass
+class ExecLimits:
+    wall_timeout: float = EXEC_WALL_TIMEOUT
+    cpu_seconds: int = EXEC_CPU_SECONDS
+    memory_mb: int = EXEC_MEMORY_MB
+    head_bytes: int = EXEC_OUTPUT_HEAD_BYTES
+    tail_bytes: int = EXEC_OUTPUT_TAIL_BYTES
+
+
+@dataclass
+class ExecutionResult:
+    command: List[str]
+    exit_code: Optional[int]
+    duration: float
+    stdout: str = ""
+    stderr: str = ""
+    peak_rss_kb: Optional[int] = None
+    truncated: bool = False
+    timed_out: bool = False
+    cancelled: bool = False
+    killed_by_signal: Optional[int] = None
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out and not self.cancelled
+
+    def format(self) -> str:
+        """The debug text fed back to the LLM (same layout as before, plus limits info)."""
+        status = f"Exit code: {self.exit_code}"
+        if self.timed_out:
+            status += " (killed: time limit exceeded)"
+        elif self.cancelled:
+            status += " (cancelled)"
+        elif self.killed_by_signal is not None:
+            status += f" (killed by signal {self.killed_by_signal})"
+        details = f"Duration: {self.duration:.2f}s"
+        if self.peak_rss_kb is not None:
+            details += f", peak RSS: {self.peak_rss_kb / 1024:.1f} MB"
+        if self.truncated:
+            details += ", output truncated"
+        parts = [
+            f"Command: {' '.join(self.command)}",
+            status,
+            details,
+            "----- STDOUT -----",
+            self.stdout or "<empty>",
+            "----- STDERR -----",
+            self.stderr or "<empty>",
+        ]
+        return "\n".join(parts)
+
+
+class HeadTailBuffer:
+    """Keeps the first `head` and last `tail` bytes of a stream and counts what was dropped."""
+
+    def __init__(self, head: int, tail: int):
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.dropped = 0
+
+    def write(self, data: bytes):
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+            self.tail_size -= len(self.tail[0])
+            self.dropped += len(self.tail.popleft())
+        if self.tail_size > self.tail_limit:
+            # Trim the oldest chunk so exactly `tail_limit` bytes remain.
+            excess = self.tail_size - self.tail_limit
+            self.tail[0] = self.tail[0][excess:]
+            self.tail_size -= excess
+            self.dropped += excess
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped > 0
+
+    def text(self) -> str:
+        head = bytes(self.head).decode("utf-8", errors="replace")
+        tail = b"".join(self.tail).decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"{head}\n... [{self.dropped} bytes truncated] ...\n{tail}"
+        return head + tail
+
+
+# Sets the RLIMITs passed as "resource:soft:hard,..." and execs the rest of argv.
+_LIMIT_WRAPPER = (
+    "import os, resource, sys\n"
+    "for spec in filter(None, sys.argv[1].split(',')):\n"
+    "    r, soft, hard = map(int, spec.split(':'))\n"
+    "    resource.setrlimit(r, (soft, hard))\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def rlimits(cpu_seconds: int = 0, memory_mb: int = 0) -> List[Tuple[int, Tuple[int, int]]]:
+    """(resource, (soft, hard)) pairs for RLIMIT_CPU / RLIMIT_AS; 0 leaves a limit off."""
+    if resource is None:
+        return []
+    limits = []
+    if cpu_seconds > 0:
+        limits.append((resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5)))
+    if memory_mb > 0:
+        cap = memory_mb * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, (cap, cap)))
+    return limits
+
+
+def spawn_limited(command: List[str], limits: List[Tuple[int, Tuple[int, int]]], **popen_kwargs) -> subprocess.Popen:
+    """
+    subprocess.Popen(command) under `limits` (see rlimits()). preexec_fn is not
+    safe once the parent has threads (the service, batch mode and the
+    speculative race all spawn from worker threads), so on Linux the limits
+    are applied to the new process with prlimit() right after it starts;
+    elsewhere a small Python wrapper sets them and execs the command.
+    """
+    use_prlimit = hasattr(resource, "prlimit")
+    if limits and not use_prlimit:
+        spec = ",".join(f"{r}:{soft}:{hard}" for r, (soft, hard) in limits)
+        command = [sys.executable, "-S", "-c", _LIMIT_WRAPPER, spec, *command]
+    proc = subprocess.Popen(command, **popen_kwargs)
+    if limits and use_prlimit:
+        try:
+            for r, limit in limits:
+                resource.prlimit(proc.pid, r, limit)
+        except ProcessLookupError:
+            pass  # Already exited; it had nothing left to limit
+    return proc
+
+
+def run_bounded(
+    command: List[str],
+    limits: Optional[ExecLimits] = None,
+    on_output: Optional[Callable[[str, str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    cwd: Optional[str] = None,
+) -> ExecutionResult:
+    """
+    Run `command` under `limits`. `on_output(stream, text)` receives stdout /
+    stderr text as it is produced; setting `cancel_event` kills the process.
+    """
+    limits = limits or ExecLimits()
+    posix = resource is not None
+    started = time.perf_counter()
+    proc = spawn_limited(
+        command,
+        rlimits(limits.cpu_seconds, limits.memory_mb),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=posix,  # Own process group, so the whole tree can be killed
+    )
+    buffers = {"stdout": HeadTailBuffer(limits.head_bytes, limits.tail_bytes),
+               "stderr": HeadTailBuffer(limits.head_bytes, limits.tail_bytes)}
+
+    def pump(name, pipe):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        fd = pipe.fileno()
+        while True:
+            data = os.read(fd, READ_CHUNK)
+            if not data:
+                break
+            buffers[name].write(data)
+            if on_output:
+                on_output(name, decoder.decode(data))
+        if on_output:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                on_output(name, tail)
+        pipe.close()
+
+    pumps = [threading.Thread(target=pump, args=("stdout", proc.stdout), daemon=True),
+             threading.Thread(target=pump, args=("stderr", proc.stderr), daemon=True)]
+    for t in pumps:
+        t.start()
+
+    status = {}
+
+    def reap():
+        if posix:
+            _, wait_status, usage = os.wait4(proc.pid, 0)
+            status["code"] = os.waitstatus_to_exitcode(wait_status)
+            status["rss"] = usage.ru_maxrss  # Kilobytes on Linux
+            proc.returncode = status["code"]
+        else:
+            status["code"] = proc.wait()
+
+    reaper = threading.Thread(target=reap, daemon=True)
+    reaper.start()
+
+    timed_out = cancelled = False
+    deadline = started + limits.wall_timeout if limits.wall_timeout > 0 else None
+    while reaper.is_alive():
+        reaper.join(timeout=0.05)
+        if not reaper.is_alive():
+            break
+        if cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+        elif deadline is not None and time.perf_counter() > deadline:
+            timed_out = True
+        if timed_out or cancelled:
+            _kill(proc, posix)
+            reaper.join()
+            break
+    for t in pumps:
+        t.join(timeout=5)
+
+    code = status.get("code")
+    return ExecutionResult(
+        command=list(command),
+        exit_code=code,
+        duration=time.perf_counter() - started,
+        stdout=buffers["stdout"].text(),
+        stderr=buffers["stderr"].text(),
+        peak_rss_kb=status.get("rss"),
+        truncated=buffers["stdout"].truncated or buffers["stderr"].truncated,
+        timed_out=timed_out,
+        cancelled=cancelled,
+        killed_by_signal=-code if code is not None and code < 0 else None,
+    )
+
+
+def _kill(proc: subprocess.Popen, posix: bool):
+    try:
+        if posix:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
@@ -0,0 +1,35 @@
+from camel.embeddings import BaseEmbedding
+
+import tracing
+from embedding_cache import get_embedding_cache
+
+
+class CachedEmbedding(BaseEmbedding[str]):
+    """
+    Wraps a CAMEL embedding model with the shared on-disk embedding cache,
+    so repeated queries (and texts already embedded at ingestion) skip the API.
+    """
+
+    def __init__(self, embedding_model: BaseEmbedding):
+        self.embedding_model = embedding_model
+        self.model_name = getattr(embedding_model.model_type, "value", str(embedding_model.model_type))
+        self.cache = get_embedding_cache()
+
+    def embed_list(self, objs, **kwargs):
+        objs = list(objs)
+        with tracing.span("embed", texts=len(objs)) as sp:
+            computed = []
+
+            def compute(missing):
+                computed.append(len(missing))
+                return self.embedding_model.embed_list(objs=missing, **kwargs)
+
+            vectors = self.cache.get_or_compute(self.model_name, self.get_output_dim(), objs, compute)
+            misses = sum(computed)
+            sp.set(cache_misses=misses)
+            tracing.count("pipeline_cache_total", len(objs) - misses, cache="embedding", result="hit")
+            tracing.count("pipeline_cache_total", misses, cache="embedding", result="miss")
+            return vectors
+
+    def get_output_dim(self) -> int:
+        return self.embedding_model.get_output_dim()
@@ -0,0 +1,159 @@
+"""
+Vector collection settings shared by ingestion, retrieval and inspection.
+
+The Qdrant path and collection name, the embedding model and its output
+dimension, how vectors are stored and how they are searched are chosen here
+once, so add_json_to_qdrant_openai.py creates the collection that pipeline.py
+expects and inspect_qdrant.py checks it against the same settings:
+
+    EMBEDDING_DIMENSION=1024 VECTOR_QUANTIZATION=scalar python add_json_to_qdrant_openai.py
+    EMBEDDING_DIMENSION=1024 VECTOR_QUANTIZATION=scalar python executor.py "..."
+
+text-embedding-3 models can return shortened embeddings (the `dimensions`
+request parameter), which keeps most of their quality at a fraction of the
+size. With scalar (int8) or binary quantization the collection keeps the
+compressed vectors in RAM and the originals on disk, searches the compressed
+ones and rescores the best `oversampling * top_k` candidates against the
+originals. Qdrant's local (path) mode ignores quantization and always searches
+full vectors; there only the dimension shrinks the store. quantization_report.py
+measures recall against latency for candidate settings.
+"""
+
+import os
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# --- Configuration ---
+QDRANT_PATH = os.getenv("QDRANT_PATH", "vector_db/")
+COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "documents_collection")
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_FULL_DIMENSION = 3072  # Native size of text-embedding-3-large
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", str(EMBEDDING_FULL_DIMENSION)))
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # "none", "scalar" (int8) or "binary"
+QUANTIZATION_ALWAYS_RAM = True  # Keep quantized vectors in RAM, originals on disk
+SCALAR_QUANTILE = 0.99  # Share of values used to pick the int8 range (outliers are clipped)
+SEARCH_RESCORE = os.getenv("SEARCH_RESCORE", "1") not in ("0", "false", "False")
+SEARCH_OVERSAMPLING = float(os.getenv("SEARCH_OVERSAMPLING", "2.0"))  # Candidates fetched per result before rescoring
+SEARCH_HNSW_EF = int(os.getenv("SEARCH_HNSW_EF", "0"))  # 0 = Qdrant's default
+QUANTIZATIONS = ("none", "scalar", "binary")
+# ---------------------
+
+
+@dataclass(frozen=True)
+class CollectionConfig:
+    path: str = QDRANT_PATH
+    name: str = COLLECTION_NAME
+    model: str = EMBEDDING_MODEL
+    dimension: int = EMBEDDING_DIMENSION
+    quantization: str = VECTOR_QUANTIZATION
+    rescore: bool = SEARCH_RESCORE
+    oversampling: float = SEARCH_OVERSAMPLING
+    hnsw_ef: int = SEARCH_HNSW_EF
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {self.quantization!r}")
+        if not 0 < self.dimension <= EMBEDDING_FULL_DIMENSION:
+            raise ValueError(f"dimension must be in 1..{EMBEDDING_FULL_DIMENSION}, got {self.dimension}")
+
+    @property
+    def truncated(self) -> bool:
+        return self.dimension < EMBEDDING_FULL_DIMENSION
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization != "none"
+
+    def with_options(self, **changes) -> "CollectionConfig":
+        return replace(self, **changes)
+
+    def embedding_kwargs(self) -> dict:
+        """Extra arguments for the embeddings API (`dimensions` only when shortened)."""
+        return {"dimensions": self.dimension} if self.truncated else {}
+
+    def vectors_config(self):
+        from qdrant_client.http import models
+        return models.VectorParams(
+            size=self.dimension,
+            distance=models.Distance.COSINE,
+            on_disk=self.quantized,  # Only the quantized copy needs to be in RAM
+        )
+
+    def quantization_config(self):
+        from qdrant_client.http import models
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=SCALAR_QUANTILE, always_ram=QUANTIZATION_ALWAYS_RAM))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+                always_ram=QUANTIZATION_ALWAYS_RAM))
+        return None
+
+    def search_params(self):
+        """SearchParams for queries, or None when Qdrant's defaults apply."""
+        if not self.quantized and not self.hnsw_ef:
+            return None
+        from qdrant_client.http import models
+        quantization = None
+        if self.quantized:
+            quantization = models.QuantizationSearchParams(
+                rescore=self.rescore, oversampling=self.oversampling if self.rescore else None)
+        return models.SearchParams(hnsw_ef=self.hnsw_ef or None, quantization=quantization)
+
+    def create_collection(self, client):
+        client.create_collection(
+            collection_name=self.name,
+            vectors_config=self.vectors_config(),
+            quantization_config=self.quantization_config(),
+        )
+
+    def mismatches(self, collection_info) -> List[str]:
+        """How an existing collection differs from this configuration (empty when it matches)."""
+        params = collection_info.config.params.vectors
+        problems = []
+        if params.size != self.dimension:
+            problems.append(f"vector size is {params.size}, configured {self.dimension}")
+        existing = stored_quantization(collection_info)
+        if existing != self.quantization:
+            problems.append(f"quantization is {existing}, configured {self.quantization}")
+        return problems
+
+    def describe(self) -> str:
+        text = f"{self.model} @ {self.dimension} dims, quantization {self.quantization}"
+        if self.quantized:
+            text += f", rescore {'x%g' % self.oversampling if self.rescore else 'off'}"
+        if self.hnsw_ef:
+            text += f", hnsw_ef {self.hnsw_ef}"
+        return text
+
+
+def stored_quantization(collection_info) -> str:
+    """"none", "scalar" or "binary" for an existing collection's quantization config."""
+    config = getattr(collection_info.config, "quantization_config", None)
+    if config is None:
+        return "none"
+    if getattr(config, "scalar", None) is not None:
+        return "scalar"
+    if getattr(config, "binary", None) is not None:
+        return "binary"
+    return type(config).__name__
+
+
+_config: Optional[CollectionConfig] = None
+
+
+def get_collection_config() -> CollectionConfig:
+    """The process-wide configuration, from the settings above (and their env overrides)."""
+    global _config
+    if _config is None:
+        _config = CollectionConfig()
+    return _config
+
+
+def truncate(vectors: Sequence[Sequence[float]], dimension: int) -> np.ndarray:
+    """First `dimension` components, renormalized: what the API returns for `dimensions=dimension`."""
+    arr = np.asarray(vectors, dtype=np.float32)[..., :dimension]
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    return arr / np.where(norms == 0, 1, norms)
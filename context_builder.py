@@ -0,0 +1,174 @@
+"""
+Prompt context assembly for answer_vlsi_query.
+
+Retrieved chunks and KG edges are deduplicated, chunks are reordered by
+maximal marginal relevance (computed in one vectorized pass over the vectors
+the vector store already returned), everything is serialized compactly, and
+the result is packed into a fixed token budget. A ContextReport records how
+many tokens each source used and what was dropped.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tokens import count_tokens, truncate_to_tokens
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+KG_BUDGET_SHARE = 0.25  # Budget reserved for KG edges when there are enough of them
+MMR_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+MIN_TRUNCATED_TOKENS = 64  # Don't bother adding a truncated chunk shorter than this
+# ---------------------
+
+
+@dataclass
+class RetrievedChunk:
+    """One vector-store hit: payload text, similarity score and (if returned) its vector."""
+    text: str
+    score: float
+    vector: Optional[Sequence[float]] = None
+    point_id: Optional[str] = None
+
+
+@dataclass
+class ContextReport:
+    tokens_by_source: Dict[str, int] = field(default_factory=dict)
+    chunks_used: int = 0
+    chunks_dropped: int = 0
+    edges_used: int = 0
+    edges_dropped: int = 0
+    duplicates_removed: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens_by_source.values())
+
+    def summary(self) -> str:
+        sources = ", ".join(f"{name} {tokens}" for name, tokens in self.tokens_by_source.items())
+        return (f"Context: {self.total_tokens} tokens ({sources}); "
+                f"{self.chunks_used} chunks, {self.edges_used} KG edges used; "
+                f"{self.chunks_dropped} chunks, {self.edges_dropped} edges over budget; "
+                f"{self.duplicates_removed} duplicates removed")
+
+
+def compact_text(text: str) -> str:
+    """Re-serialize JSON payloads without padding; collapse whitespace in plain text."""
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.dumps(json.loads(stripped), separators=(",", ":"), ensure_ascii=False)
+        except ValueError:
+            pass
+    return " ".join(stripped.split())
+
+
+def compact_edge(edge: str) -> str:
+    """'Node a --REL--> b' -> 'a --REL--> b'."""
+    return edge[5:] if edge.startswith("Node ") else edge
+
+
+def _dedupe(items: Sequence[Any], key) -> Tuple[List[Any], int]:
+    seen, kept = set(), []
+    for item in items:
+        k = hashlib.sha1(key(item).encode("utf-8")).digest()
+        if k not in seen:
+            seen.add(k)
+            kept.append(item)
+    return kept, len(items) - len(kept)
+
+
+def mmr_order(query_vector: Optional[Sequence[float]], chunks: Sequence[RetrievedChunk], lam: float = MMR_LAMBDA) -> List[int]:
+    """
+    Indices of `chunks` in maximal-marginal-relevance order. Chunks without a
+    vector (lexical-only hits) keep their score rank and the others are
+    reordered by MMR around them; score order without a query vector.
+    """
+    by_score = sorted(range(len(chunks)), key=lambda i: -chunks[i].score)
+    with_vector = [i for i in by_score if chunks[i].vector is not None]
+    if query_vector is None or len(with_vector) < 2:
+        return by_score
+    reranked = iter([with_vector[j] for j in _mmr(query_vector, [chunks[i].vector for i in with_vector], lam)])
+    return [next(reranked) if chunks[i].vector is not None else i for i in by_score]
+
+
+def _mmr(query_vector: Sequence[float], vectors: Sequence[Sequence[float]], lam: float) -> List[int]:
+    docs = np.asarray(vectors, dtype=np.float32)
+    docs /= np.maximum(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q /= max(float(np.linalg.norm(q)), 1e-12)
+    relevance = docs @ q
+    pairwise = docs @ docs.T
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything already selected.
+    max_sim = pairwise[selected[0]].copy()
+    remaining = np.ones(len(docs), dtype=bool)
+    remaining[selected[0]] = False
+    while remaining.any():
+        scores = lam * relevance - (1 - lam) * max_sim
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        np.maximum(max_sim, pairwise[best], out=max_sim)
+    return selected
+
+
+def build_context(
+    chunks: Sequence[RetrievedChunk],
+    edges: Sequence[str],
+    query_vector: Optional[Sequence[float]] = None,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    kg_share: float = KG_BUDGET_SHARE,
+) -> Tuple[str, ContextReport]:
+    """Deduplicate, rerank and pack chunks and KG edges into `token_budget` tokens."""
+    report = ContextReport()
+    chunks, dup_chunks = _dedupe(list(chunks), lambda c: compact_text(c.text))
+    edges, dup_edges = _dedupe([compact_edge(e) for e in edges], lambda e: e)
+    report.duplicates_removed = dup_chunks + dup_edges
+
+    edge_lines = [f"- {e}" for e in edges]
+    edge_costs = [count_tokens(line) + 1 for line in edge_lines]
+    kg_reserved = min(sum(edge_costs), int(token_budget * kg_share))
+
+    # Documents first, in MMR order, leaving the KG reservation free.
+    doc_lines, doc_tokens = [], 0
+    doc_budget = token_budget - kg_reserved
+    for i in mmr_order(query_vector, chunks):
+        line = f"[{len(doc_lines) + 1}] {compact_text(chunks[i].text)}"
+        cost = count_tokens(line) + 1
+        if doc_tokens + cost > doc_budget:
+            room = doc_budget - doc_tokens
+            if not doc_lines and room >= MIN_TRUNCATED_TOKENS:
+                # The most relevant chunk alone overflows: keep its head rather than nothing.
+                line = truncate_to_tokens(line, room - 1)
+                cost = count_tokens(line) + 1
+            else:
+                report.chunks_dropped += 1
+                continue
+        doc_lines.append(line)
+        doc_tokens += cost
+    report.chunks_used = len(doc_lines)
+
+    # Then KG edges, which may also use whatever the documents left over.
+    kg_lines, kg_tokens = [], 0
+    kg_budget = token_budget - doc_tokens
+    for line, cost in zip(edge_lines, edge_costs):
+        if kg_tokens + cost > kg_budget:
+            report.edges_dropped += 1
+            continue
+        kg_lines.append(line)
+        kg_tokens += cost
+    report.edges_used = len(kg_lines)
+
+    sections = []
+    if doc_lines:
+        sections.append("Documents:\n" + "\n".join(doc_lines))
+    if kg_lines:
+        sections.append("Knowledge graph:\n" + "\n".join(kg_lines))
+    report.tokens_by_source = {"documents": doc_tokens, "knowledge_graph": kg_tokens}
+    return "\n\n".join(sections), report
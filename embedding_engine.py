@@ -0,0 +1,285 @@
+"""
+Concurrent, rate-limit-aware embedding engine.
+
+Texts are packed into batches by token count, a bounded number of batches are
+in flight at once, and every request first draws from an adaptive
+requests/tokens-per-minute budget that shrinks when the API answers 429 and
+recovers as requests succeed. Failed batches are retried with exponential
+backoff; anything that still fails is returned in an explicit failure report
+instead of being padded with placeholder vectors.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+from tokens import count_tokens
+
+# --- Configuration ---
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "8"))  # Concurrent API requests
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))  # Token budget per request
+EMBEDDING_MAX_BATCH_ITEMS = 2048  # OpenAI's limit on inputs per embeddings request
+EMBEDDING_MAX_INPUT_TOKENS = 8191  # OpenAI's limit on tokens per input
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_RETRIES = 6
+EMBEDDING_BASE_BACKOFF = 1.0  # Seconds; doubled on every retry, with jitter
+# ---------------------
+
+
+class RateLimitBudget:
+    """
+    Token-bucket limiter over requests and tokens per minute.
+
+    The effective rate is scaled by `rate_scale`, which is halved on every 429
+    and grows back slowly on success, so the engine settles just under the
+    account's real limit without knowing it up front.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE,
+        min_scale: float = 0.05,
+        recovery: float = 1.02,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_scale = min_scale
+        self.recovery = recovery
+        self.rate_scale = 1.0
+        self.rate_limited_count = 0
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute)
+        self._paused_until = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last
+        self._last = now
+        rpm = self.requests_per_minute * self.rate_scale
+        tpm = self.tokens_per_minute * self.rate_scale
+        self._request_allowance = min(rpm, self._request_allowance + elapsed * rpm / 60.0)
+        self._token_allowance = min(tpm, self._token_allowance + elapsed * tpm / 60.0)
+
+    def acquire(self, tokens: int):
+        """Block until one request carrying `tokens` tokens fits in the budget."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                # A single batch larger than the whole per-minute budget must still go through.
+                tokens_needed = min(tokens, self.tokens_per_minute * self.rate_scale)
+                if now >= self._paused_until and self._request_allowance >= 1 and self._token_allowance >= tokens_needed:
+                    self._request_allowance -= 1
+                    self._token_allowance -= tokens_needed
+                    return
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._request_allowance) * 60.0 / (self.requests_per_minute * self.rate_scale),
+                    (tokens_needed - self._token_allowance) * 60.0 / (self.tokens_per_minute * self.rate_scale),
+                    0.01,
+                )
+            time.sleep(min(wait, 5.0))
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """Shrink the budget and pause all callers after a 429."""
+        with self._lock:
+            self.rate_limited_count += 1
+            self.rate_scale = max(self.min_scale, self.rate_scale * 0.5)
+            self._request_allowance = min(self._request_allowance, 0.0)
+            pause = retry_after if retry_after is not None else 1.0
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def on_success(self):
+        with self._lock:
+            self.rate_scale = min(1.0, self.rate_scale * self.recovery)
+
+
+@dataclass
+class EmbeddingFailure:
+    """An input that could not be embedded, with the last error seen for it."""
+    index: int
+    error: str
+    attempts: int
+
+
+@dataclass
+class EmbeddingResult:
+    """Vectors aligned with the input texts (None where failed) plus the failure report."""
+    vectors: List[Optional[List[float]]]
+    failures: List[EmbeddingFailure] = field(default_factory=list)
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, timeouts, connection problems and 5xx responses are worth retrying."""
+    if is_rate_limit_error(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500 or status in (408, 409)
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "Timeout", "ConnectionError")
+
+
+def is_input_error(error: Exception) -> bool:
+    """
+    The request was rejected for its content (400/413/422), so a smaller batch
+    may succeed. Auth, permission and client-side errors (no status) fail
+    every batch alike.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (400, 413, 422)
+    return type(error).__name__ in ("BadRequestError", "UnprocessableEntityError")
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After header from an OpenAI error, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbeddingEngine:
+    """Embeds many texts with bounded concurrency through `request_fn(texts) -> vectors`."""
+
+    def __init__(
+        self,
+        request_fn: Callable[[List[str]], List[List[float]]],
+        max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+        batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        max_batch_items: int = EMBEDDING_MAX_BATCH_ITEMS,
+        max_input_tokens: int = EMBEDDING_MAX_INPUT_TOKENS,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        base_backoff: float = EMBEDDING_BASE_BACKOFF,
+        budget: Optional[RateLimitBudget] = None,
+    ):
+        self.request_fn = request_fn
+        self.max_in_flight = max_in_flight
+        self.batch_tokens = batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_input_tokens = max_input_tokens
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.budget = budget or RateLimitBudget()
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+    def make_batches(self, token_counts: Sequence[int]) -> List[List[int]]:
+        """Greedily pack input indices into batches bounded by tokens and item count."""
+        batches, current, current_tokens = [], [], 0
+        for i, n in enumerate(token_counts):
+            if current and (current_tokens + n > self.batch_tokens or len(current) >= self.max_batch_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run_batch(self, texts: List[str], tokens: int, result: EmbeddingResult, stats_lock: threading.Lock):
+        """Embed one batch with retries. Returns (vectors, None) or (None, (error, attempts, input_error))."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.budget.acquire(tokens)
+            try:
+                vectors = self.request_fn(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"API returned {len(vectors)} embeddings for {len(texts)} inputs")
+                self.budget.on_success()
+                with stats_lock:
+                    result.requests += 1
+                return vectors, None
+            except Exception as e:
+                with stats_lock:
+                    result.requests += 1
+                if is_rate_limit_error(e):
+                    with stats_lock:
+                        result.rate_limited += 1
+                    self.budget.on_rate_limited(retry_after_seconds(e))
+                if not is_retryable_error(e) or attempt > self.max_retries:
+                    return None, (f"{type(e).__name__}: {e}", attempt, is_input_error(e))
+                with stats_lock:
+                    result.retries += 1
+                delay = self.base_backoff * (2 ** (attempt - 1))
+                time.sleep(delay * (0.5 + random.random() / 2))
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        on_batch: Optional[Callable[[List[str], List[List[float]]], None]] = None,
+    ) -> EmbeddingResult:
+        """
+        Embed `texts` concurrently. `on_batch(texts, vectors)` is called as each
+        batch completes (e.g. to write it to the cache before the run finishes).
+        """
+        texts = list(texts)
+        result = EmbeddingResult(vectors=[None] * len(texts))
+        if not texts:
+            return result
+        stats_lock = threading.Lock()
+        token_counts = [count_tokens(t) for t in texts]
+
+        sendable = []
+        for i, n in enumerate(token_counts):
+            if n > self.max_input_tokens:
+                result.failures.append(EmbeddingFailure(i, f"input has {n} tokens (limit {self.max_input_tokens})", 0))
+            else:
+                sendable.append(i)
+
+        pending = {}
+        for batch in self.make_batches([token_counts[i] for i in sendable]):
+            indices = [sendable[j] for j in batch]
+            batch_texts = [texts[i] for i in indices]
+            tokens = sum(token_counts[i] for i in indices)
+            pending[self._pool.submit(self._run_batch, batch_texts, tokens, result, stats_lock)] = indices
+
+        while pending:
+            for future in as_completed(list(pending)):
+                indices = pending.pop(future)
+                vectors, error = future.result()
+                if vectors is not None:
+                    for i, vector in zip(indices, vectors):
+                        result.vectors[i] = vector
+                    if on_batch:
+                        on_batch([texts[i] for i in indices], vectors)
+                elif len(indices) > 1 and error[2]:
+                    # A multi-item batch rejected for its content is usually one bad input: bisect to isolate it.
+                    half = len(indices) // 2
+                    for part in (indices[:half], indices[half:]):
+                        part_texts = [texts[i] for i in part]
+                        tokens = sum(token_counts[i] for i in part)
+                        pending[self._pool.submit(self._run_batch, part_texts, tokens, result, stats_lock)] = part
+                else:
+                    message, attempts, _ = error
+                    result.failures.extend(EmbeddingFailure(i, message, attempts) for i in indices)
+        result.failures.sort(key=lambda f: f.index)
+        return result
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,102 @@
+"""
+Local entity recognition for KG lookups.
+
+Builds an Aho-Corasick automaton over the node IDs of the knowledge graph
+(OpenROAD commands, layers such as M1, stages such as CTS, ...) so the
+entities mentioned in a query are found in one pass over its characters,
+without an LLM round trip. Matching is case-insensitive, respects word
+boundaries, and prefers the longest match where candidates overlap.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+# --- Configuration ---
+MIN_TERM_LENGTH = 2  # Shorter node IDs are too ambiguous to match in free text
+NODE_IDS_QUERY = "MATCH (n) WHERE n.id IS NOT NULL RETURN DISTINCT n.id AS id"
+# ---------------------
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class EntityMatcher:
+    """Multi-pattern matcher over a fixed vocabulary of entity names."""
+
+    def __init__(self, terms: Iterable[str], min_length: int = MIN_TERM_LENGTH):
+        # Node 0 is the root. Each node: transitions, failure link, and the
+        # (length, canonical term) outputs ending there.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        self.size = 0
+        for term in terms:
+            if term is None:
+                continue
+            term = str(term)
+            key = " ".join(term.lower().split())
+            if len(key) < min_length:
+                continue
+            self._add(key, term)
+        self._build_failure_links()
+
+    def _add(self, key: str, term: str):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if not self._out[node]:
+            self.size += 1
+            self._out[node].append((len(key), term))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fallback = self._goto[f].get(ch, 0)
+                self._fail[child] = fallback if fallback != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """All word-bounded matches as (start, end, term), before overlap resolution."""
+        normalized = " ".join(text.lower().split())
+        spans = []
+        node = 0
+        for i, ch in enumerate(normalized):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, term in self._out[node]:
+                start, end = i - length + 1, i + 1
+                if start > 0 and _is_word_char(normalized[start - 1]) and _is_word_char(normalized[start]):
+                    continue
+                if end < len(normalized) and _is_word_char(normalized[end]) and _is_word_char(normalized[end - 1]):
+                    continue
+                spans.append((start, end, term))
+        return spans
+
+    def find(self, text: str) -> List[str]:
+        """Distinct entities in `text`, longest match first where they overlap, in order of appearance."""
+        chosen, covered_until = [], -1
+        for start, end, term in sorted(self.find_spans(text), key=lambda s: (s[0], -(s[1] - s[0]))):
+            if start >= covered_until:
+                chosen.append(term)
+                covered_until = end
+        return list(dict.fromkeys(chosen))
+
+
+def load_node_ids(n4j) -> List[str]:
+    """Every node ID in the Neo4j graph."""
+    return [rec["id"] for rec in n4j.query(query=NODE_IDS_QUERY)]
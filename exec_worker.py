@@ -0,0 +1,140 @@
+"""
+Long-lived execution worker used by worker_pool.ExecWorkerPool.
+
+Started once as `python exec_worker.py` or `openroad -python exec_worker.py`,
+it announces itself with a handshake line, then reads length-prefixed JSON
+jobs from stdin and runs each script in a fresh namespace. The script's
+stdout/stderr (including output written by C++ code such as OpenROAD) are
+captured at the file-descriptor level, so the protocol channel stays clean.
+"""
+
+import builtins
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import traceback
+
+HANDSHAKE = b"EXEC-WORKER-READY\n"
+
+
+def _read_exact(stream, n):
+    data = b""
+    while len(data) < n:
+        chunk = stream.read(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_message(stream):
+    header = _read_exact(stream, 4)
+    if header is None:
+        return None
+    body = _read_exact(stream, struct.unpack(">I", header)[0])
+    return None if body is None else json.loads(body.decode("utf-8"))
+
+
+def write_message(stream, message):
+    body = json.dumps(message).encode("utf-8")
+    stream.write(struct.pack(">I", len(body)) + body)
+    stream.flush()
+
+
+def read_head_tail(f, head_bytes, tail_bytes):
+    """Read a captured stream, keeping only its head and tail if it is large. Returns (text, truncated)."""
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    if not head_bytes or size <= head_bytes + tail_bytes:
+        return f.read().decode("utf-8", errors="replace"), False
+    head = f.read(head_bytes)
+    f.seek(size - tail_bytes)
+    tail = f.read()
+    dropped = size - head_bytes - tail_bytes
+    text = (head.decode("utf-8", errors="replace")
+            + f"\n... [{dropped} bytes truncated] ...\n"
+            + tail.decode("utf-8", errors="replace"))
+    return text, True
+
+
+def run_job(code, head_bytes=0, tail_bytes=0):
+    """Run `code` as __main__ in a fresh namespace; return (exit_code, stdout, stderr, truncated)."""
+    out_file = tempfile.TemporaryFile()
+    err_file = tempfile.TemporaryFile()
+    saved_out, saved_err = os.dup(1), os.dup(2)
+    cwd = os.getcwd()
+    argv = sys.argv
+    exit_code = 0
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(out_file.fileno(), 1)
+    os.dup2(err_file.fileno(), 2)
+    try:
+        sys.argv = ["<script>"]
+        namespace = {"__name__": "__main__", "__builtins__": builtins}
+        exec(compile(code, "<script>", "exec"), namespace)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_out, 1)
+        os.dup2(saved_err, 2)
+        os.close(saved_out)
+        os.close(saved_err)
+        sys.argv = argv
+        try:
+            os.chdir(cwd)
+        except OSError:
+            pass
+    outputs, truncated = [], False
+    for f in (out_file, err_file):
+        text, cut = read_head_tail(f, head_bytes, tail_bytes)
+        outputs.append(text)
+        truncated = truncated or cut
+        f.close()
+    return exit_code, outputs[0], outputs[1], truncated
+
+
+def main():
+    # Keep a private copy of the original stdout for the protocol; fd 1 is
+    # then free to be redirected per job.
+    proto_out = os.fdopen(os.dup(1), "wb")
+    proto_in = os.fdopen(os.dup(0), "rb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)  # Scripts must not consume the job stream
+    os.close(devnull)
+    proto_out.write(HANDSHAKE)
+    proto_out.flush()
+    while True:
+        job = read_message(proto_in)
+        if job is None:
+            break
+        started = time.perf_counter()
+        exit_code, stdout, stderr, truncated = run_job(
+            job["code"], job.get("head_bytes", 0), job.get("tail_bytes", 0)
+        )
+        write_message(proto_out, {
+            "id": job.get("id"),
+            "exit_code": exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+            "truncated": truncated,
+            "duration": time.perf_counter() - started,
+        })
+
+
+if __name__ == "__main__":
+    main()
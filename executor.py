@@ -1,16 +1,25 @@
+import concurrent.futures
+import contextlib
+import json
 import re
 import shutil
-import subprocess
 import sys
 import tempfile
+import threading
+import time
 import os
 
-from camel.messages import BaseMessage
-from pipeline import answer_vlsi_query, camel_agent
+from pipeline import answer_vlsi_query, ask_agent, get_resources, semantic_cache_lookup
+import tracing
+import worker_pool
+from bounded_exec import ExecLimits, ExecutionResult, run_bounded
+from streaming import FenceWatcher
 
 # shared namespace for exec‐fallback (if needed)
 shared_globals = {}
 
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))  # Questions answered concurrently in --batch mode
+
 
 def extract_python_code(message: str) -> str:
     """
@@ -20,88 +29,402 @@ def extract_python_code(message: str) -> str:
     return m.group(1).strip() if m else None
 
 
-def execute_code(
+@tracing.traced("execution")
+def run_code(
     code: str,
-    context: dict = None,
-    use_openroad: bool = True
-) -> str:
+    use_openroad: bool = True,
+    use_pool: bool = None,
+    limits: ExecLimits = None,
+    on_output=None,
+    cancel_event=None
+) -> ExecutionResult:
     """
     If `import openroad` is found and openroad is on PATH → run
         openroad -python <tempfile>
     else → run via sys.executable.
-    Returns combined stdout+stderr plus debug info.
+    The script runs under wall-clock, CPU and memory limits, its output is
+    streamed to `on_output(stream, text)` as it is produced, and only the
+    head and tail of each stream are kept. With a warm worker pool
+    (EXEC_POOL_WORKERS > 0 or use_pool=True) the script is sent to an
+    already-running worker of the same kind instead, unless `limits` differ
+    from the workers' defaults or a `cancel_event` is given: those runs get a
+    fresh process, which setting `cancel_event` kills.
     """
+    limits = limits or ExecLimits()
+    result = _run_code(code, use_openroad, use_pool, limits, on_output, cancel_event)
+    tracing.current_span().set(exit_code=result.exit_code, script_seconds=round(result.duration, 3),
+                               peak_rss_kb=result.peak_rss_kb, timed_out=result.timed_out,
+                               truncated=result.truncated)
+    return result
+
+
+def _run_code(code, use_openroad, use_pool, limits, on_output, cancel_event) -> ExecutionResult:
+    wants_openroad = use_openroad and "import openroad" in code and shutil.which("openroad")
+    if use_pool is None:
+        use_pool = worker_pool.EXEC_POOL_WORKERS > 0
+    # Workers were started with the default rlimits and cannot be interrupted mid-script.
+    use_pool = use_pool and cancel_event is None and worker_pool.honours(limits)
+    tracing.current_span().set(pooled=use_pool)
+    if use_pool:
+        pool = worker_pool.get_exec_pool("openroad" if wants_openroad else "python")
+        result = pool.run(code, timeout=limits.wall_timeout or None)
+        if on_output:
+            # Workers return output when the script finishes.
+            for stream in ("stdout", "stderr"):
+                if result[stream]:
+                    on_output(stream, result[stream])
+        return ExecutionResult(
+            command=[pool.command, "(warm worker)"],
+            exit_code=result["exit_code"],
+            duration=result["duration"],
+            stdout=result["stdout"],
+            stderr=result["stderr"],
+            truncated=result.get("truncated", False),
+            timed_out=result.get("timed_out", False),
+        )
+
     # dump to temp file
     with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
         f.write(code)
         path = f.name
 
     # pick runner
-    if use_openroad and "import openroad" in code and shutil.which("openroad"):
+    if wants_openroad:
         runner = ["openroad", "-python", path]
     else:
         runner = [sys.executable, path]
 
-    proc = subprocess.run(runner, capture_output=True, text=True)
     try:
-        os.remove(path)
-    except OSError:
-        pass
-
-    # debug string
-    parts = [
-        f"Command: {' '.join(runner)}",
-        f"Exit code: {proc.returncode}",
-        "----- STDOUT -----",
-        proc.stdout or "<empty>",
-        "----- STDERR -----",
-        proc.stderr or "<empty>",
-    ]
-    return "\n".join(parts)
+        return run_bounded(runner, limits=limits, on_output=on_output, cancel_event=cancel_event)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
-def run_query_and_execute(
+def execute_code(
+    code: str,
+    context: dict = None,
+    use_openroad: bool = True,
+    use_pool: bool = None
+) -> str:
+    """
+    Run `code` (see run_code) and return the debug text: command, exit code,
+    duration / peak RSS, then the (possibly truncated) stdout and stderr.
+    """
+    return run_code(code, use_openroad=use_openroad, use_pool=use_pool).format()
+
+
+def run_in_background(fn, *args, **kwargs) -> concurrent.futures.Future:
+    """Start fn(*args, **kwargs) on its own thread; returns a Future for its result."""
+    future = concurrent.futures.Future()
+
+    def target():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+def print_token(token: str):
+    """on_token callback that echoes a streamed reply live."""
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+def stream_to_console(stream: str, text: str):
+    """on_output callback that echoes a running script's output live."""
+    target = sys.stderr if stream == "stderr" else sys.stdout
+    target.write(text)
+    target.flush()
+
+
+@tracing.traced("execute", root=True)
+def answer_and_execute(
     user_query: str,
     top_k: int = 7,
-    similarity_threshold: float = 0.2
-) -> str:
+    similarity_threshold: float = 0.2,
+    use_cache: bool = True,
+    exec_limits: ExecLimits = None,
+    agent=None,
+    verbose: bool = True,
+    session_id: str = None,
+    on_token=None,
+    candidates: int = 1
+) -> dict:
     """
+    0) Returns the cached reply (and execution log) of a near-identical question
     1) Calls answer_vlsi_query() → may emit a ```python``` block
     2) Extracts the code, prints it
-    3) Runs it under openroad (or fallback), prints debug
+    3) Runs it under openroad (or fallback) within exec_limits, streaming its output
     4) Feeds the log back to the LLM as a follow‐up
-    5) Returns the LLM's final reply
+    5) Returns a dict with the final reply ("answer"), the extracted "code",
+       the ExecutionResult ("execution") and whether it was served from "cache"
+       (a cache hit carries the stored execution log as "cached_output")
+
+    The conversation runs on `agent` if given, otherwise on the pooled agent
+    of `session_id` (a one-off conversation when that is None), so concurrent
+    questions never share history; conversations bypass the semantic cache.
+    verbose=False suppresses the debug prints and live output.
+
+    With `on_token`, both LLM replies are streamed to it as they are generated
+    and the script starts running as soon as its closing fence arrives, while
+    the model is still writing; "timings" then records time to first token,
+    to execution start and in total.
+
+    With candidates > 1, that many scripts are generated and run in parallel
+    and the first clean exit wins (see speculative.py); sessions and
+    streaming do not apply to that mode.
+    """
+    from camel.messages import BaseMessage
+
+    if candidates > 1:
+        from speculative import speculative_execute
+        return speculative_execute(
+            user_query,
+            candidates=candidates,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            use_cache=use_cache,
+            exec_limits=exec_limits,
+            verbose=verbose
+        )
+
+    record = {"answer": None, "code": None, "execution": None, "cached": False}
+    namespace = f"execute:{top_k}:{similarity_threshold}"
+    query_vector = None
+    use_cache = use_cache and session_id is None  # Conversations carry their own state (see answer_vlsi_query)
+    if use_cache:
+        hit, query_vector = semantic_cache_lookup(user_query, namespace)
+        if hit is not None:
+            if verbose and hit.execution is not None:
+                print("=== Cached execution output ===\n", hit.execution, "\n=== End output ===\n")
+            tracing.current_span().set(cached=True)
+            if on_token is not None:
+                on_token(hit.answer)
+            record.update(answer=hit.answer, cached=True, cached_output=hit.execution)
+            return record
+    cache = get_resources().semantic_cache if query_vector is not None else None
+    scope = get_resources().sessions.acquire(session_id) if agent is None else contextlib.nullcontext(agent)
+    with scope as agent:
+        started = time.perf_counter()
+        timings = {}
+        early = {}
+        first_reply_sink = None
+        if on_token is not None:
+            record["timings"] = timings
+
+            def start_early(code):
+                # Closing fence seen: run the script while the model finishes its reply.
+                timings["execution_started"] = time.perf_counter() - started
+                early["code"] = code
+                early["future"] = run_in_background(run_code, code, use_openroad=True, limits=exec_limits)
+
+            watcher = FenceWatcher(start_early)
+
+            def forward_and_watch(token):
+                timings.setdefault("first_token", time.perf_counter() - started)
+                on_token(token)
+                watcher.feed(token)
+
+            first_reply_sink = forward_and_watch
+
+        # 1) get initial LLM reply (uncached: the follow-up below continues this conversation)
+        first = answer_vlsi_query(
+            query=user_query,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            use_cache=False,
+            agent=agent,
+            on_token=first_reply_sink
+        )
+
+        # 2) extract code
+        code = early["code"] if early else extract_python_code(first)
+        if not code:
+            if cache is not None:
+                cache.store(user_query, query_vector, namespace, first)
+            record["answer"] = first
+            timings["total"] = time.perf_counter() - started
+            return record
+        record["code"] = code
+
+        # 3) execute, streaming output as it is produced
+        if verbose:
+            # DEBUG print
+            print("\n=== Extracted Python code ===\n", code, "\n=== End code ===\n")
+            print("=== Execution output ===")
+        if early:
+            result = early["future"].result()
+            if verbose:
+                stream_to_console("stdout", result.stdout)
+                stream_to_console("stderr", result.stderr)
+        else:
+            timings["execution_started"] = time.perf_counter() - started
+            result = run_code(code, use_openroad=True, limits=exec_limits,
+                              on_output=stream_to_console if verbose and on_token is None else None)
+        record["execution"] = result
+        out = result.format()
+
+        if verbose:
+            # DEBUG print
+            print(f"\n=== End output (exit {result.exit_code}, {result.duration:.2f}s"
+                  f"{', truncated' if result.truncated else ''}{', timed out' if result.timed_out else ''}) ===\n")
+
+        # 4) send back to LLM
+        followup = BaseMessage.make_user_message(
+            role_name="Executor",
+            content=f"I ran your Python block under `openroad -python` and got:\n```\n{out}\n```"
+        )
+        if on_token is not None:
+            on_token("\n\n")
+        final = ask_agent(agent, followup, on_token)
+
+        # 5) return final LLM reply
+        if cache is not None:
+            cache.store(user_query, query_vector, namespace, final, execution=out)
+        record["answer"] = final
+        timings["total"] = time.perf_counter() - started
+        if verbose and on_token is not None:
+            print(f"\nFirst token {timings.get('first_token', 0):.2f}s, execution started "
+                  f"{timings['execution_started']:.2f}s, total {timings['total']:.2f}s")
+        return record
+
+
+def run_query_and_execute(
+    user_query: str,
+    top_k: int = 7,
+    similarity_threshold: float = 0.2,
+    use_cache: bool = True,
+    exec_limits: ExecLimits = None,
+    session_id: str = None,
+    stream: bool = False,
+    candidates: int = 1
+) -> str:
     """
-    # 1) get initial LLM reply
-    first = answer_vlsi_query(
-        query=user_query,
+    answer_and_execute(), returning only the LLM's final reply. With
+    stream=True the replies are printed token by token as they arrive.
+    """
+    return answer_and_execute(
+        user_query,
         top_k=top_k,
-        similarity_threshold=similarity_threshold
-    )
+        similarity_threshold=similarity_threshold,
+        use_cache=use_cache,
+        exec_limits=exec_limits,
+        session_id=session_id,
+        on_token=print_token if stream else None,
+        candidates=candidates
+    )["answer"]
 
-    # 2) extract code
-    code = extract_python_code(first)
-    if not code:
-        return first
 
-    # DEBUG print
-    print("=== Extracted Python code ===\n", code, "\n=== End code ===\n")
+def execution_summary(result: ExecutionResult) -> dict:
+    """JSON-friendly outcome of a script run (without its output)."""
+    return {
+        "exit_code": result.exit_code,
+        "duration": round(result.duration, 3),
+        "peak_rss_kb": result.peak_rss_kb,
+        "timed_out": result.timed_out,
+        "truncated": result.truncated,
+    }
 
-    # 3) execute
-    out = execute_code(code, shared_globals, use_openroad=True)
 
-    # DEBUG print
-    print("=== Execution output ===\n", out, "\n=== End output ===\n")
+def read_questions(path: str):
+    """
+    Yield (id, question) from a JSONL file. Each line is either a JSON string
+    or an object with "question" (or "query") and an optional "id"; the line
+    number is used when there is no id.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                yield line_no, item
+            else:
+                yield item.get("id", line_no), item.get("question") or item.get("query")
 
-    # 4) send back to LLM
-    followup = BaseMessage.make_user_message(
-        role_name="Executor",
-        content=f"I ran your Python block under `openroad -python` and got:\n```\n{out}\n```"
-    )
-    resp = camel_agent.step(followup)
 
-    # 5) return final LLM reply
-    return "\n".join(m.content for m in resp.msgs)
+def run_batch(
+    in_path: str,
+    out_path: str,
+    workers: int = BATCH_WORKERS,
+    top_k: int = 7,
+    similarity_threshold: float = 0.2,
+    use_cache: bool = True,
+    exec_limits: ExecLimits = None
+) -> dict:
+    """
+    Answer every question in `in_path` with up to `workers` running at once,
+    each in its own one-off conversation. Result lines are appended to `out_path` as they
+    complete (so their order follows completion, not input); returns the
+    throughput / latency summary, which is also printed.
+    """
+    questions = list(read_questions(in_path))
+    latencies, failures, cached, exec_failures = [], 0, 0, 0
+
+    def answer_one(qid, question):
+        started = time.perf_counter()
+        row = {"id": qid, "question": question}
+        try:
+            record = answer_and_execute(
+                question,
+                top_k=top_k,
+                similarity_threshold=similarity_threshold,
+                use_cache=use_cache,
+                exec_limits=exec_limits,
+                verbose=False
+            )
+            row.update(answer=record["answer"], cached=record["cached"], code=record["code"])
+            if record["execution"] is not None:
+                row["execution"] = execution_summary(record["execution"])
+            elif record.get("cached_output") is not None:
+                row["execution"] = {"cached_output": record["cached_output"]}
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        row["latency"] = round(time.perf_counter() - started, 3)
+        return row
+
+    started = time.perf_counter()
+    with open(out_path, "w", encoding="utf-8") as out, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(answer_one, qid, question) for qid, question in questions]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            row = future.result()
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            latencies.append(row["latency"])
+            failures += "error" in row
+            cached += bool(row.get("cached"))
+            exec_failures += row.get("execution", {}).get("exit_code", 0) != 0
+            status = "error" if "error" in row else f"{row['latency']:.2f}s"
+            print(f"[{done}/{len(questions)}] {row['id']}: {status}")
+    elapsed = time.perf_counter() - started
+
+    summary = {
+        "questions": len(questions),
+        "failed": failures,
+        "cached": cached,
+        "execution_failures": exec_failures,
+        "wall_seconds": round(elapsed, 3),
+        "questions_per_second": round(len(questions) / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+    if latencies:
+        for q in (50, 95, 99):
+            summary[f"p{q}_latency"] = round(tracing.percentile(latencies, q), 3)
+    print(f"Batch: {summary['questions']} questions in {summary['wall_seconds']:.1f}s "
+          f"({summary['questions_per_second']:.2f}/s, {workers} workers); "
+          f"{failures} failed, {cached} cached, {exec_failures} non-zero exits")
+    if latencies:
+        print(f"Latency p50 {summary['p50_latency']:.2f}s, p95 {summary['p95_latency']:.2f}s, "
+              f"p99 {summary['p99_latency']:.2f}s")
+    return summary
 
 
 if __name__ == "__main__":
@@ -109,14 +432,54 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Run a VLSI/OpenROAD query end-to-end (LLM → OpenROAD → LLM)"
     )
-    parser.add_argument("query", help="Your VLSI or OpenROAD question")
+    parser.add_argument("query", nargs="?", help="Your VLSI or OpenROAD question")
+    parser.add_argument("--batch", help="JSONL of questions to answer instead of a single query")
+    parser.add_argument("--out", default="batch_results.jsonl", help="Output JSONL for --batch")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="Questions answered concurrently in --batch mode")
     parser.add_argument("--top_k", type=int, default=7)
     parser.add_argument("--sim_thresh", type=float, default=0.2)
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the semantic answer cache")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="Generate and run this many scripts in parallel; the first clean exit wins")
+    parser.add_argument("--stream", action="store_true",
+                        help="Print LLM replies as they are generated and run the script as soon as it is complete")
+    parser.add_argument("--exec_workers", type=int, default=worker_pool.EXEC_POOL_WORKERS,
+                        help="Warm execution workers to keep (0 = fresh process per script)")
+    parser.add_argument("--timeout", type=float, default=ExecLimits.wall_timeout,
+                        help="Wall-clock limit for the generated script in seconds (0 = none)")
+    parser.add_argument("--cpu_limit", type=int, default=ExecLimits.cpu_seconds,
+                        help="CPU-time limit for the generated script in seconds (0 = none)")
+    parser.add_argument("--mem_limit_mb", type=int, default=ExecLimits.memory_mb,
+                        help="Address-space limit for the generated script in MB (0 = none)")
+    parser.add_argument("--trace_log", help="Write per-stage trace spans as JSONL to this file ('-' for stderr)")
     args = parser.parse_args()
+    if not args.query and not args.batch:
+        parser.error("give a query or --batch <questions.jsonl>")
+    worker_pool.EXEC_POOL_WORKERS = args.exec_workers
+    if args.trace_log:
+        tracing.enable(args.trace_log)
+    limits = ExecLimits(wall_timeout=args.timeout, cpu_seconds=args.cpu_limit, memory_mb=args.mem_limit_mb)
 
-    result = run_query_and_execute(
-        user_query=args.query,
-        top_k=args.top_k,
-        similarity_threshold=args.sim_thresh
-    )
-    print(result) 
\ No newline at end of file
+    if args.batch:
+        run_batch(
+            args.batch,
+            args.out,
+            workers=args.workers,
+            top_k=args.top_k,
+            similarity_threshold=args.sim_thresh,
+            use_cache=not args.no_cache,
+            exec_limits=limits
+        )
+    else:
+        result = run_query_and_execute(
+            user_query=args.query,
+            top_k=args.top_k,
+            similarity_threshold=args.sim_thresh,
+            use_cache=not args.no_cache,
+            exec_limits=limits,
+            stream=args.stream,
+            candidates=args.candidates
+        )
+        if not args.stream:
+            print(result) 
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""
+Compact in-process snapshot of the knowledge graph.
+
+Node IDs and relationship types are interned to integers and the edges are
+stored twice in CSR form (outgoing and incoming adjacency as offset/target/rel
+arrays), so 1..k-hop neighbourhoods are expanded without any network round
+trip. Snapshots are saved to a single .npz file, which lets the pipeline run
+with no Neo4j connection at all, and a GraphSnapshotStore can rebuild the
+snapshot in the background and swap it in atomically.
+
+    python graph_snapshot.py --out kg_snapshot.npz   # dump Neo4j to a snapshot
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- Configuration ---
+GRAPH_SNAPSHOT_PATH = os.getenv("KG_SNAPSHOT_PATH", "kg_snapshot.npz")
+EDGES_QUERY = (
+    "MATCH (n)-[r]->(m) WHERE n.id IS NOT NULL AND m.id IS NOT NULL "
+    "RETURN n.id AS src, type(r) AS rel, m.id AS dst"
+)
+# ---------------------
+
+
+def describe_edge(src: str, rel: str, dst: str) -> str:
+    """Same edge text the Cypher neighbourhood query produces."""
+    return f"Node {src} --{rel}--> {dst}"
+
+
+class GraphSnapshot:
+    """Immutable CSR adjacency over interned node and relationship IDs."""
+
+    def __init__(
+        self,
+        node_names: List[str],
+        rel_names: List[str],
+        out_offsets: np.ndarray,
+        out_targets: np.ndarray,
+        out_rels: np.ndarray,
+        in_offsets: np.ndarray,
+        in_sources: np.ndarray,
+        in_rels: np.ndarray,
+        created: float,
+    ):
+        self.node_names = node_names
+        self.rel_names = rel_names
+        self.node_index: Dict[str, int] = {name: i for i, name in enumerate(node_names)}
+        self.out_offsets, self.out_targets, self.out_rels = out_offsets, out_targets, out_rels
+        self.in_offsets, self.in_sources, self.in_rels = in_offsets, in_sources, in_rels
+        self.created = created
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_names)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.out_targets)
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Tuple[str, str, str]], node_ids: Iterable[str] = ()) -> "GraphSnapshot":
+        """Build a snapshot from (src, rel, dst) triples plus any isolated node IDs."""
+        raw_src, raw_rel, raw_dst = [], [], []
+        for src, rel, dst in edges:
+            raw_src.append(str(src))
+            raw_rel.append(str(rel))
+            raw_dst.append(str(dst))
+        # Interning in sorted order makes integer order match name order, so the
+        # per-node edge lists come out sorted by (relationship, neighbour).
+        node_names = sorted(set(raw_src) | set(raw_dst) | {str(n) for n in node_ids if n is not None})
+        rel_names = sorted(set(raw_rel))
+        node_index = {name: i for i, name in enumerate(node_names)}
+        rel_index = {name: i for i, name in enumerate(rel_names)}
+        src = np.fromiter((node_index[n] for n in raw_src), dtype=np.int32, count=len(raw_src))
+        dst = np.fromiter((node_index[n] for n in raw_dst), dtype=np.int32, count=len(raw_dst))
+        rel = np.fromiter((rel_index[r] for r in raw_rel), dtype=np.int32, count=len(raw_rel))
+        del raw_src, raw_rel, raw_dst
+
+        if len(src):
+            # Drop duplicate edges before building adjacency.
+            key = np.unique(np.stack([src, rel, dst], axis=1), axis=0)
+            src, rel, dst = key[:, 0].copy(), key[:, 1].copy(), key[:, 2].copy()
+
+        def csr(owner, other):
+            order = np.lexsort((other, rel, owner))
+            offsets = np.zeros(len(node_names) + 1, dtype=np.int64)
+            np.add.at(offsets, owner + 1, 1)
+            return np.cumsum(offsets), other[order].astype(np.int32), rel[order].astype(np.int32)
+
+        out_offsets, out_targets, out_rels = csr(src, dst)
+        in_offsets, in_sources, in_rels = csr(dst, src)
+        return cls(node_names, rel_names, out_offsets, out_targets, out_rels,
+                   in_offsets, in_sources, in_rels, created=time.time())
+
+    @classmethod
+    def from_neo4j(cls, n4j) -> "GraphSnapshot":
+        """Snapshot the whole Neo4j graph (node IDs and typed edges)."""
+        from entity_matcher import load_node_ids
+        records = n4j.query(query=EDGES_QUERY)
+        return cls.from_edges(((r["src"], r["rel"], r["dst"]) for r in records), load_node_ids(n4j))
+
+    def save(self, path: str = GRAPH_SNAPSHOT_PATH):
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            node_names=np.array(json.dumps(self.node_names)),
+            rel_names=np.array(json.dumps(self.rel_names)),
+            out_offsets=self.out_offsets, out_targets=self.out_targets, out_rels=self.out_rels,
+            in_offsets=self.in_offsets, in_sources=self.in_sources, in_rels=self.in_rels,
+            created=np.array(self.created),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = GRAPH_SNAPSHOT_PATH) -> "GraphSnapshot":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                json.loads(str(data["node_names"])),
+                json.loads(str(data["rel_names"])),
+                data["out_offsets"], data["out_targets"], data["out_rels"],
+                data["in_offsets"], data["in_sources"], data["in_rels"],
+                created=float(data["created"]),
+            )
+
+    def _edges_of(self, node: int, limit: int) -> List[Tuple[int, int, int]]:
+        """Up to `limit` (src, rel, dst) edges touching `node`, ordered by (rel, neighbour)."""
+        out_start, out_end = self.out_offsets[node], self.out_offsets[node + 1]
+        in_start, in_end = self.in_offsets[node], self.in_offsets[node + 1]
+        # Each side is already sorted, so the overall first `limit` lie within the first `limit` of each.
+        out_edges = [(int(r), int(t), node, int(t))
+                     for t, r in zip(self.out_targets[out_start:min(out_end, out_start + limit)],
+                                     self.out_rels[out_start:min(out_end, out_start + limit)])]
+        in_edges = [(int(r), int(s), int(s), node)
+                    for s, r in zip(self.in_sources[in_start:min(in_end, in_start + limit)],
+                                    self.in_rels[in_start:min(in_end, in_start + limit)])]
+        merged = sorted(out_edges + in_edges)[:limit]
+        return [(src, rel, dst) for rel, _, src, dst in merged]
+
+    def expand(self, node_ids: Sequence[str], hops: int = 1, limit_per_node: int = 25) -> List[str]:
+        """
+        Edge descriptions within `hops` of `node_ids` (both directions), capped
+        at `limit_per_node` edges per visited node and deduplicated.
+        """
+        frontier = [self.node_index[n] for n in dict.fromkeys(node_ids) if n in self.node_index]
+        visited = set(frontier)
+        seen_edges = set()
+        descs = []
+        for _ in range(max(1, hops)):
+            next_frontier = []
+            for node in frontier:
+                for src, rel, dst in self._edges_of(node, limit_per_node):
+                    if (src, rel, dst) not in seen_edges:
+                        seen_edges.add((src, rel, dst))
+                        descs.append(describe_edge(self.node_names[src], self.rel_names[rel], self.node_names[dst]))
+                    other = dst if src == node else src
+                    if other not in visited:
+                        visited.add(other)
+                        next_frontier.append(other)
+            frontier = next_frontier
+            if not frontier:
+                break
+        return descs
+
+
+class GraphSnapshotStore:
+    """
+    Holds the current snapshot and swaps in fresh ones built by `loader`,
+    either on demand (`refresh()`) or periodically from a background thread.
+    """
+
+    def __init__(self, loader: Optional[Callable[[], GraphSnapshot]] = None, path: Optional[str] = GRAPH_SNAPSHOT_PATH):
+        self.loader = loader
+        self.path = path
+        self._snapshot: Optional[GraphSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[GraphSnapshot], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> GraphSnapshot:
+        """Current snapshot: loaded from disk if present, otherwise built with `loader`."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._refresh_lock:
+                if self._snapshot is None:
+                    if self.path and os.path.exists(self.path):
+                        self._snapshot = GraphSnapshot.load(self.path)
+                        print(f"Loaded KG snapshot '{self.path}' ({self._snapshot.num_nodes} nodes, "
+                              f"{self._snapshot.num_edges} edges)")
+                    else:
+                        self._build()
+                snapshot = self._snapshot
+        return snapshot
+
+    def _build(self):
+        if self.loader is None:
+            raise RuntimeError(f"No KG snapshot at '{self.path}' and no loader to build one")
+        started = time.perf_counter()
+        snapshot = self.loader()
+        if self.path:
+            snapshot.save(self.path)
+        self._snapshot = snapshot
+        print(f"Built KG snapshot ({snapshot.num_nodes} nodes, {snapshot.num_edges} edges) "
+              f"in {time.perf_counter() - started:.2f}s")
+        for listener in self._listeners:
+            listener(snapshot)
+
+    def refresh(self) -> GraphSnapshot:
+        """Rebuild the snapshot now; readers keep using the old one until the swap."""
+        with self._refresh_lock:
+            self._build()
+            return self._snapshot
+
+    def on_refresh(self, listener: Callable[[GraphSnapshot], None]):
+        self._listeners.append(listener)
+
+    def start_background_refresh(self, interval: float):
+        """Refresh every `interval` seconds in a daemon thread; failures keep the old snapshot."""
+        if self._thread is not None or interval <= 0:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Warning: KG snapshot refresh failed ({type(e).__name__}: {e}); keeping the old one")
+
+        self._thread = threading.Thread(target=loop, name="kg-snapshot-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Snapshot the Neo4j knowledge graph into a local CSR file.")
+    parser.add_argument("--out", default=GRAPH_SNAPSHOT_PATH, help="Output .npz path")
+    args = parser.parse_args()
+
+    from pipeline import get_resources
+    store = GraphSnapshotStore(lambda: GraphSnapshot.from_neo4j(get_resources().n4j), path=args.out)
+    store.refresh()
@@ -0,0 +1,282 @@
+"""
+Ingest a directory of markdown documentation (e.g. the ORFS docs tree or
+flow_tutorial.md) into the Qdrant collection.
+
+Files are hashed, parsed and chunked by a process pool (markdown_chunks.py:
+heading-aware, code blocks kept intact, section path on every chunk), and the
+chunks stream straight into the same diff -> embed -> upsert stages as
+add_json_to_qdrant_openai.py while later files are still being parsed. Each
+file is a manifest source of its own:
+
+    - a file whose content hash matches the last committed run is skipped,
+    - a changed file re-embeds only its new chunks and drops its stale ones,
+    - a file that disappeared has its points deleted.
+
+    python ingest_docs.py --docs_dir OpenROAD-flow-scripts/docs
+    python ingest_docs.py --docs_dir . --workers 8 --full
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from add_json_to_qdrant_openai import (
+    COLLECTION_NAME, EMBED_STAGE_WORKERS, QDRANT_BATCH_SIZE, QDRANT_PATH, QDRANT_TEXT_PAYLOAD_KEY,
+    batch_get_embeddings, delete_stale_points, ensure_collection, request_openai_embeddings,
+)
+from embedding_cache import get_embedding_cache
+from embedding_engine import EmbeddingEngine
+from ingest_manifest import IngestManifest, content_digest, point_id_for_digest
+from ingest_pipeline import Stage, chunked, format_stage_stats, run_pipeline
+from lexical_index import LEXICAL_INDEX_PATH, build_from_collection
+from markdown_chunks import CHUNK_MAX_TOKENS, DocChunk, chunk_markdown
+
+# --- Configuration ---
+DOCS_DIR = os.getenv("DOCS_DIR", "docs")
+DOC_EXTENSIONS = (".md", ".markdown")
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", str(os.cpu_count() or 1)))
+DOC_CHUNK_BATCH = 64  # Chunks handed from the partition stage to diffing/embedding at once
+SECTION_PAYLOAD_KEY = "section"
+SOURCE_PAYLOAD_KEY = "source"
+# ---------------------
+
+
+def list_docs(docs_dir: str) -> List[str]:
+    """Absolute paths of the markdown files under `docs_dir` (hidden directories skipped), sorted."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(docs_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        paths.extend(os.path.abspath(os.path.join(dirpath, f)) for f in sorted(filenames)
+                     if f.lower().endswith(DOC_EXTENSIONS))
+    return paths
+
+
+def partition_file(task: Tuple[str, Optional[str], int]):
+    """
+    Process-pool worker: (path, committed digest, max tokens) ->
+    (path, digest, chunks or None when unchanged, error or None).
+    """
+    path, known, max_tokens = task
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == known:
+            return path, digest, None, None
+        return path, digest, chunk_markdown(data.decode("utf-8", errors="replace"), max_tokens), None
+    except Exception as e:
+        return path, None, None, f"{type(e).__name__}: {e}"
+
+
+def ingest_docs(
+    docs_dir: str = DOCS_DIR,
+    workers: int = PARTITION_WORKERS,
+    chunk_size: int = DOC_CHUNK_BATCH,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    full: bool = False,
+    delete_stale: bool = True,
+    build_lexical: bool = True,
+):
+    """
+    Chunk, embed and upsert every markdown file under `docs_dir`, skipping
+    files unchanged since their last complete ingestion (`full=True` redoes
+    everything). A file is recorded as committed only when all of its chunks
+    were upserted, so a failed or interrupted run resumes where it stopped.
+    """
+    if not os.path.isdir(docs_dir):
+        print(f"Error: docs directory '{docs_dir}' not found. Aborting.")
+        return
+    root = os.path.abspath(docs_dir)
+    paths = list_docs(root)
+    print(f"Starting ingestion of {len(paths)} markdown files under '{root}' to Qdrant collection '{COLLECTION_NAME}'")
+
+    try:
+        client = QdrantClient(path=QDRANT_PATH)
+        print(f"Connected to Qdrant at '{QDRANT_PATH}'")
+    except Exception as e:
+        print(f"Error connecting to Qdrant: {e}")
+        return
+    try:
+        if not ensure_collection(client):
+            return
+    except Exception as e:
+        print(f"Error checking/creating collection: {e}")
+        return
+
+    manifest = IngestManifest()
+    recorded = manifest.file_digests(COLLECTION_NAME, root)
+    known = {} if full else recorded
+    run_id = manifest.start_run(COLLECTION_NAME, root)
+
+    engine = EmbeddingEngine(request_openai_embeddings)
+    failures = []
+    api_stats = {"requests": 0, "retries": 0, "rate_limited": 0}
+    lock = threading.Lock()
+    counts = Counter()
+    files: Dict[str, Tuple[str, int]] = {}  # source -> (file digest, chunk count), for changed files
+    diffed, expected, committed = Counter(), Counter(), Counter()
+    partition_errors = []
+
+    def read_chunks(results):
+        for path, digest, chunks, error in results:
+            if error is not None:
+                partition_errors.append((path, error))
+                continue
+            if chunks is None:
+                counts["files_unchanged"] += 1
+                continue
+            files[path] = (digest, len(chunks))
+            for chunk in chunks:
+                yield path, chunk
+
+    def diff_chunk(records: List[Tuple[str, DocChunk]]):
+        by_source: Dict[str, List[Tuple[DocChunk, str]]] = {}
+        for source, chunk in records:
+            by_source.setdefault(source, []).append((chunk, content_digest(chunk.text)))
+        fresh = []
+        for source, items in by_source.items():
+            seen = manifest.mark_seen(COLLECTION_NAME, source, [d for _, d in items], run_id)
+            new = {}
+            for chunk, digest in items:
+                if digest in new or (seen[digest] and not full):
+                    continue
+                new[digest] = (source, chunk, digest)
+            with lock:
+                diffed[source] += len(items)
+                expected[source] += len(new)
+                counts["chunks_unchanged"] += len(items) - len(new)
+            fresh.extend(new.values())
+        return fresh or None
+
+    def embed_chunk(records):
+        result = batch_get_embeddings([chunk.text for _, chunk, _ in records], engine)
+        with lock:
+            for key in api_stats:
+                api_stats[key] += getattr(result, key)
+            for failure in result.failures:
+                source, chunk, _ = records[failure.index]
+                failures.append((source, chunk, failure))
+        return [(record, vector) for record, vector in zip(records, result.vectors) if vector is not None] or None
+
+    def upsert_chunk(embedded):
+        for start in range(0, len(embedded), QDRANT_BATCH_SIZE):
+            batch = embedded[start:start + QDRANT_BATCH_SIZE]
+            client.upsert(
+                collection_name=COLLECTION_NAME,
+                points=[
+                    models.PointStruct(
+                        id=point_id_for_digest(digest),
+                        vector=vector,
+                        payload={
+                            QDRANT_TEXT_PAYLOAD_KEY: chunk.text,
+                            SOURCE_PAYLOAD_KEY: os.path.relpath(source, root),
+                            SECTION_PAYLOAD_KEY: chunk.section_path,
+                        },
+                    )
+                    for (source, chunk, digest), vector in batch
+                ],
+            )
+            by_source: Dict[str, list] = {}
+            for (source, chunk, digest), _ in batch:
+                by_source.setdefault(source, []).append((digest, f"{chunk.start_line}-{chunk.end_line}"))
+            for source, entries in by_source.items():
+                manifest.commit(COLLECTION_NAME, source, entries, run_id)
+                with lock:
+                    committed[source] += len(entries)
+            with lock:
+                counts["chunks_upserted"] += len(batch)
+
+    tasks = [(path, known.get(path), max_tokens) for path in paths]
+    # Files are parsed in worker processes; their chunks are embedded while later files are still being parsed.
+    with multiprocessing.Pool(max(1, workers)) as pool:
+        stats = run_pipeline(
+            chunked(read_chunks(pool.imap_unordered(partition_file, tasks)), chunk_size),
+            [
+                Stage("diff", diff_chunk),
+                Stage("embed", embed_chunk, workers=EMBED_STAGE_WORKERS),
+                Stage("upsert", upsert_chunk),
+            ],
+            source_name="parse",
+        )
+    engine.shutdown()
+
+    # A changed file counts as committed only if every chunk was diffed and every new chunk upserted.
+    stage_errors = any(s.errors for s in stats)
+    complete = [source for source, (_, n) in files.items()
+                if diffed[source] == n and committed[source] == expected[source]]
+    deleted = 0
+    for source in complete:
+        try:
+            if delete_stale:
+                deleted += delete_stale_points(client, manifest, source, run_id)
+            manifest.record_file(COLLECTION_NAME, source, root, files[source][0])
+        except Exception as e:
+            print(f"Error finalizing '{source}': {e}")
+    present = set(paths)
+    removed = [source for source in recorded if source not in present]
+    if delete_stale:
+        for source in removed:
+            try:
+                deleted += delete_stale_points(client, manifest, source, run_id)
+                manifest.forget_file(COLLECTION_NAME, source)
+            except Exception as e:
+                print(f"Error removing points of deleted file '{source}': {e}")
+    clean = not stage_errors and not failures and not partition_errors and len(complete) == len(files)
+    manifest.finish_run(run_id, "complete" if clean else "partial")
+
+    print(f"Ingestion complete. {len(paths)} files: {counts['files_unchanged']} unchanged, "
+          f"{len(files)} changed ({len(complete)} fully committed), {len(removed)} removed, "
+          f"{len(partition_errors)} unreadable.")
+    print(f"Chunks: {sum(n for _, n in files.values())} from changed files, {counts['chunks_unchanged']} unchanged, "
+          f"{counts['chunks_upserted']} upserted, {deleted} stale points deleted.")
+    print("Stage throughput:")
+    print(format_stage_stats(stats))
+    print(f"Embedding API: {api_stats['requests']} requests, {api_stats['retries']} retries, "
+          f"{api_stats['rate_limited']} rate-limited")
+    for path, error in partition_errors:
+        print(f"Warning: could not read '{path}': {error}")
+    if failures:
+        print(f"Warning: {len(failures)} chunks could not be embedded (their files will be retried on the next run):")
+        for source, chunk, failure in failures:
+            print(f"  {os.path.relpath(source, root)}:{chunk.start_line} ({failure.attempts} attempts): {failure.error}")
+    cache_stats = get_embedding_cache().stats()
+    print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+    if build_lexical and (counts["chunks_upserted"] or deleted):
+        try:
+            build_from_collection(client, COLLECTION_NAME, LEXICAL_INDEX_PATH)
+        except Exception as e:
+            print(f"Error building lexical index (retrieval falls back to vector-only): {e}")
+    manifest.close()
+    client.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Ingest a directory of markdown documentation into Qdrant.")
+    parser.add_argument("--docs_dir", default=DOCS_DIR, help="Directory searched recursively for .md files")
+    parser.add_argument("--workers", type=int, default=PARTITION_WORKERS, help="Processes partitioning files")
+    parser.add_argument("--chunk_size", type=int, default=DOC_CHUNK_BATCH,
+                        help="Chunks passed between pipeline stages at once")
+    parser.add_argument("--max_tokens", type=int, default=CHUNK_MAX_TOKENS, help="Target tokens per chunk")
+    parser.add_argument("--full", action="store_true", help="Re-chunk and upsert every file, changed or not")
+    parser.add_argument("--keep_stale", action="store_true",
+                        help="Do not delete points of removed files or of chunks that disappeared")
+    parser.add_argument("--no_lexical", action="store_true",
+                        help=f"Do not rebuild the BM25 index ({LEXICAL_INDEX_PATH}) after ingesting")
+    args = parser.parse_args()
+    ingest_docs(
+        docs_dir=args.docs_dir,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        max_tokens=args.max_tokens,
+        full=args.full,
+        delete_stale=not args.keep_stale,
+        build_lexical=not args.no_lexical,
+    )
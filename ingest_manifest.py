@@ -0,0 +1,216 @@
+"""
+Ingestion manifest: which content is already committed to which collection.
+
+Every payload text is identified by its sha256 digest, and its Qdrant point ID
+is a UUID derived from that digest, so re-running ingestion over an edited or
+reordered source never overwrites unrelated points. Digests are recorded only
+after their upsert succeeded, which makes the manifest a checkpoint: a crashed
+run simply resumes, and an incremental run embeds only new or changed content.
+Entries not seen during a completed run are reported as stale so their points
+can be deleted. Directory ingestion (ingest_docs.py) also records each file's
+content digest once all of its chunks are committed, so unchanged files are
+skipped without being read past their hash.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# --- Configuration ---
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite")
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1b8e-3f0a-5d8e-9a57-2f5b8f0c9e41")  # Fixed so IDs are stable across machines
+# ---------------------
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def latest_run_marker(collection: str, path: str = MANIFEST_PATH) -> Optional[Tuple[int, Optional[float]]]:
+    """
+    (run_id, finished) of the newest ingestion run into `collection`, or None
+    when there is no manifest. It changes when a run starts and again when it
+    ends, so readers can tell the collection's content may have changed even
+    if its point count did not. Opens the file read-only.
+    """
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+    try:
+        row = conn.execute(
+            "SELECT run_id, finished FROM runs WHERE collection = ? ORDER BY run_id DESC LIMIT 1", (collection,)
+        ).fetchone()
+    except sqlite3.OperationalError:  # Created by an older version without runs
+        return None
+    finally:
+        conn.close()
+    return tuple(row) if row else None
+
+
+def point_id_for_digest(digest: str) -> str:
+    """Deterministic Qdrant point ID (UUID string) for a content digest."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, digest))
+
+
+class IngestManifest:
+    """SQLite record of committed digests per (collection, source)."""
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " collection TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " point_id TEXT NOT NULL,"
+            " location TEXT,"
+            " seen_run INTEGER NOT NULL,"
+            " PRIMARY KEY (collection, source, digest))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " collection TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " started REAL NOT NULL,"
+            " finished REAL,"
+            " status TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " collection TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " root TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (collection, source))"
+        )
+        self._conn.commit()
+
+    def start_run(self, collection: str, source: str) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO runs (collection, source, started, status) VALUES (?, ?, ?, 'running')",
+                (collection, source, time.time()),
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def finish_run(self, run_id: int, status: str = "complete"):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished = ?, status = ? WHERE run_id = ?", (time.time(), status, run_id))
+            self._conn.commit()
+
+    def last_run(self, collection: str, source: str) -> Optional[Tuple[int, str]]:
+        """(run_id, status) of the most recent run for this source, if any."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT run_id, status FROM runs WHERE collection = ? AND source = ? ORDER BY run_id DESC LIMIT 1",
+                (collection, source),
+            ).fetchone()
+
+    def mark_seen(self, collection: str, source: str, digests: Sequence[str], run_id: int) -> Dict[str, bool]:
+        """
+        Stamp `digests` as present in the source for this run and return which
+        of them are already committed (True) versus new (False).
+        """
+        unique = list(dict.fromkeys(digests))
+        committed = set()
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                committed.update(
+                    row[0] for row in self._conn.execute(
+                        f"SELECT digest FROM entries WHERE collection = ? AND source = ? AND digest IN ({placeholders})",
+                        [collection, source] + chunk,
+                    )
+                )
+            self._conn.executemany(
+                "UPDATE entries SET seen_run = ? WHERE collection = ? AND source = ? AND digest = ?",
+                [(run_id, collection, source, d) for d in committed],
+            )
+            self._conn.commit()
+        return {d: d in committed for d in unique}
+
+    def commit(self, collection: str, source: str, entries: Iterable[Tuple[str, str]], run_id: int):
+        """Record (digest, location) pairs whose points were successfully upserted."""
+        rows = [(collection, source, d, point_id_for_digest(d), loc, run_id) for d, loc in entries]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (collection, source, digest, point_id, location, seen_run)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def stale_entries(self, collection: str, source: str, run_id: int) -> Tuple[List[str], List[str]]:
+        """
+        Entries of this source not seen during `run_id`. Returns their digests
+        and the subset of point IDs that no other source still references.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT digest, point_id FROM entries WHERE collection = ? AND source = ? AND seen_run != ?",
+                (collection, source, run_id),
+            ).fetchall()
+            shared = set()
+            point_ids = [pid for _, pid in rows]
+            for start in range(0, len(point_ids), 500):
+                chunk = point_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                shared.update(
+                    row[0] for row in self._conn.execute(
+                        f"SELECT point_id FROM entries WHERE collection = ? AND source != ? AND point_id IN ({placeholders})",
+                        [collection, source] + chunk,
+                    )
+                )
+        return [d for d, _ in rows], [pid for pid in point_ids if pid not in shared]
+
+    def forget(self, collection: str, source: str, digests: Sequence[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM entries WHERE collection = ? AND source = ? AND digest = ?",
+                [(collection, source, d) for d in digests],
+            )
+            self._conn.commit()
+
+    def file_digests(self, collection: str, root: str) -> Dict[str, str]:
+        """source -> content digest of the files recorded under directory `root`."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT source, digest FROM files WHERE collection = ? AND root = ?", (collection, root)
+            ).fetchall())
+
+    def record_file(self, collection: str, source: str, root: str, digest: str):
+        """Mark a file as fully committed at `digest` (call after all its chunks are)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (collection, source, root, digest, updated) VALUES (?, ?, ?, ?, ?)",
+                (collection, source, root, digest, time.time()),
+            )
+            self._conn.commit()
+
+    def forget_file(self, collection: str, source: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE collection = ? AND source = ?", (collection, source))
+            self._conn.commit()
+
+    def count(self, collection: str, source: Optional[str] = None) -> int:
+        with self._lock:
+            if source is None:
+                return self._conn.execute("SELECT COUNT(*) FROM entries WHERE collection = ?", (collection,)).fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE collection = ? AND source = ?", (collection, source)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,174 @@
+"""
+Minimal threaded stage pipeline used by the ingestion scripts.
+
+A source iterable of batches feeds a chain of stages connected by bounded
+queues. Each stage runs in its own worker thread(s), so reading, embedding
+and upserting overlap while at most `queue_size` batches wait between any two
+stages - memory stays flat no matter how large the corpus is.
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional
+
+# --- Configuration ---
+DEFAULT_QUEUE_SIZE = 4  # Batches buffered between two stages
+PROGRESS_INTERVAL = 5.0  # Seconds between progress lines
+# ---------------------
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """A pipeline step: `fn(batch)` returns the batch for the next stage (or None to drop it)."""
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    batches: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    first_at: Optional[float] = None
+    last_at: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, items: int, started: float, finished: float):
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += finished - started
+            if self.first_at is None:
+                self.first_at = started
+            self.last_at = finished
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_at is None or self.last_at is None:
+            return 0.0
+        return self.last_at - self.first_at
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+def _batch_size(batch: Any) -> int:
+    try:
+        return len(batch)
+    except TypeError:
+        return 1
+
+
+def run_pipeline(
+    source: Iterable[Any],
+    stages: List[Stage],
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    source_name: str = "read",
+    progress: bool = True,
+) -> List[StageStats]:
+    """Run `source` through `stages` with overlapping execution; returns per-stage stats."""
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = [StageStats(source_name)] + [StageStats(s.name) for s in stages]
+    stop = threading.Event()
+
+    def read():
+        it = iter(source)
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    batch = next(it)
+                except StopIteration:
+                    break
+                stats[0].record(_batch_size(batch), started, time.perf_counter())
+                queues[0].put(batch)
+        except Exception as e:
+            stats[0].record_error()
+            print(f"Error in stage '{source_name}': {e}")
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_DONE)
+
+    remaining = [s.workers for s in stages]
+    remaining_lock = threading.Lock()
+
+    def work(index: int):
+        stage = stages[index]
+        stage_stats = stats[index + 1]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            batch = inbox.get()
+            if batch is _DONE:
+                break
+            started = time.perf_counter()
+            try:
+                result = stage.fn(batch)
+            except Exception as e:
+                stage_stats.record_error()
+                print(f"Error in stage '{stage.name}': {e}")
+                continue
+            stage_stats.record(_batch_size(batch), started, time.perf_counter())
+            if outbox is not None and result is not None:
+                outbox.put(result)
+        with remaining_lock:
+            remaining[index] -= 1
+            last_worker = remaining[index] == 0
+        if last_worker and outbox is not None:
+            for _ in range(stages[index + 1].workers):
+                outbox.put(_DONE)
+
+    threads = [threading.Thread(target=read, name=f"stage-{source_name}", daemon=True)]
+    for i, stage in enumerate(stages):
+        for w in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(i,), name=f"stage-{stage.name}-{w}", daemon=True))
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            alive = [t for t in threads if t.is_alive()]
+            if not alive:
+                break
+            alive[-1].join(timeout=PROGRESS_INTERVAL)
+            if progress and alive[-1].is_alive():
+                print("Progress: " + ", ".join(f"{s.name} {s.items}" for s in stats))
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    return stats
+
+
+def format_stage_stats(stats: List[StageStats]) -> str:
+    """One line per stage with item counts and throughput."""
+    lines = []
+    for s in stats:
+        line = f"  {s.name:<8} {s.items:>8} items in {s.wall_seconds:7.2f}s ({s.items_per_second:8.1f} items/s, busy {s.busy_seconds:.2f}s)"
+        if s.errors:
+            line += f", {s.errors} failed batches"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    """Yield lists of up to `size` consecutive items."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
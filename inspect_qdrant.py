@@ -11,6 +11,8 @@ from camel.types import EmbeddingModelType
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import ScrollRequest, Filter
 
+from collection_config import get_collection_config, stored_quantization
+
 """
 para desbloquear el lock de qdrant
 ps aux | grep qdrant
@@ -58,6 +60,12 @@ def inspect_qdrant_collection(
         print(f"  Points count: {collection_info.points_count}")
         print(f"  Vectors count: {collection_info.vectors_count}") # May differ if multiple named vectors
         print(f"  Segments count: {collection_info.segments_count}")
+        print(f"  Vector size: {collection_info.config.params.vectors.size}")
+        print(f"  Quantization: {stored_quantization(collection_info)}")
+        config = get_collection_config()
+        if collection_name == config.name:
+            for problem in config.mismatches(collection_info):
+                print(f"  Warning: differs from collection_config.py ({config.describe()}): {problem}")
         # print(f"  Config: {collection_info.config}") # Can be verbose
     except Exception as e:
         print(f"Error getting info for collection '{collection_name}': {e}")
@@ -102,14 +110,17 @@ def inspect_qdrant_collection(
             return
 
         try:
-            embedding_instance = OpenAIEmbedding(model_type=embedding_model_name)
-            query_vector = embedding_instance.get_embedding(test_query)
+            config = get_collection_config()
+            # Query with the same (possibly shortened) dimension and search params as the pipeline
+            embedding_instance = OpenAIEmbedding(model_type=embedding_model_name, **config.embedding_kwargs())
+            query_vector = embedding_instance.embed(test_query)
 
             search_results = client.search(
                 collection_name=collection_name,
                 query_vector=query_vector,
                 limit=3, # Get top 3 results
-                with_payload=True
+                with_payload=True,
+                search_params=config.search_params()
             )
             if search_results:
                 print("Search Results:")
@@ -133,14 +144,14 @@ def main():
     parser.add_argument(
         "--qdrant_path",
         type=str,
-        default="my_vectors",
-        help="Path to the local Qdrant storage directory (default: my_vectors).",
+        default=get_collection_config().path,
+        help="Path to the local Qdrant storage directory (default: from collection_config.py).",
     )
     parser.add_argument(
         "--qdrant_collection",
         type=str,
-        default="or_rag_docs",
-        help="Name of the Qdrant collection to inspect (default: or_rag_docs).",
+        default=get_collection_config().name,
+        help="Name of the Qdrant collection to inspect (default: from collection_config.py).",
     )
     parser.add_argument(
         "--samples",
@@ -0,0 +1,287 @@
+"""
+Local BM25 index over the collection's payload texts.
+
+OpenROAD questions often name exact commands and API symbols
+(`analyze_power_grid`, `set_pdnsim_net_voltage`, `place_pins`), which dense
+retrieval ranks poorly. Texts are tokenized into lower-cased words, and
+snake_case identifiers are indexed both whole and by their parts. Postings
+are stored in CSR form with the BM25 term weight of every posting precomputed,
+so scoring a query is a few array gathers and one bincount. The ingestion
+script rebuilds it from the collection's payloads after every run (point IDs
+match the collection's) and saves it to a single .npz file.
+
+The pipeline fuses lexical and vector rankings by reciprocal rank. A query
+dominated by identifiers the corpus knows is answered from this index alone,
+without calling the embedding API.
+
+    python lexical_index.py --out lexical_index.npz        # build from the configured collection
+    python lexical_index.py --query "what does place_pins do"
+"""
+
+import json
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from payloads import payload_text
+
+# --- Configuration ---
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.npz")
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant: score = sum 1 / (RRF_K + rank)
+IDENTIFIER_SHARE = 0.5  # Share of a query's content words that must be known identifiers for the fast path
+MIN_TOKEN_LENGTH = 2
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or please show "
+    "should tell that the this to use using what when where which who why with you your".split()
+)
+# ---------------------
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def is_identifier(token: str) -> bool:
+    """snake_case names: Tcl commands and API symbols such as place_pins or ord::get_db's get_db."""
+    return "_" in token.strip("_")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words; identifiers are also split into their parts (place_pins -> place, pins)."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) >= MIN_TOKEN_LENGTH:
+            tokens.append(token)
+        if is_identifier(token):
+            tokens.extend(part for part in token.split("_") if len(part) >= MIN_TOKEN_LENGTH)
+    return tokens
+
+
+class LexicalIndex:
+    """Immutable BM25 index: CSR postings with precomputed term weights."""
+
+    def __init__(
+        self,
+        terms: List[str],
+        term_offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+        idf: np.ndarray,
+        point_ids: List[str],
+        text_blob: np.ndarray,
+        text_offsets: np.ndarray,
+        created: float,
+    ):
+        self.terms = terms
+        self.term_index: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.term_offsets, self.postings, self.weights, self.idf = term_offsets, postings, weights, idf
+        self.point_ids = point_ids
+        self.text_blob, self.text_offsets = text_blob, text_offsets
+        self.created = created
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.point_ids)
+
+    @classmethod
+    def empty(cls) -> "LexicalIndex":
+        return cls([], np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.float32),
+                   np.zeros(0, np.float32), [], np.zeros(0, np.uint8), np.zeros(1, np.int64), created=0.0)
+
+    def text(self, doc: int) -> str:
+        return self.text_blob[self.text_offsets[doc]:self.text_offsets[doc + 1]].tobytes().decode("utf-8")
+
+    def query_terms(self, query: str) -> List[int]:
+        """
+        Term IDs to score. The parts of an identifier the index knows whole are
+        dropped: their long, low-IDF postings (set, get, net, ...) would cost
+        more than everything else and barely change the ranking.
+        """
+        terms = []
+        for token in TOKEN_RE.findall(query.lower()):
+            if is_identifier(token) and token in self.term_index:
+                terms.append(token)
+            else:
+                terms.extend(tokenize(token))
+        return [self.term_index[t] for t in dict.fromkeys(terms) if t not in STOPWORDS and t in self.term_index]
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """(doc, BM25 score) of the best `top_k` documents, best first."""
+        term_ids = self.query_terms(query)
+        if not term_ids or top_k <= 0:
+            return []
+        slices = [slice(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.postings[s] for s in slices])
+        contrib = np.concatenate([self.weights[s] * self.idf[t] for s, t in zip(slices, term_ids)])
+        unique, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib)
+        k = min(top_k, len(unique))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(unique[i]), float(scores[i])) for i in best]
+
+    def known_identifiers(self, query: str) -> List[str]:
+        return [t for t in dict.fromkeys(TOKEN_RE.findall(query.lower())) if is_identifier(t) and t in self.term_index]
+
+    def identifier_dominated(self, query: str, share: float = IDENTIFIER_SHARE) -> bool:
+        """True when known identifiers make up at least `share` of the query's content words."""
+        if not self.num_docs:
+            return False
+        identifiers = self.known_identifiers(query)
+        if not identifiers:
+            return False
+        content = [t for t in dict.fromkeys(TOKEN_RE.findall(query.lower()))
+                   if t not in STOPWORDS and len(t) >= MIN_TOKEN_LENGTH]
+        return len(identifiers) >= share * len(content)
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            terms=np.array(json.dumps(self.terms)),
+            term_offsets=self.term_offsets, postings=self.postings, weights=self.weights, idf=self.idf,
+            point_ids=np.array(json.dumps(self.point_ids)),
+            text_blob=self.text_blob, text_offsets=self.text_offsets,
+            created=np.array(self.created),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                json.loads(str(data["terms"])),
+                data["term_offsets"], data["postings"], data["weights"], data["idf"],
+                json.loads(str(data["point_ids"])),
+                data["text_blob"], data["text_offsets"],
+                created=float(data["created"]),
+            )
+
+
+class LexicalIndexBuilder:
+    """Accumulates (point ID, text) pairs; `build()` computes the BM25 weights."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self._postings: Dict[str, array] = {}  # term -> interleaved (doc, tf)
+        self._lengths = array("i")
+        self._point_ids: List[str] = []
+        self._seen = set()
+        self._texts = bytearray()
+        self._text_offsets = array("q", [0])
+
+    def add(self, point_id, text: str):
+        point_id = str(point_id)
+        if point_id in self._seen:
+            return
+        self._seen.add(point_id)
+        doc = len(self._point_ids)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("i")
+            postings.extend((doc, tf))
+        self._lengths.append(len(tokens))
+        self._point_ids.append(point_id)
+        self._texts += text.encode("utf-8")
+        self._text_offsets.append(len(self._texts))
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        for point_id, text in items:
+            self.add(point_id, text)
+
+    def build(self) -> LexicalIndex:
+        n = len(self._point_ids)
+        lengths = np.frombuffer(self._lengths, dtype=np.int32).astype(np.float32) if n else np.zeros(0, np.float32)
+        avgdl = float(lengths.mean()) if n and lengths.mean() > 0 else 1.0
+        terms = sorted(self._postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(self._postings[term]) // 2
+        postings = np.empty(term_offsets[-1], dtype=np.int32)
+        tfs = np.empty(term_offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            pairs = np.frombuffer(self._postings[term], dtype=np.int32).reshape(-1, 2)
+            postings[term_offsets[i]:term_offsets[i + 1]] = pairs[:, 0]
+            tfs[term_offsets[i]:term_offsets[i + 1]] = pairs[:, 1]
+        norm = self.k1 * (1 - self.b + self.b * lengths[postings] / avgdl)
+        weights = (tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+        df = np.diff(term_offsets).astype(np.float64)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return LexicalIndex(
+            terms, term_offsets, postings, weights, idf, list(self._point_ids),
+            np.frombuffer(bytes(self._texts), dtype=np.uint8), np.frombuffer(self._text_offsets, dtype=np.int64).copy(),
+            created=time.time(),
+        )
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], top_k: int, k: int = RRF_K, key=None) -> List[Tuple[object, float]]:
+    """
+    Fuse ranked lists of items by sum(1 / (k + rank)). Items are matched by
+    `key(item)` (default: .point_id, falling back to .text); the first list's
+    copy of an item is kept. Returns (item, fused score) pairs, best first.
+    """
+    key = key or (lambda item: item.point_id if item.point_id is not None else item.text)
+    scores: Dict[object, float] = {}
+    items: Dict[object, object] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    best = sorted(scores, key=lambda item_key: -scores[item_key])[:top_k]
+    return [(items[item_key], scores[item_key]) for item_key in best]
+
+
+def build_from_points(points: Iterable) -> LexicalIndex:
+    """Index points with .id and a payload text (as stored by the ingestion script)."""
+    builder = LexicalIndexBuilder()
+    for point in points:
+        builder.add(point.id, payload_text(point.payload))
+    return builder.build()
+
+
+def build_from_collection(client, collection_name: str, path: str = LEXICAL_INDEX_PATH) -> LexicalIndex:
+    """Index every point of a collection (payloads only) and save it to `path`."""
+    from mmap_index import scroll_collection
+    started = time.perf_counter()
+    index = build_from_points(scroll_collection(client, collection_name, with_vectors=False))
+    index.save(path)
+    print(f"Indexed {index.num_docs} documents ({len(index.terms)} terms) into '{path}' "
+          f"in {time.perf_counter() - started:.1f}s")
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+    from collection_config import get_collection_config
+    config = get_collection_config()
+    parser = argparse.ArgumentParser(description="Build or query the local BM25 index.")
+    parser.add_argument("--qdrant_path", default=config.path)
+    parser.add_argument("--collection", default=config.name)
+    parser.add_argument("--out", default=LEXICAL_INDEX_PATH)
+    parser.add_argument("--query", help="Search an existing index instead of building one")
+    parser.add_argument("--top_k", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.query:
+        index = LexicalIndex.load(args.out)
+        started = time.perf_counter()
+        hits = index.search(args.query, args.top_k)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{len(hits)} hits in {elapsed:.3f} ms (identifier fast path: {index.identifier_dominated(args.query)})")
+        for doc, score in hits:
+            print(f"  {score:7.3f}  {index.point_ids[doc]}  {index.text(doc)[:100]}")
+    else:
+        from qdrant_client import QdrantClient
+        client = QdrantClient(path=args.qdrant_path)
+        try:
+            build_from_collection(client, args.collection, args.out)
+        finally:
+            client.close()
@@ -0,0 +1,181 @@
+"""
+Structure-aware markdown chunking for documentation ingestion (ingest_docs.py).
+
+A document is split into sections by its ATX headings (`#` .. `######`), and
+each section into blocks: paragraphs (lists and tables included) separated by
+blank lines, and fenced code blocks, which are never split below
+CHUNK_HARD_MAX_TOKENS. Consecutive blocks of one section are packed into
+chunks of up to CHUNK_MAX_TOKENS; a chunk never spans two sections.
+
+Every chunk carries its heading path ("OpenROAD Flow Scripts Tutorial >
+Running The Automated RTL-to-GDS Flow > Design Goals"), which is also
+prepended to the embedded text so a run of Tcl commands still retrieves
+under the section that explains it. Lines starting with `#` inside code
+fences (shell comments) are not headings.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+from tokens import count_tokens, split_to_tokens
+
+# --- Configuration ---
+CHUNK_MAX_TOKENS = 400  # Target chunk size; single blocks may exceed it
+CHUNK_HARD_MAX_TOKENS = 4000  # Larger code blocks are split on line boundaries (the embedding API takes 8191)
+SECTION_SEPARATOR = " > "
+# ---------------------
+
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$")
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+@dataclass
+class DocChunk:
+    text: str  # Heading path + body: what is embedded and stored
+    section: Tuple[str, ...]
+    start_line: int  # 1-based, inclusive
+    end_line: int
+    tokens: int
+    has_code: bool = False
+
+    @property
+    def section_path(self) -> str:
+        return SECTION_SEPARATOR.join(self.section)
+
+
+@dataclass
+class _Block:
+    text: str
+    start_line: int
+    end_line: int
+    code: bool = False
+    fence: str = ""
+
+
+def _blocks(lines: List[str]) -> Iterator[Tuple[Optional[Tuple[int, str]], Optional[_Block]]]:
+    """Yield ((level, title), None) for headings and (None, block) for content, in order."""
+    para: List[str] = []
+    para_start = 0
+    i = 0
+
+    def flush_para(end: int):
+        if para:
+            return _Block("\n".join(para), para_start, end)
+        return None
+
+    while i < len(lines):
+        line = lines[i]
+        fence = FENCE_RE.match(line)
+        heading = None if fence else HEADING_RE.match(line)
+        if fence or heading or not line.strip():
+            block = flush_para(i)
+            para = []
+            if block is not None:
+                yield None, block
+        if fence:
+            marker = fence.group(1)
+            end = i + 1
+            while end < len(lines):
+                close = FENCE_RE.match(lines[end])
+                if close and close.group(1)[0] == marker[0] and len(close.group(1)) >= len(marker) \
+                        and not lines[end].strip()[len(close.group(1)):].strip():
+                    break
+                end += 1
+            # An unterminated fence runs to the end of the document.
+            yield None, _Block("\n".join(lines[i:end + 1]), i + 1, min(end + 1, len(lines)), code=True, fence=lines[i])
+            i = end + 1
+            continue
+        if heading:
+            yield (len(heading.group(1)), heading.group(2).strip()), None
+        elif line.strip():
+            if not para:
+                para_start = i + 1
+            para.append(line)
+        i += 1
+    block = flush_para(len(lines))
+    if block is not None:
+        yield None, block
+
+
+def _split_block(block: _Block, max_tokens: int) -> List[_Block]:
+    """Split an oversized block on line boundaries (longer lines in pieces); code pieces are re-fenced."""
+    lines = block.text.split("\n")
+    closing = ""
+    if block.code:
+        lines = lines[1:]
+        if lines and FENCE_RE.match(lines[-1]):
+            closing = lines.pop()
+        # An unterminated fence is closed with its own marker ("````" needs four backticks).
+        closing = closing.strip() or FENCE_RE.match(block.fence).group(1)
+    first = block.start_line + (1 if block.code else 0)
+    pieces: List[_Block] = []
+    current: List[Tuple[int, str]] = []  # (source line number, text)
+    current_tokens = 0
+
+    def emit():
+        body = "\n".join(text for _, text in current)
+        text = f"{block.fence}\n{body}\n{closing}" if block.code else body
+        pieces.append(_Block(text, current[0][0], current[-1][0], block.code, block.fence))
+
+    for number, line in enumerate(lines, start=first):
+        line_tokens = count_tokens(line) + 1
+        # A single line over the limit (minified code, a huge table row) is cut into pieces, never dropped.
+        parts = split_to_tokens(line, max_tokens - 1) if line_tokens > max_tokens else [line]
+        for part in parts:
+            part_tokens = line_tokens if part is line else count_tokens(part) + 1
+            if current and current_tokens + part_tokens > max_tokens:
+                emit()
+                current, current_tokens = [], 0
+            current.append((number, part))
+            current_tokens += part_tokens
+    if current:
+        emit()
+    return pieces
+
+
+def chunk_markdown(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   hard_max_tokens: int = CHUNK_HARD_MAX_TOKENS) -> List[DocChunk]:
+    """Heading-aware chunks of a markdown document, in document order."""
+    lines = text.splitlines()
+    path: List[Tuple[int, str]] = []  # (level, title) of the open headings
+    chunks: List[DocChunk] = []
+    pending: List[_Block] = []
+    pending_tokens = 0
+
+    def section() -> Tuple[str, ...]:
+        return tuple(title for _, title in path)
+
+    def prefix() -> str:
+        return SECTION_SEPARATOR.join(section()) + "\n\n" if path else ""
+
+    def flush():
+        nonlocal pending, pending_tokens
+        if pending:
+            body = "\n\n".join(b.text for b in pending)
+            full = prefix() + body
+            chunks.append(DocChunk(full, section(), pending[0].start_line, pending[-1].end_line,
+                                   count_tokens(full), any(b.code for b in pending)))
+        pending, pending_tokens = [], 0
+
+    for heading, block in _blocks(lines):
+        if heading is not None:
+            flush()
+            level, title = heading
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, title))
+            continue
+        budget = max_tokens - count_tokens(prefix())
+        block_tokens = count_tokens(block.text)
+        pieces = [block]
+        if block_tokens > (hard_max_tokens if block.code else budget):
+            pieces = _split_block(block, hard_max_tokens if block.code else max(budget, 1))
+        for piece in pieces:
+            piece_tokens = block_tokens if piece is block else count_tokens(piece.text)
+            if pending and pending_tokens + piece_tokens > budget:
+                flush()
+            pending.append(piece)
+            pending_tokens += piece_tokens
+    flush()
+    return chunks
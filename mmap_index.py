@@ -0,0 +1,233 @@
+"""
+Read-only, memory-mapped vector index: a lock-free alternative to local-path Qdrant.
+
+An export step copies a collection into a directory of plain files:
+
+    vectors.npy    N x D matrix, float32 unit vectors or int8 codes
+    scales.npy     per-row dequantization scale (int8 only)
+    payloads.bin   {"id": ..., "payload": ...} JSON records, back to back
+    offsets.npy    N + 1 byte offsets of the records in payloads.bin
+    meta.json      count, dimension, dtype, source collection
+
+MmapVectorIndex opens them with np.load(mmap_mode="r") and mmap, so loading
+is near-instant and every process serving retrieval shares the same pages
+through the page cache; nothing takes a lock. Search is exact cosine top-k,
+scored block by block with one matrix product per block, so memory stays
+bounded however large the matrix is. Its query()/status() mirror
+QdrantStorage, so the pipeline uses it with VECTOR_BACKEND=mmap.
+
+    python mmap_index.py --out vector_index               # export the configured collection
+    python mmap_index.py --out vector_index --dtype int8  # 4x smaller, ~lossless ranking
+"""
+
+import json
+import mmap
+import os
+import shutil
+import time
+from types import SimpleNamespace
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- Configuration ---
+MMAP_INDEX_PATH = os.getenv("MMAP_INDEX_PATH", "vector_index")
+MMAP_BLOCK_ROWS = int(os.getenv("MMAP_BLOCK_ROWS", "32768"))  # Rows scored per matrix product
+EXPORT_SCROLL_LIMIT = 1000
+DTYPES = ("float32", "int8")
+# ---------------------
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes and scales (row ≈ codes * scale)."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class MmapIndexWriter:
+    """Streams points into a new index directory; `close()` swaps it in atomically."""
+
+    def __init__(self, path: str, count: int, dim: int, dtype: str = "float32", source: Optional[dict] = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        self.path, self.count, self.dim, self.dtype = path, count, dim, dtype
+        self.source = source or {}
+        self.tmp = path.rstrip("/") + ".tmp"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self._vectors = np.lib.format.open_memmap(
+            os.path.join(self.tmp, "vectors.npy"), mode="w+", dtype=np.dtype(dtype), shape=(count, dim))
+        self._scales = np.ones(count, dtype=np.float32)
+        self._offsets = np.zeros(count + 1, dtype=np.int64)
+        self._payloads = open(os.path.join(self.tmp, "payloads.bin"), "wb")
+        self.written = 0
+
+    def add(self, ids: Sequence, vectors: Sequence[Sequence[float]], payloads: Sequence[Optional[dict]]):
+        if self.written + len(ids) > self.count:
+            raise ValueError(f"more than the {self.count} points the index was sized for")
+        rows = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        start, end = self.written, self.written + len(ids)
+        if self.dtype == "int8":
+            self._vectors[start:end], self._scales[start:end] = quantize_int8(rows)
+        else:
+            self._vectors[start:end] = rows
+        for i, (point_id, payload) in enumerate(zip(ids, payloads)):
+            self._payloads.write(json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False).encode("utf-8"))
+            self._offsets[start + i + 1] = self._payloads.tell()
+        self.written = end
+
+    def close(self) -> str:
+        self._payloads.close()
+        self._vectors.flush()
+        del self._vectors
+        np.save(os.path.join(self.tmp, "offsets.npy"), self._offsets[:self.written + 1])
+        if self.dtype == "int8":
+            np.save(os.path.join(self.tmp, "scales.npy"), self._scales[:self.written])
+        meta = {"count": self.written, "dim": self.dim, "dtype": self.dtype, "created": time.time(), **self.source}
+        with open(os.path.join(self.tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        # Processes that already mapped the old files keep reading them until they reload.
+        old = self.path.rstrip("/") + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old)
+        os.replace(self.tmp, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+        return self.path
+
+
+class MmapVectorIndex:
+    """Exact cosine top-k over a memory-mapped matrix; safe to share between processes."""
+
+    def __init__(self, path: str = MMAP_INDEX_PATH, block_rows: int = MMAP_BLOCK_ROWS):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.block_rows = block_rows
+        self.count, self.dim = self.meta["count"], self.meta["dim"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")[:self.count]
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.meta["dtype"] == "int8" else None
+        with open(os.path.join(path, "payloads.bin"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def _block_scores(self, start: int, end: int, queries: np.ndarray) -> np.ndarray:
+        block = self.vectors[start:end]
+        if self.scales is None:
+            return block @ queries.T
+        return (block.astype(np.float32) @ queries.T) * self.scales[start:end, None]
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the `top_k` best matches for each query row, best first."""
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"query has {queries.shape[1]} dims, index has {self.dim}")
+        k = min(top_k, self.count)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, self.block_rows):
+            end = min(start + self.block_rows, self.count)
+            scores = self._block_scores(start, end, queries).T  # (queries, block)
+            take = min(k, end - start)
+            part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            # Merge this block's candidates with the running best k.
+            rows = np.concatenate([best_rows, part + start], axis=1)
+            cand = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+            keep = np.argsort(-cand, axis=1, kind="stable")[:, :k]
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.take_along_axis(cand, keep, axis=1)
+        return best_rows, best_scores
+
+    def record(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._payloads[start:end])
+
+    def vector(self, row: int) -> List[float]:
+        v = self.vectors[row].astype(np.float32)
+        return (v * self.scales[row] if self.scales is not None else v).tolist()
+
+    # --- QdrantStorage-compatible surface used by the pipeline ---
+    def query(self, query) -> list:
+        if self.count == 0:
+            return []
+        rows, scores = self.search(np.asarray(query.query_vector), query.top_k)
+        results = []
+        for row, score in zip(rows[0], scores[0]):
+            rec = self.record(int(row))
+            results.append(SimpleNamespace(
+                record=SimpleNamespace(id=rec["id"], payload=rec["payload"], vector=self.vector(int(row))),
+                similarity=float(score),
+            ))
+        return results
+
+    def status(self):
+        return SimpleNamespace(vector_count=self.count, vector_dim=self.dim)
+
+
+def export_points(points: Iterable, count: int, dim: int, path: str = MMAP_INDEX_PATH, dtype: str = "float32",
+                  source: Optional[dict] = None, batch: int = EXPORT_SCROLL_LIMIT) -> int:
+    """Write points (objects with .id, .vector, .payload) to an index at `path`; returns how many."""
+    writer = MmapIndexWriter(path, count, dim, dtype, source)
+    pending = []
+
+    def flush():
+        writer.add([p.id for p in pending], [p.vector for p in pending], [p.payload for p in pending])
+        pending.clear()
+
+    for point in points:
+        pending.append(point)
+        if len(pending) >= batch:
+            flush()
+    if pending:
+        flush()
+    writer.close()
+    return writer.written
+
+
+def scroll_collection(client, collection_name: str, limit: int = EXPORT_SCROLL_LIMIT, with_vectors: bool = True):
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, limit=limit, offset=offset,
+                                       with_payload=True, with_vectors=with_vectors)
+        yield from points
+        if not offset:
+            break
+
+
+def export_collection(qdrant_path: str, collection_name: str, path: str = MMAP_INDEX_PATH,
+                      dtype: str = "float32") -> int:
+    """Copy a local Qdrant collection into a memory-mapped index."""
+    from qdrant_client import QdrantClient
+    client = QdrantClient(path=qdrant_path)
+    try:
+        info = client.get_collection(collection_name=collection_name)
+        count, dim = info.points_count or 0, info.config.params.vectors.size
+        started = time.perf_counter()
+        written = export_points(scroll_collection(client, collection_name), count, dim, path, dtype,
+                                source={"collection": collection_name, "qdrant_path": qdrant_path})
+    finally:
+        client.close()
+    print(f"Exported {written} points ({dim} dims, {dtype}) from '{collection_name}' to '{path}' "
+          f"in {time.perf_counter() - started:.1f}s")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    from collection_config import get_collection_config
+    config = get_collection_config()
+    parser = argparse.ArgumentParser(description="Export a Qdrant collection to a memory-mapped vector index.")
+    parser.add_argument("--qdrant_path", default=config.path)
+    parser.add_argument("--collection", default=config.name)
+    parser.add_argument("--out", default=MMAP_INDEX_PATH, help="Index directory")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    args = parser.parse_args()
+    export_collection(args.qdrant_path, args.collection, args.out, args.dtype)
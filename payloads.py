@@ -0,0 +1,19 @@
+"""
+Reading point payloads written by the ingestion scripts. Kept free of CAMEL
+and Qdrant imports so the retrieval pipeline and the lexical index builder
+(lexical_index.py) can share it.
+"""
+import json
+from typing import Optional
+
+# --- Configuration ---
+TEXT_PAYLOAD_KEY = "text"  # CAMEL and the ingestion scripts both store the chunk text here
+# ---------------------
+
+
+def payload_text(payload: Optional[dict]) -> str:
+    """The text stored in a point's payload; the whole payload as JSON when it has none."""
+    if not payload:
+        return ""
+    text = payload.get(TEXT_PAYLOAD_KEY)
+    return text if isinstance(text, str) else json.dumps(payload)
@@ -1,128 +1,626 @@
 import os
+import threading
+import time
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from dotenv import load_dotenv
 
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType, ModelType, EmbeddingModelType
-from camel.configs import ChatGPTConfig
-from camel.embeddings import OpenAIEmbedding
-from camel.storages import QdrantStorage, Neo4jGraph
-from camel.retrievers import VectorRetriever
-from camel.loaders import UnstructuredIO
-from camel.agents import KnowledgeGraphAgent, ChatAgent
-from camel.messages import BaseMessage
+import tracing
+from collection_config import COLLECTION_NAME, QDRANT_PATH, get_collection_config
+from payloads import payload_text
+
+if TYPE_CHECKING:
+    from context_builder import RetrievedChunk
+
+# CAMEL, Qdrant and Neo4j are imported inside PipelineResources so that importing
+# this module (e.g. for `executor.py --help`) stays cheap; each resource is only
+# built, and its service only contacted, the first time a query needs it.
 
 # 1) Load .env
 load_dotenv()
 
-# 2) Embedding + Vector Retriever
+# --- Configuration ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # make sure this is set
-embedding = OpenAIEmbedding(model_type=EmbeddingModelType.TEXT_EMBEDDING_3_LARGE)
-vector_store = QdrantStorage(
-    vector_dim=embedding.get_output_dim(),
-    path="vector_db/",
-    collection_name="documents_collection",
-)
-vector_retriever = VectorRetriever(
-    embedding_model=embedding,
-    storage=vector_store,
-)
+NEO4J_URL = os.getenv("NEO4J_URI", "neo4j+s://a77d863c.databases.neo4j.io")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "f1zopPMnKXlhQAYvugcoLUr8t0s9QruIyYsY0YxBBhU")
+CHAT_TEMPERATURE = 0.2
+VECTOR_STAGE_TIMEOUT = float(os.getenv("VECTOR_STAGE_TIMEOUT", "15"))  # Seconds before answering without vector context
+KG_STAGE_TIMEOUT = float(os.getenv("KG_STAGE_TIMEOUT", "15"))  # Seconds before answering without KG context
+RETRIEVAL_WORKERS = 8  # Threads shared by the concurrent retrieval stages
+KG_NEIGHBOURS_PER_NODE = int(os.getenv("KG_NEIGHBOURS_PER_NODE", "25"))  # Cap on edges returned per entity
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # "vector": dense only, "hybrid": also BM25 (lexical_index.py), fused by rank
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")  # "qdrant": local-path collection, "mmap": exported index (mmap_index.py)
+KG_BACKEND = os.getenv("KG_BACKEND", "neo4j")  # "neo4j": live lookups, "snapshot": in-process CSR graph
+KG_HOPS = int(os.getenv("KG_HOPS", "1"))  # Neighbourhood depth served by the snapshot backend
+KG_SNAPSHOT_REFRESH = float(os.getenv("KG_SNAPSHOT_REFRESH", "0"))  # Seconds between background refreshes; 0 = never
+ENTITY_EXTRACTION = os.getenv("ENTITY_EXTRACTION", "local")  # "local": dictionary match first, "llm": always kg_agent
+CACHE_GENERATION_INTERVAL = 30.0  # Seconds between checks of the collection for semantic-cache invalidation
+CONTEXT_REPORT = os.getenv("CONTEXT_REPORT", "0") not in ("0", "false", "False", "")  # Print the context budget per query
+# ---------------------
 
-# 3) Knowledge-Graph Storage (Neo4j)
-# Set Neo4j instance
-n4j = Neo4jGraph(
-    url="neo4j+s://a77d863c.databases.neo4j.io",
-    username="neo4j",
-    password="f1zopPMnKXlhQAYvugcoLUr8t0s9QruIyYsY0YxBBhU"
+# One parameterized round trip for all entities, both edge directions. Edges are
+# ordered before collecting so the per-node cap keeps a stable subset.
+KG_NEIGHBOURHOOD_QUERY = """
+UNWIND $ids AS nid
+MATCH (n {id: nid})-[r]-(m)
+WITH n, r, m
+ORDER BY type(r), m.id
+WITH n, collect(DISTINCT CASE WHEN startNode(r) = n
+    THEN 'Node ' + n.id + ' --' + type(r) + '--> ' + m.id
+    ELSE 'Node ' + m.id + ' --' + type(r) + '--> ' + n.id
+END)[..$limit] AS descs
+UNWIND descs AS desc
+RETURN DISTINCT desc
+"""
 
+# System prompt for ChatAgent
+SYSTEM_PROMPT = (
+    "You are a VLSI design automation expert specializing in the RTL-to-GDSII flow.\n"
+    "Your job has two modes, depending on the user's request:\n\n"
+    "1) Script Generation Mode\n"
+    "   - Produce a single, self-contained ```python``` (or hybrid Python/Tcl) script\n"
+    "     that runs from synthesis through GDSII export in OpenROAD without further editing.\n"
+    "   - Include all necessary imports at the top.\n"
+    "   - Wrap the entire script in one fenced code block:\n"
+    "     ```python\n"
+    "     # your code here\n"
+    "     ```\n"
+    "   - Do not emit any prose, explanations, or extra text—only the runnable script.\n\n"
+    "2) VLSI Q&A Mode\n"
+    "   - If the user asks a question about VLSI design, physical implementation,\n"
+    "     timing, power, constraints, or OpenROAD usage, provide a concise,\n"
+    "     accurate technical explanation.\n"
+    "   - You may include small code snippets or Tcl/API examples to illustrate your answer,\n"
+    "     but keep them minimal and relevant.\n"
+    "   - Precede code examples with a brief introduction in plain text,\n"
+    "     and present them in fenced blocks.\n\n"
+    "Choose the appropriate mode automatically and respond accordingly."
 )
 
-# 4) Unstructured IO & KG‐Agent
-uio = UnstructuredIO()
 
-# 5) OpenAI Chat Model
-chat_cfg = ChatGPTConfig(temperature=0.2).as_dict()
-openai_model = ModelFactory.create(
-    model_platform=ModelPlatformType.OPENAI,
-    model_type=ModelType.GPT_4O_MINI,
-    model_config_dict=chat_cfg,
-)
+class PipelineResources:
+    """
+    Container for the pipeline's clients and agents. Every attribute is built
+    on first access (thread-safe) and then reused, so a query only pays for the
+    stages it actually touches.
+    """
 
-# 6) KG Agent
-kg_agent = KnowledgeGraphAgent(model=openai_model)
-
-# 7) System prompt for ChatAgent
-sys_msg = BaseMessage.make_assistant_message(
-    role_name="VLSI Engineer",
-    content=(
-        "You are a VLSI design automation expert specializing in the RTL-to-GDSII flow.\n"
-        "Your job has two modes, depending on the user's request:\n\n"
-        "1) Script Generation Mode\n"
-        "   - Produce a single, self-contained ```python``` (or hybrid Python/Tcl) script\n"
-        "     that runs from synthesis through GDSII export in OpenROAD without further editing.\n"
-        "   - Include all necessary imports at the top.\n"
-        "   - Wrap the entire script in one fenced code block:\n"
-        "     ```python\n"
-        "     # your code here\n"
-        "     ```\n"
-        "   - Do not emit any prose, explanations, or extra text—only the runnable script.\n\n"
-        "2) VLSI Q&A Mode\n"
-        "   - If the user asks a question about VLSI design, physical implementation,\n"
-        "     timing, power, constraints, or OpenROAD usage, provide a concise,\n"
-        "     accurate technical explanation.\n"
-        "   - You may include small code snippets or Tcl/API examples to illustrate your answer,\n"
-        "     but keep them minimal and relevant.\n"
-        "   - Precede code examples with a brief introduction in plain text,\n"
-        "     and present them in fenced blocks.\n\n"
-        "Choose the appropriate mode automatically and respond accordingly."
-    )
-)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._built = {}
 
-# 8) ChatAgent
-camel_agent = ChatAgent(system_message=sys_msg, model=openai_model)
+    def _get(self, name, factory):
+        value = self._built.get(name)
+        if value is None:
+            # One lock per resource, so e.g. Qdrant and Neo4j can be opened concurrently.
+            with self._lock:
+                lock = self._locks.setdefault(name, threading.Lock())
+            with lock:
+                value = self._built.get(name)
+                if value is None:
+                    value = factory()
+                    self._built[name] = value
+        return value
 
+    def is_built(self, name: str) -> bool:
+        return name in self._built
 
-def answer_vlsi_query(
+    def install(self, name: str, value):
+        """Use `value` for resource `name` instead of building it (e.g. stand_ins for tests)."""
+        self._built[name] = value
+
+    def reset(self, name: str):
+        """Forget a built resource so the next access rebuilds it (e.g. after the KG changed)."""
+        self._built.pop(name, None)
+
+    # 2) Embedding + Vector Retriever
+    @property
+    def embedding(self):
+        def build():
+            from camel.embeddings import OpenAIEmbedding
+            from camel.types import EmbeddingModelType
+            from cached_embedding import CachedEmbedding
+            config = get_collection_config()
+            return CachedEmbedding(OpenAIEmbedding(model_type=EmbeddingModelType(config.model),
+                                                   **config.embedding_kwargs()))
+        return self._get("embedding", build)
+
+    @property
+    def vector_store(self):
+        def build():
+            if VECTOR_BACKEND == "mmap":
+                from mmap_index import MMAP_INDEX_PATH, MmapVectorIndex
+                index = MmapVectorIndex(MMAP_INDEX_PATH)
+                if index.dim != get_collection_config().dimension:
+                    raise ValueError(f"Index '{MMAP_INDEX_PATH}' has {index.dim} dims, queries are embedded "
+                                     f"with {get_collection_config().dimension}; re-export it")
+                print(f"Opened memory-mapped index '{MMAP_INDEX_PATH}' ({index.count} vectors, {index.meta['dtype']})")
+                return index
+            from camel.storages import QdrantStorage
+            return QdrantStorage(
+                vector_dim=self.embedding.get_output_dim(),
+                path=QDRANT_PATH,
+                collection_name=COLLECTION_NAME,
+            )
+        return self._get("vector_store", build)
+
+    @property
+    def lexical_index(self):
+        def build():
+            from lexical_index import LEXICAL_INDEX_PATH, LexicalIndex
+            if not os.path.exists(LEXICAL_INDEX_PATH):
+                print(f"No lexical index at '{LEXICAL_INDEX_PATH}'; retrieval is vector-only until ingestion builds one")
+                return LexicalIndex.empty()
+            index = LexicalIndex.load(LEXICAL_INDEX_PATH)
+            print(f"Loaded lexical index '{LEXICAL_INDEX_PATH}' ({index.num_docs} documents, {len(index.terms)} terms)")
+            return index
+        return self._get("lexical_index", build)
+
+    @property
+    def vector_retriever(self):
+        def build():
+            from camel.retrievers import VectorRetriever
+            return VectorRetriever(
+                embedding_model=self.embedding,
+                storage=self.vector_store,
+            )
+        return self._get("vector_retriever", build)
+
+    # 3) Knowledge-Graph Storage (Neo4j)
+    @property
+    def n4j(self):
+        def build():
+            from camel.storages import Neo4jGraph
+            return Neo4jGraph(
+                url=NEO4J_URL,
+                username=NEO4J_USERNAME,
+                password=NEO4J_PASSWORD,
+            )
+        return self._get("n4j", build)
+
+    # 4) Unstructured IO
+    @property
+    def uio(self):
+        def build():
+            from camel.loaders import UnstructuredIO
+            return UnstructuredIO()
+        return self._get("uio", build)
+
+    # 5) OpenAI Chat Model
+    @property
+    def openai_model(self):
+        def build():
+            from camel.configs import ChatGPTConfig
+            from camel.models import ModelFactory
+            from camel.types import ModelPlatformType, ModelType
+            chat_cfg = ChatGPTConfig(temperature=CHAT_TEMPERATURE).as_dict()
+            return ModelFactory.create(
+                model_platform=ModelPlatformType.OPENAI,
+                model_type=ModelType.GPT_4O_MINI,
+                model_config_dict=chat_cfg,
+            )
+        return self._get("openai_model", build)
+
+    # 6) KG Agent
+    @property
+    def kg_agent(self):
+        def build():
+            from camel.agents import KnowledgeGraphAgent
+            return KnowledgeGraphAgent(model=self.openai_model)
+        return self._get("kg_agent", build)
+
+    # In-process KG snapshot (KG_BACKEND=snapshot)
+    @property
+    def graph_store(self):
+        def build():
+            from graph_snapshot import GraphSnapshot, GraphSnapshotStore
+            store = GraphSnapshotStore(lambda: GraphSnapshot.from_neo4j(self.n4j))
+            store.on_refresh(lambda snapshot: self.reset("entity_matcher"))
+            store.start_background_refresh(KG_SNAPSHOT_REFRESH)
+            return store
+        return self._get("graph_store", build)
+
+    # Dictionary of KG node IDs for local entity extraction
+    @property
+    def entity_matcher(self):
+        def build():
+            from entity_matcher import EntityMatcher, load_node_ids
+            if KG_BACKEND == "snapshot":
+                node_ids = self.graph_store.get().node_names
+            else:
+                node_ids = load_node_ids(self.n4j)
+            matcher = EntityMatcher(node_ids)
+            print(f"Entity matcher loaded {matcher.size} KG node IDs")
+            return matcher
+        return self._get("entity_matcher", build)
+
+    # Semantic answer cache
+    @property
+    def semantic_cache(self):
+        def build():
+            from semantic_cache import SemanticCache
+            return SemanticCache()
+        return self._get("semantic_cache", build)
+
+    # 7) ChatAgent
+    def make_chat_agent(self):
+        """
+        A fresh ChatAgent with the VLSI system prompt and its own history,
+        bounded to the last SESSION_MESSAGE_WINDOW messages (and
+        SESSION_TOKEN_LIMIT tokens, if set).
+        """
+        from camel.agents import ChatAgent
+        from camel.messages import BaseMessage
+        from sessions import SESSION_MESSAGE_WINDOW, SESSION_TOKEN_LIMIT
+        sys_msg = BaseMessage.make_assistant_message(role_name="VLSI Engineer", content=SYSTEM_PROMPT)
+        return ChatAgent(
+            system_message=sys_msg,
+            model=self.openai_model,
+            message_window_size=SESSION_MESSAGE_WINDOW or None,
+            token_limit=SESSION_TOKEN_LIMIT or None,
+        )
+
+    @property
+    def camel_agent(self):
+        # Kept for callers that want one shared conversation; the pipeline itself uses `sessions`.
+        return self._get("camel_agent", self.make_chat_agent)
+
+    # Per-session agents
+    @property
+    def sessions(self):
+        def build():
+            from sessions import SessionPool
+            pool = SessionPool(self.make_chat_agent)
+            pool.start_sweeper()
+            return pool
+        return self._get("sessions", build)
+
+
+_resources = PipelineResources()
+
+
+def get_resources() -> PipelineResources:
+    """The process-wide resource container."""
+    return _resources
+
+
+def __getattr__(name):
+    # Backwards compatibility: `pipeline.camel_agent`, `pipeline.n4j`, ... resolve lazily.
+    if name in ("embedding", "vector_store", "vector_retriever", "n4j", "uio",
+                "openai_model", "kg_agent", "camel_agent"):
+        return getattr(_resources, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_retrieval_pool: Optional[ThreadPoolExecutor] = None
+_retrieval_pool_lock = threading.Lock()
+
+
+def get_retrieval_pool() -> ThreadPoolExecutor:
+    global _retrieval_pool
+    with _retrieval_pool_lock:
+        if _retrieval_pool is None:
+            _retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        return _retrieval_pool
+
+
+def search_vectors(storage, query_vector: List[float], top_k: int) -> list:
+    """
+    storage.query() with the configured search parameters. CAMEL's QdrantStorage
+    does not pass search params, so quantized collections are queried through
+    its client (rescoring the oversampled candidates on the originals).
+    """
+    from camel.storages import VectorDBQuery
+    client = getattr(storage, "client", None)  # None for the mmap index and stand-ins
+    params = get_collection_config().search_params() if client is not None else None
+    if params is None:
+        return storage.query(VectorDBQuery(query_vector=query_vector, top_k=top_k))
+    from camel.storages import VectorDBQueryResult
+    points = client.query_points(
+        collection_name=storage.collection_name,
+        query=query_vector,
+        limit=top_k,
+        search_params=params,
+        with_payload=True,
+        with_vectors=True,
+    ).points
+    return [
+        VectorDBQueryResult.create(similarity=p.score, vector=p.vector, id=str(p.id), payload=p.payload)
+        for p in points
+    ]
+
+
+@tracing.traced("vector")
+def retrieve_vector_context(query: str, top_k: int, similarity_threshold: float) -> List["RetrievedChunk"]:
+    """
+    Vector-based retrieval from the Qdrant collection. Hits keep their stored
+    vectors so context assembly can rerank them without re-embedding.
+    """
+    from context_builder import RetrievedChunk
+
+    res = get_resources()
+    query_vector = res.embedding.embed(obj=query)
+    with tracing.span("vector_query", top_k=top_k) as sp:
+        results = search_vectors(res.vector_store, query_vector, top_k)
+        sp.set(results=len(results))
+    chunks = [
+        RetrievedChunk(
+            text=payload_text(r.record.payload),
+            score=r.similarity,
+            vector=r.record.vector,
+            point_id=r.record.id,
+        )
+        for r in results
+        if r.similarity >= similarity_threshold
+    ]
+    tracing.current_span().set(hits=len(chunks))
+    return chunks
+
+
+@tracing.traced("lexical")
+def retrieve_lexical_context(query: str, top_k: int) -> List["RetrievedChunk"]:
+    """BM25 hits from the local lexical index (no network, no embedding)."""
+    from context_builder import RetrievedChunk
+    index = get_resources().lexical_index
+    chunks = [
+        RetrievedChunk(text=index.text(doc), score=score, point_id=index.point_ids[doc])
+        for doc, score in index.search(query, top_k)
+    ]
+    tracing.current_span().set(hits=len(chunks))
+    return chunks
+
+
+def identifier_query(query: str) -> bool:
+    """Hybrid mode and `query` is mostly identifiers the lexical index knows (see lexical_index.py)."""
+    return RETRIEVAL_MODE == "hybrid" and get_resources().lexical_index.identifier_dominated(query)
+
+
+@tracing.traced("neo4j")
+def lookup_kg_neighbours(n4j, node_ids: List[str], limit: int = KG_NEIGHBOURS_PER_NODE) -> List[str]:
+    """Edge descriptions around `node_ids`, fetched in a single Neo4j round trip."""
+    ids = list(dict.fromkeys(i for i in node_ids if i))
+    if not ids:
+        return []
+    records = n4j.query(query=KG_NEIGHBOURHOOD_QUERY, params={"ids": ids, "limit": limit})
+    # Entities adjacent to each other yield the same edge twice; keep the first.
+    edges = list(dict.fromkeys(rec["desc"] for rec in records))
+    tracing.current_span().set(ids=len(ids), edges=len(edges))
+    return edges
+
+
+@tracing.traced("entities")
+def extract_entities(query: str) -> List[str]:
+    """
+    KG node IDs mentioned in `query`. In "local" mode a dictionary match over
+    the graph's node IDs is tried first; the kg_agent LLM call is only made
+    when it finds nothing.
+    """
+    res = get_resources()
+    if ENTITY_EXTRACTION == "local":
+        try:
+            entities = res.entity_matcher.find(query)
+            if entities:
+                tracing.current_span().set(method="local", entities=len(entities))
+                return entities
+        except Exception as e:
+            print(f"Warning: local entity extraction failed ({type(e).__name__}: {e}); using kg_agent")
+    el = res.uio.create_element_from_text(text=query, element_id="kg_query")
+    with tracing.span("kg_agent"):
+        ans_el = res.kg_agent.run(el, parse_graph_elements=True)
+    entities = [node.id for node in ans_el.nodes]
+    tracing.current_span().set(method="llm", entities=len(entities))
+    return entities
+
+
+@tracing.traced("kg")
+def retrieve_kg_context(query: str) -> List[str]:
+    """
+    Entity extraction followed by a neighbourhood lookup: one batched Neo4j
+    round trip, or an in-process k-hop expansion with KG_BACKEND=snapshot.
+    """
+    res = get_resources()
+    entities = extract_entities(query)
+    if KG_BACKEND == "snapshot":
+        edges = res.graph_store.get().expand(entities, hops=KG_HOPS, limit_per_node=KG_NEIGHBOURS_PER_NODE)
+    else:
+        edges = lookup_kg_neighbours(res.n4j, entities)
+    tracing.current_span().set(backend=KG_BACKEND, edges=len(edges))
+    return edges
+
+
+_generation_checked_at = 0.0
+
+
+def refresh_cache_generation(force: bool = False):
+    """
+    Tie the semantic cache to the current state of the vector collection, so
+    answers are dropped once ingestion adds, changes or removes points. The
+    point count alone misses edits that keep it unchanged, so the newest
+    ingestion run in the manifest (and the build time of an mmap index) is
+    part of the generation too.
+    """
+    from ingest_manifest import latest_run_marker
+    global _generation_checked_at
+    now = time.monotonic()
+    if not force and now - _generation_checked_at < CACHE_GENERATION_INTERVAL:
+        return
+    _generation_checked_at = now
+    res = get_resources()
+    store = res.vector_store
+    status = store.status()
+    res.semantic_cache.set_generation((
+        COLLECTION_NAME, get_collection_config().dimension, status.vector_count,
+        latest_run_marker(COLLECTION_NAME), getattr(store, "meta", {}).get("created"),
+    ))
+
+
+@tracing.traced("cache_lookup")
+def semantic_cache_lookup(query: str, namespace: str):
+    """
+    Look `query` up in the semantic cache. Returns (entry or None, query vector);
+    the vector is None when caching is disabled or the lookup failed.
+    """
+    from semantic_cache import SEMANTIC_CACHE_ENABLED
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    if identifier_query(query):
+        # Similar wording can name a different command, and the point of the lexical path is to skip embedding.
+        tracing.count("pipeline_cache_total", cache="semantic", result="skipped")
+        return None, None
+    res = get_resources()
+    try:
+        refresh_cache_generation()
+        vector = res.embedding.embed(obj=query)
+        entry = res.semantic_cache.lookup(vector, namespace)
+    except Exception as e:
+        print(f"Warning: semantic cache lookup failed ({type(e).__name__}: {e})")
+        tracing.count("pipeline_cache_total", cache="semantic", result="error")
+        return None, None
+    result = "hit" if entry is not None else "miss"
+    tracing.current_span().set(namespace=namespace.split(":", 1)[0], hit=entry is not None)
+    tracing.count("pipeline_cache_total", cache="semantic", result=result)
+    return entry, vector
+
+
+def _stage_result(name: str, future, timeout: float, default):
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        print(f"Warning: {name} stage timed out; answering without it")
+    except Exception as e:
+        print(f"Warning: {name} stage failed ({type(e).__name__}: {e}); answering without it")
+    return default
+
+
+def gather_context(
     query: str,
     top_k: int = 7,
-    similarity_threshold: float = 0.2
-) -> str:
+    similarity_threshold: float = 0.2,
+    vector_timeout: float = VECTOR_STAGE_TIMEOUT,
+    kg_timeout: float = KG_STAGE_TIMEOUT,
+) -> Tuple[List["RetrievedChunk"], List[str]]:
     """
-    1) Vector‐based retrieval
-    2) KG extraction & Neo4j lookups
-    3) Combine contexts and ask camel_agent
-    4) Return the assistant's first message
+    Run vector, lexical and KG retrieval concurrently. Each stage has its own
+    timeout (the lexical stage shares the vector one); a stage that is late or fails contributes an empty context instead
+    of blocking the answer. In hybrid mode BM25 hits are fused with the vector
+    hits by reciprocal rank, and a query made of known identifiers skips
+    vector retrieval (and its embedding call) altogether.
     """
-    # Vector retrieval
-    retrieved = vector_retriever.query(
-        query=query,
-        top_k=top_k,
-        similarity_threshold=similarity_threshold
-    )
+    from lexical_index import reciprocal_rank_fusion
 
-    # KG‐agent extraction
-    el = uio.create_element_from_text(text=query, element_id="kg_query")
-    ans_el = kg_agent.run(el, parse_graph_elements=True)
-
-    # Neo4j lookups
-    kg_ctx = []
-    for node in ans_el.nodes:
-        cypher = f"""
-        MATCH (n {{id: '{node.id}'}})-[r]->(m)
-        RETURN 'Node ' + n.id + ' --' + type(r) + '--> ' + m.id AS desc
-        UNION
-        MATCH (n)<-[r]-(m {{id: '{node.id}'}})
-        RETURN 'Node ' + m.id + ' --' + type(r) + '--> ' + n.id AS desc
-        """
-        for rec in n4j.query(query=cypher):
-            kg_ctx.append(rec["desc"])
+    pool = get_retrieval_pool()
+    started = time.monotonic()
+    lexical_only = identifier_query(query)
+    kg_future = pool.submit(tracing.bind(retrieve_kg_context), query)
+    vector_future = lexical_future = None
+    if not lexical_only:
+        vector_future = pool.submit(tracing.bind(retrieve_vector_context), query, top_k, similarity_threshold)
+    if RETRIEVAL_MODE == "hybrid" and get_resources().lexical_index.num_docs:
+        lexical_future = pool.submit(tracing.bind(retrieve_lexical_context), query, top_k)
 
-    # Combine contexts
-    context = f"{retrieved}\n" + "\n".join(kg_ctx)
+    def remaining(timeout: float) -> float:
+        # Timeouts count from the common start, so the total wait is bounded by the slowest stage.
+        return max(0.0, timeout - (time.monotonic() - started))
+
+    retrieved = _stage_result("vector retrieval", vector_future, remaining(vector_timeout), []) if vector_future else []
+    lexical = _stage_result("lexical retrieval", lexical_future, remaining(vector_timeout), []) if lexical_future else []
+    if lexical:
+        retrieved = [replace(chunk, score=score) for chunk, score in reciprocal_rank_fusion([retrieved, lexical], top_k)]
+    tracing.count("pipeline_retrieval_total", path="lexical" if lexical_only else "hybrid" if lexical else "vector")
+    kg_ctx = _stage_result("knowledge graph", kg_future, remaining(kg_timeout), [])
+    return retrieved, kg_ctx
+
+
+@tracing.traced("llm")
+def ask_agent(agent, message, on_token=None) -> str:
+    """agent.step(message) as text; streamed to `on_token` when it is given."""
+    if on_token is None:
+        reply = agent.step(message).msgs[0].content
+    else:
+        from streaming import stream_step
+        reply = stream_step(agent, message, on_token)
+    if tracing.TRACING_ENABLED:
+        from tokens import count_tokens
+        prompt_tokens, completion_tokens = count_tokens(message.content), count_tokens(reply)
+        tracing.current_span().set(streamed=on_token is not None, prompt_tokens=prompt_tokens,
+                                   completion_tokens=completion_tokens)
+        tracing.count("pipeline_tokens_total", prompt_tokens, kind="prompt")
+        tracing.count("pipeline_tokens_total", completion_tokens, kind="completion")
+    return reply
+
+
+def build_query_message(query: str, top_k: int, similarity_threshold: float, query_vector=None):
+    """
+    Retrieve vector and KG context for `query`, pack it into the token budget
+    and return (user message for the agent, query vector or None).
+    """
+    from camel.messages import BaseMessage
+    from context_builder import build_context
+
+    retrieved, kg_ctx = gather_context(query, top_k, similarity_threshold)
+
+    # Combine contexts: deduplicate, rerank and pack into the token budget
+    if query_vector is None and any(c.vector is not None for c in retrieved):
+        query_vector = get_resources().embedding.embed(obj=query)  # Served from the embedding cache
+    with tracing.span("context") as sp:
+        context, report = build_context(retrieved, kg_ctx, query_vector=query_vector)
+        sp.set(tokens=report.total_tokens, chunks=report.chunks_used, edges=report.edges_used,
+               dropped=report.chunks_dropped + report.edges_dropped, duplicates=report.duplicates_removed)
+    tracing.count("pipeline_tokens_total", report.total_tokens, kind="context")
+    if CONTEXT_REPORT:
+        print(report.summary())
 
-    # Ask the agent
     user_msg = BaseMessage.make_user_message(
         role_name="vlsi User",
         content=f"The Original Query is: {query}\n\nRetrieved Context:\n{context}"
     )
-    resp = camel_agent.step(user_msg)
-    return resp.msgs[0].content 
\ No newline at end of file
+    return user_msg, query_vector
+
+
+@tracing.traced("answer", root=True)
+def answer_vlsi_query(
+    query: str,
+    top_k: int = 7,
+    similarity_threshold: float = 0.2,
+    use_cache: bool = True,
+    agent=None,
+    session_id: Optional[str] = None,
+    on_token=None
+) -> str:
+    """
+    0) Return a cached answer if a near-identical question was answered before
+    1) Vector‐based retrieval and KG extraction & Neo4j lookups, concurrently
+    2) Pack both contexts into the token budget and ask `agent` (default: the
+       agent of `session_id`, or a one-off conversation when that is None)
+    3) Return the assistant's first message
+
+    With `on_token`, the reply is streamed to it as it is generated (a cached
+    answer arrives as a single chunk). Conversations (`session_id`) bypass the
+    semantic cache.
+    """
+    namespace = f"answer:{top_k}:{similarity_threshold}"
+    query_vector = None
+    # A follow-up depends on its conversation, and a cached reply would never enter the session's memory.
+    use_cache = use_cache and session_id is None
+    if use_cache:
+        hit, query_vector = semantic_cache_lookup(query, namespace)
+        if hit is not None:
+            tracing.current_span().set(cached=True)
+            if on_token is not None:
+                on_token(hit.answer)
+            return hit.answer
+
+    user_msg, query_vector = build_query_message(query, top_k, similarity_threshold, query_vector)
+
+    # Ask the agent
+    if agent is None:
+        with get_resources().sessions.acquire(session_id) as agent:
+            answer = ask_agent(agent, user_msg, on_token)
+    else:
+        answer = ask_agent(agent, user_msg, on_token)
+    if use_cache and query_vector is not None:
+        get_resources().semantic_cache.store(query, query_vector, namespace, answer)
+    return answer
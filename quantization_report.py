@@ -0,0 +1,247 @@
+"""
+Recall-vs-latency report for collection settings (see collection_config.py).
+
+Takes a sample of stored vectors from the collection (or synthetic ones),
+holds some of them out as queries, and compares every combination of
+embedding dimension, quantization and rescoring oversampling against exact
+search at the full stored dimension:
+
+    dim   quant   rescore   recall@k   p50 ms   p95 ms   RAM B/vec
+
+By default each setting is simulated in numpy (int8 scalar quantization at
+the same quantile as Qdrant, binary sign bits compared by Hamming distance,
+then rescoring the oversampled candidates on the truncated float vectors), so
+recall is representative but latencies are brute-force numpy timings. With
+--url every setting is loaded into a temporary collection on a Qdrant server
+and queried through HNSW with the real search parameters.
+
+    python quantization_report.py                       # sample from the configured collection
+    python quantization_report.py --synthetic 20000     # no collection needed
+    python quantization_report.py --url http://localhost:6333 --dims 3072,1024
+"""
+
+import json
+import time
+import uuid
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from collection_config import EMBEDDING_FULL_DIMENSION, SCALAR_QUANTILE, get_collection_config, truncate
+from tracing import percentile
+
+# --- Configuration ---
+REPORT_DIMS = "3072,1536,1024,512,256"
+REPORT_QUANTIZATIONS = "none,scalar,binary"
+REPORT_OVERSAMPLING = "1,2,4"  # Rescoring oversampling factors tried for quantized settings
+REPORT_SAMPLE = 20000  # Stored vectors read from the collection
+REPORT_QUERIES = 200  # Of which held out as queries
+REPORT_TOP_K = 7  # Same as the pipeline's default top_k
+REPORT_UPLOAD_BATCH = 256
+# ---------------------
+
+
+def load_vectors(path: str, collection: str, limit: int) -> np.ndarray:
+    """Up to `limit` stored vectors from a local collection."""
+    from qdrant_client import QdrantClient
+    client = QdrantClient(path=path)
+    vectors, offset = [], None
+    while len(vectors) < limit:
+        points, offset = client.scroll(collection_name=collection, limit=min(1000, limit - len(vectors)),
+                                       offset=offset, with_payload=False, with_vectors=True)
+        vectors.extend(p.vector for p in points)
+        if not offset:
+            break
+    client.close()
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(n: int, dim: int = EMBEDDING_FULL_DIMENSION, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors whose leading components carry most of the signal, like text-embedding-3."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.sqrt(1.0 + np.arange(dim) / 256.0)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    return truncate(vectors * weights, dim)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def ram_bytes(dim: int, quantization: str) -> int:
+    """Bytes per vector kept in RAM (quantized collections keep the originals on disk)."""
+    return {"none": 4 * dim, "scalar": dim, "binary": (dim + 7) // 8}[quantization]
+
+
+class SimulatedIndex:
+    """Brute-force search over quantized vectors with optional rescoring, as Qdrant does it."""
+
+    def __init__(self, base: np.ndarray, quantization: str):
+        self.base = base
+        self.quantization = quantization
+        if quantization == "scalar":
+            lo, hi = np.quantile(base, [(1 - SCALAR_QUANTILE) / 2, (1 + SCALAR_QUANTILE) / 2])
+            self.offset, self.scale = float(lo), float(hi - lo) / 255 or 1.0
+            codes = np.clip(np.rint((base - lo) / self.scale), 0, 255)
+            self.codes = codes.astype(np.uint8).astype(np.float32)  # float for BLAS; values are the uint8 codes (0..255)
+        elif quantization == "binary":
+            self.bits = np.packbits(base > 0, axis=1)
+            self._popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(1).astype(np.int32)
+
+    def approximate(self, q: np.ndarray) -> np.ndarray:
+        if self.quantization == "scalar":
+            return (self.codes @ q) * self.scale + self.offset * q.sum()
+        if self.quantization == "binary":
+            distance = self._popcount[np.bitwise_xor(self.bits, np.packbits(q > 0))].sum(1)
+            return -distance.astype(np.float32)
+        return self.base @ q
+
+    def search(self, q: np.ndarray, k: int, oversampling: Optional[float]) -> np.ndarray:
+        scores = self.approximate(q)
+        if self.quantization == "none" or not oversampling:
+            return top_k(scores[None, :], k)[0]
+        candidates = top_k(scores[None, :], int(np.ceil(k * oversampling)))[0]
+        rescored = self.base[candidates] @ q
+        return candidates[np.argsort(-rescored)[:k]]
+
+
+def settings(dims: Sequence[int], quantizations: Sequence[str], oversampling: Sequence[float]):
+    """(dim, quantization, oversampling or None for no rescoring) combinations to measure."""
+    for dim in dims:
+        for quantization in quantizations:
+            if quantization == "none":
+                yield dim, quantization, None
+                continue
+            yield dim, quantization, None
+            for factor in oversampling:
+                yield dim, quantization, factor
+
+
+def simulate(base: np.ndarray, queries: np.ndarray, truth: np.ndarray, combos, k: int) -> List[dict]:
+    rows, indexes = [], {}
+    for dim, quantization, factor in combos:
+        key = (dim, quantization)
+        if key not in indexes:
+            indexes.clear()  # One index at a time keeps memory flat
+            indexes[key] = SimulatedIndex(truncate(base, dim), quantization)
+        index, q = indexes[key], truncate(queries, dim)
+        found, latencies = [], []
+        for vector in q:
+            started = time.perf_counter()
+            found.append(index.search(vector, k, factor))
+            latencies.append(time.perf_counter() - started)
+        rows.append(row(dim, quantization, factor, recall(np.asarray(found), truth), latencies))
+    return rows
+
+
+def live(url: str, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, combos, k: int) -> List[dict]:
+    """Measure each setting on a Qdrant server, in temporary collections."""
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+    client = QdrantClient(url=url)
+    rows, loaded = [], None
+    try:
+        for dim, quantization, factor in combos:
+            config = get_collection_config().with_options(
+                name=f"quantization_report_{uuid.uuid4().hex[:8]}", dimension=dim, quantization=quantization,
+                rescore=factor is not None, oversampling=factor or 1.0)
+            if loaded is None or loaded[0] != (dim, quantization):
+                if loaded is not None:
+                    client.delete_collection(loaded[1])
+                config.create_collection(client)
+                vectors = truncate(base, dim)
+                for start in range(0, len(vectors), REPORT_UPLOAD_BATCH):
+                    client.upsert(config.name, wait=True, points=[
+                        models.PointStruct(id=i, vector=vectors[i].tolist())
+                        for i in range(start, min(start + REPORT_UPLOAD_BATCH, len(vectors)))
+                    ])
+                loaded = ((dim, quantization), config.name)
+            params = config.search_params()
+            found, latencies = [], []
+            for vector in truncate(queries, dim):
+                started = time.perf_counter()
+                points = client.query_points(loaded[1], query=vector.tolist(), limit=k, search_params=params).points
+                latencies.append(time.perf_counter() - started)
+                found.append([p.id for p in points])
+            rows.append(row(dim, quantization, factor, recall(np.asarray(found), truth), latencies))
+    finally:
+        if loaded is not None:
+            client.delete_collection(loaded[1])
+    return rows
+
+
+def row(dim: int, quantization: str, factor: Optional[float], rec: float, latencies: List[float]) -> dict:
+    return {
+        "dim": dim,
+        "quantization": quantization,
+        "rescore": None if quantization == "none" else (factor or 0),
+        "recall": round(rec, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "ram_bytes": ram_bytes(dim, quantization),
+    }
+
+
+def split(vectors: np.ndarray, queries: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.random.default_rng(seed).permutation(len(vectors))
+    return vectors[order[queries:]], vectors[order[:queries]]
+
+
+def format_report(rows: List[dict], k: int, mode: str) -> str:
+    lines = [f"{'dim':>6}{'quant':>8}{'rescore':>9}{f'recall@{k}':>11}{'p50 ms':>9}{'p95 ms':>9}{'RAM B/vec':>11}"]
+    for r in rows:
+        rescore = "-" if r["rescore"] is None else ("off" if not r["rescore"] else "x%g" % r["rescore"])
+        lines.append(f"{r['dim']:>6}{r['quantization']:>8}{rescore:>9}{r['recall']:>11.3f}"
+                     f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['ram_bytes']:>11}")
+    if mode == "simulated":
+        lines.append("Latencies are brute-force numpy timings; use --url for HNSW latencies on a Qdrant server.")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    config = get_collection_config()
+    parser = argparse.ArgumentParser(description="Recall vs latency of embedding dimension and quantization settings")
+    parser.add_argument("--qdrant_path", default=config.path)
+    parser.add_argument("--collection", default=config.name)
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic vectors instead of the collection")
+    parser.add_argument("--sample", type=int, default=REPORT_SAMPLE, help="Stored vectors to read")
+    parser.add_argument("--queries", type=int, default=REPORT_QUERIES, help="Held-out vectors used as queries")
+    parser.add_argument("--top_k", type=int, default=REPORT_TOP_K)
+    parser.add_argument("--dims", default=REPORT_DIMS)
+    parser.add_argument("--quantizations", default=REPORT_QUANTIZATIONS)
+    parser.add_argument("--oversampling", default=REPORT_OVERSAMPLING)
+    parser.add_argument("--url", help="Qdrant server to measure on (temporary collections are created and dropped)")
+    parser.add_argument("--json", help="Also write the rows to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic + args.queries)
+    else:
+        vectors = load_vectors(args.qdrant_path, args.collection, args.sample)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, got {len(vectors)}")
+    base, queries = split(vectors, args.queries)
+    full_dim = vectors.shape[1]
+    dims = [d for d in (int(x) for x in args.dims.split(",")) if d <= full_dim]
+    combos = list(settings(dims, args.quantizations.split(","), [float(x) for x in args.oversampling.split(",")]))
+    truth = top_k(queries @ base.T, args.top_k)  # Exact search at the stored dimension
+    print(f"{len(base)} vectors of {full_dim} dims, {len(queries)} queries, {len(combos)} settings")
+    if args.url:
+        rows, mode = live(args.url, base, queries, truth, combos, args.top_k), "live"
+    else:
+        rows, mode = simulate(base, queries, truth, combos, args.top_k), "simulated"
+    print(format_report(rows, args.top_k, mode))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "vectors": len(base), "queries": len(queries), "rows": rows}, f, indent=2)
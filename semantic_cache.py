@@ -0,0 +1,187 @@
+"""
+Semantic cache of pipeline answers.
+
+A question is served from the cache when its embedding has cosine similarity
+of at least `threshold` with a previously answered question in the same
+namespace (answer-only vs. answer + execution, and the retrieval parameters).
+Entries expire after `ttl_seconds`, the least recently used ones are evicted
+beyond `max_entries`, and everything is dropped when the collection
+generation (a fingerprint of the vector collection) changes. Entries are
+mirrored to a small SQLite file so one-shot CLI runs benefit too; set
+SEMANTIC_CACHE_PATH to an empty string for a purely in-memory cache.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+# --- Configuration ---
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") not in ("0", "false", "False")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # Cosine similarity for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))  # Seconds
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.sqlite")
+# ---------------------
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    namespace: str
+    answer: str
+    execution: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class SemanticCache:
+    """Similarity-keyed answer cache with TTL, LRU eviction and generation-based invalidation."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL,
+        path: Optional[str] = SEMANTIC_CACHE_PATH,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation: Any = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._vectors: Dict[int, np.ndarray] = {}
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None  # Stacked vectors, rebuilt lazily after changes
+        self._matrix_ids: Sequence[int] = ()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY, query TEXT, namespace TEXT, answer TEXT,"
+                " execution TEXT, created REAL, vector BLOB)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self.generation = json.loads(row[0]) if row else None
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (cutoff,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, query, namespace, answer, execution, created, vector FROM entries ORDER BY id DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for entry_id, query, namespace, answer, execution, created, blob in reversed(rows):
+            self._entries[entry_id] = CacheEntry(query, namespace, answer, execution, created)
+            self._vectors[entry_id] = np.frombuffer(blob, dtype=np.float32)
+            self._next_id = entry_id + 1
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def set_generation(self, generation: Any):
+        """Drop every entry if the underlying collection changed since the last call."""
+        generation = json.loads(json.dumps(generation))  # Same shape as after a round trip through disk
+        with self._lock:
+            if generation != self.generation:
+                if self.generation is not None and self._entries:
+                    print(f"Semantic cache: collection changed, dropping {len(self._entries)} entries")
+                self._clear()
+                self.generation = generation
+                if self._conn is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (json.dumps(generation),)
+                    )
+                    self._conn.commit()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._vectors.clear()
+        self._matrix = None
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def _remove(self, entry_id: int):
+        self._entries.pop(entry_id, None)
+        self._vectors.pop(entry_id, None)
+        self._matrix = None
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            self._conn.commit()
+
+    def lookup(self, vector: Sequence[float], namespace: str) -> Optional[CacheEntry]:
+        """Closest live entry in `namespace` above the similarity threshold, or None."""
+        q = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            expired = [i for i, e in self._entries.items() if now - e.created > self.ttl_seconds]
+            for i in expired:
+                self._remove(i)
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_ids = list(self._vectors)
+                    self._matrix = np.stack([self._vectors[i] for i in self._matrix_ids])
+                scores = self._matrix @ q
+                for pos in np.argsort(-scores):
+                    if scores[pos] < self.threshold:
+                        break
+                    entry_id = self._matrix_ids[pos]
+                    entry = self._entries[entry_id]
+                    if entry.namespace == namespace:
+                        self._entries.move_to_end(entry_id)
+                        entry.hits += 1
+                        self.hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def store(self, query: str, vector: Sequence[float], namespace: str, answer: str, execution: Optional[str] = None):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = CacheEntry(query=query, namespace=namespace, answer=answer, execution=execution)
+            self._entries[entry_id] = entry
+            self._vectors[entry_id] = self._normalize(vector)
+            self._matrix = None
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (id, query, namespace, answer, execution, created, vector)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry_id, query, namespace, answer, execution, entry.created, self._vectors[entry_id].tobytes()),
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
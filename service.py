@@ -0,0 +1,410 @@
+"""
+Long-running HTTP service in front of the pipeline.
+
+One process keeps the clients, agents and caches in pipeline.get_resources()
+warm and serves many users concurrently:
+
+    POST /answer   {"query": ..., "top_k": 7, "similarity_threshold": 0.2,
+                    "use_cache": true, "session_id": null}
+    POST /execute  same body; also runs the generated script
+                   add "stream": true for newline-delimited JSON events:
+                   {"token": ...} as the LLM writes, then the response;
+                   "candidates": N races N generated scripts
+    GET  /health   pipeline, session and coalescing counters
+    GET  /metrics  stage latencies, cache hits and token counts (Prometheus text)
+
+The blocking pipeline runs on a thread pool behind a semaphore of
+SERVICE_CONCURRENCY runs; beyond SERVICE_MAX_QUEUE waiting requests the
+service answers 503. Identical in-flight questions without a session ID are
+coalesced, so they share one pipeline run and one answer. With tracing on
+(--trace or TRACING_ENABLED=1) every request gets an ID, taken from the
+X-Request-ID header or generated, and echoed back in the response.
+
+    python service.py --port 8080
+    python service.py --stand_ins --latency 0.05   # no OpenAI / Qdrant / Neo4j needed
+"""
+
+import asyncio
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import tracing
+from executor import answer_and_execute, execution_summary
+from pipeline import KG_BACKEND, answer_vlsi_query, get_resources
+
+# --- Configuration ---
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_CONCURRENCY = int(os.getenv("SERVICE_CONCURRENCY", "16"))  # Pipeline runs at once
+SERVICE_MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", "256"))  # Requests waiting for a slot before 503
+MAX_BODY_BYTES = 1024 * 1024
+KEEPALIVE_TIMEOUT = 30.0  # Seconds an idle connection is kept open
+# ---------------------
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = ""):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class QueryService:
+    """Concurrency limit and request coalescing around the pipeline entry points."""
+
+    def __init__(self, concurrency: int = SERVICE_CONCURRENCY, max_queue: int = SERVICE_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pipeline")
+        self._slots: Optional[asyncio.Semaphore] = None  # Created on the serving loop
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.waiting = self.running = 0
+        self.requests = self.coalesced = self.rejected = self.failed = 0
+        self.started = time.time()
+
+    @staticmethod
+    def parse_params(body: Dict[str, Any]) -> Dict[str, Any]:
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'query' must be a non-empty string")
+        try:
+            return {
+                "query": query,
+                "top_k": int(body.get("top_k", 7)),
+                "similarity_threshold": float(body.get("similarity_threshold", 0.2)),
+                "use_cache": bool(body.get("use_cache", True)),
+                "session_id": body.get("session_id"),
+                "stream": bool(body.get("stream", False)),
+                "candidates": max(1, int(body.get("candidates", 1))),
+            }
+        except (TypeError, ValueError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        """Run blocking `fn` on the pool once a concurrency slot is free."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "too many queued requests")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, tracing.bind(fn))
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def _coalesced(self, key: Optional[Tuple], fn: Callable[[], Any]) -> Any:
+        """Share one run of `fn` between concurrent requests with the same key."""
+        if key is None:
+            return await self._run(fn)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run(fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so waiter-less failures aren't logged
+            raise
+        finally:
+            del self._inflight[key]
+
+    @staticmethod
+    def coalesce_key(kind: str, params: Dict[str, Any]) -> Optional[Tuple]:
+        if params["session_id"] is not None:
+            return None  # Conversations carry their own state
+        return (kind, " ".join(params["query"].lower().split()), params["top_k"],
+                params["similarity_threshold"], params["use_cache"], params["candidates"])
+
+    async def answer(self, params: Dict[str, Any]):
+        fn = functools.partial(
+            answer_vlsi_query,
+            params["query"],
+            top_k=params["top_k"],
+            similarity_threshold=params["similarity_threshold"],
+            use_cache=params["use_cache"],
+            session_id=params["session_id"],
+        )
+        if params["stream"]:
+            return self._stream(fn, lambda answer: {"answer": answer})
+        return {"answer": await self._coalesced(self.coalesce_key("answer", params), fn)}
+
+    async def execute(self, params: Dict[str, Any]):
+        fn = functools.partial(
+            answer_and_execute,
+            params["query"],
+            top_k=params["top_k"],
+            similarity_threshold=params["similarity_threshold"],
+            use_cache=params["use_cache"],
+            session_id=params["session_id"],
+            verbose=False,
+            candidates=params["candidates"],
+        )
+        if params["stream"]:
+            return self._stream(fn, self._execute_response)
+        record = await self._coalesced(self.coalesce_key("execute", params), fn)
+        return self._execute_response(record)
+
+    @staticmethod
+    def _execute_response(record: Dict[str, Any]) -> Dict[str, Any]:
+        response = {"answer": record["answer"], "code": record["code"], "cached": record["cached"]}
+        if record["execution"] is not None:
+            response["execution"] = execution_summary(record["execution"])
+            response["output"] = record["execution"].format()
+        elif record.get("cached_output") is not None:
+            response["output"] = record["cached_output"]
+        if "timings" in record:
+            response["timings"] = {k: round(v, 3) for k, v in record["timings"].items()}
+        if "speculation" in record:
+            response["speculation"] = record["speculation"]
+        return response
+
+    def _stream(self, fn: Callable[..., Any], respond: Callable[[Any], Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run `fn(on_token=...)` and return an async iterator of events:
+        {"token": ...} for each piece of LLM output, then the final response
+        with "done": true (or {"error": ...}). Streams are never coalesced.
+        """
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "too many queued requests")
+        loop = asyncio.get_running_loop()
+        tokens: "asyncio.Queue[str]" = asyncio.Queue()
+        on_token = functools.partial(loop.call_soon_threadsafe, tokens.put_nowait)
+        task = asyncio.ensure_future(self._run(functools.partial(fn, on_token=on_token)))
+
+        async def events():
+            while True:
+                getter = asyncio.ensure_future(tokens.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield {"token": getter.result()}
+                    continue
+                getter.cancel()
+                break
+            # Tokens are queued before the run completes; drain what is left.
+            while not tokens.empty():
+                yield {"token": tokens.get_nowait()}
+            try:
+                yield {"done": True, **respond(task.result())}
+            except Exception as e:
+                self.failed += 1
+                yield {"error": f"{type(e).__name__}: {e}"}
+
+        return events()
+
+    def health(self) -> Dict[str, Any]:
+        res = get_resources()
+        stats = {
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "running": self.running,
+            "waiting": self.waiting,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+        if res.is_built("sessions"):
+            stats["sessions"] = res.sessions.stats()
+        if res.is_built("semantic_cache"):
+            stats["semantic_cache"] = res.semantic_cache.stats()
+        return stats
+
+    async def dispatch(self, method: str, path: str, body: bytes):
+        """A JSON-able response, or an async iterator of events for streamed requests."""
+        routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            ("POST", "/answer"): self.answer,
+            ("POST", "/execute"): self.execute,
+        }
+        if (method, path) == ("GET", "/health"):
+            return self.health()
+        if (method, path) == ("GET", "/metrics"):
+            return tracing.render_prometheus()
+        handler = routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in routes) or path in ("/health", "/metrics"):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+        self.requests += 1
+        return await handler(self.parse_params(payload))
+
+    def warm(self):
+        """Build the shared clients up front so the first requests don't pay for it."""
+        res = get_resources()
+        names = ["embedding", "vector_store", "lexical_index", "semantic_cache", "sessions"]
+        names.append("graph_store" if KG_BACKEND == "snapshot" else "n4j")
+        for name in names:
+            try:
+                getattr(res, name)
+            except Exception as e:
+                print(f"Warning: could not warm '{name}' ({type(e).__name__}: {e})")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Parse one HTTP/1.1 request; None on a cleanly closed connection."""
+    line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+def _extra_headers(request_id: Optional[str]) -> str:
+    return f"X-Request-ID: {request_id}\r\n" if request_id else ""
+
+
+def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Any, keep_alive: bool,
+                   request_id: Optional[str] = None):
+    """JSON response; a str payload (e.g. /metrics) is sent as plain text."""
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"{_extra_headers(request_id)}"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+async def write_stream(writer: asyncio.StreamWriter, events: AsyncIterator[Dict[str, Any]], keep_alive: bool,
+                       request_id: Optional[str] = None):
+    """Send `events` as newline-delimited JSON using chunked transfer encoding."""
+    head = (
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+        "Transfer-Encoding: chunked\r\n"
+        f"{_extra_headers(request_id)}"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1"))
+    async for event in events:
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+        await writer.drain()
+    writer.write(b"0\r\n\r\n")
+
+
+async def handle_connection(service: QueryService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            except HTTPError as e:
+                write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+            request_id = headers.get("x-request-id") or None
+            with tracing.request("http", request_id=request_id, method=method, path=path) as sp:
+                request_id = tracing.request_id() or request_id
+                try:
+                    status, payload = HTTPStatus.OK, await service.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    service.failed += 1
+                    print(f"Error handling {method} {path}: {type(e).__name__}: {e}")
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+                sp.set(http_status=status.value)
+            # Only known routes become label values, so scanners can't blow up the series count.
+            route = path if path in ("/answer", "/execute", "/health", "/metrics") else "other"
+            tracing.count("http_requests_total", path=route, status=str(status.value))
+            if isinstance(payload, AsyncIterator):
+                await write_stream(writer, payload, keep_alive, request_id)
+            else:
+                write_response(writer, status, payload, keep_alive, request_id)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, service: Optional[QueryService] = None,
+                warm: bool = True):
+    service = service or QueryService()
+    if warm:
+        await asyncio.get_running_loop().run_in_executor(None, service.warm)
+    server = await asyncio.start_server(functools.partial(handle_connection, service), host, port)
+    print(f"Serving on http://{host}:{port} (concurrency {service.concurrency})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the VLSI pipeline over HTTP")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--concurrency", type=int, default=SERVICE_CONCURRENCY,
+                        help="Pipeline runs executed at once")
+    parser.add_argument("--stand_ins", action="store_true",
+                        help="Use local stand-ins instead of OpenAI, Qdrant and Neo4j")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Simulated per-call latency of the stand-ins, in seconds")
+    parser.add_argument("--no_warm", action="store_true", help="Build clients lazily on first use")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage metrics for GET /metrics")
+    parser.add_argument("--trace_log", help="Also write trace spans as JSONL to this file ('-' for stderr)")
+    args = parser.parse_args()
+
+    if args.trace or args.trace_log:
+        tracing.enable(args.trace_log)
+
+    if args.stand_ins:
+        import stand_ins
+        stand_ins.install(latency=args.latency)
+    try:
+        asyncio.run(serve(args.host, args.port, QueryService(args.concurrency), warm=not args.no_warm))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,183 @@
+"""
+Pool of per-session ChatAgents.
+
+Each conversation gets its own agent instead of every query piling onto one
+global history. Agents are built with a bounded memory window (see
+PipelineResources.make_chat_agent), sessions idle for longer than
+SESSION_IDLE_TTL are evicted by a background sweeper, and requests without
+a session ID borrow a reset agent from a free list so they pay neither agent
+construction nor someone else's history.
+"""
+
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# --- Configuration ---
+SESSION_MESSAGE_WINDOW = int(os.getenv("SESSION_MESSAGE_WINDOW", "10"))  # Messages kept in agent memory; 0 = unbounded
+SESSION_TOKEN_LIMIT = int(os.getenv("SESSION_TOKEN_LIMIT", "0"))  # Token cap on agent memory; 0 = model default
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))  # Seconds before an idle session is evicted
+SESSION_MAX = int(os.getenv("SESSION_MAX", "256"))  # Live sessions kept; least recently used evicted beyond this
+SESSION_FREE_AGENTS = 8  # Reset agents kept for anonymous requests
+SESSION_SWEEP_INTERVAL = 60.0  # Seconds between idle-eviction sweeps
+# ---------------------
+
+
+class Session:
+    __slots__ = ("session_id", "agent", "lock", "created", "last_used", "turns")
+
+    def __init__(self, session_id: str, agent: Any):
+        self.session_id = session_id
+        self.agent = agent
+        self.lock = threading.Lock()  # One request at a time per conversation
+        self.created = self.last_used = time.monotonic()
+        self.turns = 0
+
+
+class SessionPool:
+    """
+    Maps session IDs to agents built by `factory`. Use `acquire(session_id)`
+    as a context manager; `session_id=None` gives a one-off conversation.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_sessions: int = SESSION_MAX,
+        free_agents: int = SESSION_FREE_AGENTS,
+    ):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.free_agents = free_agents
+        self._sessions: Dict[str, Session] = {}
+        self._free: List[Any] = []
+        self._lock = threading.Lock()
+        self.created = self.evicted = self.reused = 0
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def new_session_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def _take_agent(self):
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.created += 1
+        return self.factory()
+
+    def _recycle(self, agent):
+        """Clear an agent's history and keep it for the next anonymous request."""
+        try:
+            agent.reset()
+        except Exception:
+            return
+        with self._lock:
+            if len(self._free) < self.free_agents:
+                self._free.append(agent)
+
+    def _session(self, session_id: str) -> Session:
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, None)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    # Evict the least recently used session that isn't busy.
+                    idle = [s for s in self._sessions.values() if s is not session and not s.lock.locked()]
+                    if not idle:
+                        break
+                    oldest = min(idle, key=lambda s: s.last_used)
+                    evicted.append(self._sessions.pop(oldest.session_id))
+            session.last_used = time.monotonic()
+        self.evicted += len(evicted)
+        for old in evicted:
+            if old.agent is not None:
+                self._recycle(old.agent)
+        return session
+
+    @contextmanager
+    def acquire(self, session_id: Optional[str] = None):
+        """Yield the session's agent, holding the session for the duration of the request."""
+        if session_id is None:
+            agent = self._take_agent()
+            try:
+                yield agent
+            finally:
+                self._recycle(agent)
+            return
+        while True:
+            session = self._session(session_id)
+            session.lock.acquire()
+            if self._sessions.get(session_id) is session:
+                break
+            # Evicted while we waited for it; start over with a live session.
+            session.lock.release()
+        try:
+            if session.agent is None:
+                session.agent = self._take_agent()
+            try:
+                yield session.agent
+            finally:
+                session.turns += 1
+                session.last_used = time.monotonic()
+        finally:
+            session.lock.release()
+
+    def end(self, session_id: str) -> bool:
+        """Drop a session explicitly; its agent is reset and reused."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        with session.lock:
+            if session.agent is not None:
+                self._recycle(session.agent)
+        return True
+
+    def evict_idle(self) -> int:
+        """Remove sessions idle for longer than idle_ttl. Returns how many were evicted."""
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            stale = [s for s in self._sessions.values() if s.last_used < cutoff and not s.lock.locked()]
+            for s in stale:
+                del self._sessions[s.session_id]
+        for s in stale:
+            if s.agent is not None:
+                self._recycle(s.agent)
+        self.evicted += len(stale)
+        return len(stale)
+
+    def start_sweeper(self, interval: float = SESSION_SWEEP_INTERVAL):
+        """Run evict_idle() every `interval` seconds in a daemon thread."""
+        if self._sweeper is not None or interval <= 0 or self.idle_ttl <= 0:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                evicted = self.evict_idle()
+                if evicted:
+                    print(f"Evicted {evicted} idle session(s); {len(self._sessions)} live")
+
+        self._sweeper = threading.Thread(target=loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "free_agents": len(self._free),
+                "agents_created": self.created,
+                "agents_reused": self.reused,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,222 @@
+"""
+Speculative execution: several candidate scripts at once, first success wins.
+
+Retrieval runs once; then N candidates are generated in parallel, each in its
+own one-off conversation and at its own temperature. Every candidate's
+script starts in an isolated subprocess as soon as its closing fence streams
+in. The first one whose script exits cleanly wins (a reply without a script
+cannot win). The other candidates' generations
+are stopped and their processes killed, and only the winner's conversation
+gets the executor follow-up. When every candidate fails, the first
+candidate whose script ran has its failure reported back to the LLM as usual.
+
+Each run appends one line to SPECULATION_LOG (winner, temperature, timings,
+exit codes), so N and the temperature spread can be tuned from real data.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import tracing
+from bounded_exec import ExecLimits, ExecutionResult
+from executor import extract_python_code, run_code
+from pipeline import CHAT_TEMPERATURE, ask_agent, build_query_message, get_resources, semantic_cache_lookup
+from streaming import FenceWatcher, stream_step
+
+# --- Configuration ---
+SPECULATIVE_CANDIDATES = int(os.getenv("SPECULATIVE_CANDIDATES", "3"))
+SPECULATIVE_MAX_TEMPERATURE = float(os.getenv("SPECULATIVE_MAX_TEMPERATURE", "0.9"))
+SPECULATION_LOG = os.getenv("SPECULATION_LOG", "speculation_log.jsonl")  # Empty string disables the log
+# ---------------------
+
+_log_lock = threading.Lock()
+
+
+@dataclass
+class Candidate:
+    index: int
+    temperature: float
+    reply: str = ""
+    code: Optional[str] = None
+    result: Optional[ExecutionResult] = None
+    error: Optional[str] = None
+    generated_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancelled: bool = False
+    final: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.code is not None and self.result is not None and self.result.ok
+
+
+def candidate_temperatures(n: int, low: float = CHAT_TEMPERATURE, high: float = SPECULATIVE_MAX_TEMPERATURE) -> List[float]:
+    """The first candidate uses the normal temperature; the rest spread up to `high`."""
+    if n <= 1:
+        return [low]
+    return [round(low + (high - low) * i / (n - 1), 3) for i in range(n)]
+
+
+def log_speculation(entry: dict):
+    if not SPECULATION_LOG:
+        return
+    with _log_lock, open(SPECULATION_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def speculative_execute(
+    user_query: str,
+    candidates: int = SPECULATIVE_CANDIDATES,
+    top_k: int = 7,
+    similarity_threshold: float = 0.2,
+    use_cache: bool = True,
+    exec_limits: ExecLimits = None,
+    verbose: bool = True
+) -> dict:
+    """
+    answer_and_execute() with `candidates` scripts raced against each other.
+    Returns the same record, plus "speculation": which candidate won, at what
+    temperature, after how long, and how the others ended.
+    """
+    from camel.messages import BaseMessage
+
+    record = {"answer": None, "code": None, "execution": None, "cached": False}
+    namespace = f"execute:{top_k}:{similarity_threshold}"
+    query_vector = None
+    if use_cache:
+        hit, query_vector = semantic_cache_lookup(user_query, namespace)
+        if hit is not None:
+            if verbose and hit.execution is not None:
+                print("=== Cached execution output ===\n", hit.execution, "\n=== End output ===\n")
+            record.update(answer=hit.answer, cached=True, cached_output=hit.execution)
+            return record
+    cache = get_resources().semantic_cache if query_vector is not None else None
+
+    started = time.perf_counter()
+    user_msg, query_vector = build_query_message(user_query, top_k, similarity_threshold, query_vector)
+    cancel = threading.Event()
+    decided = threading.Event()
+    finished: "queue.Queue[Candidate]" = queue.Queue()
+    pool = [Candidate(i, t) for i, t in enumerate(candidate_temperatures(candidates))]
+    choice = {}
+
+    def race(candidate: Candidate):
+        with get_resources().sessions.acquire(None) as agent:
+            running = {}
+
+            def start(code):
+                candidate.generated_at = time.perf_counter() - started
+                running["thread"] = threading.Thread(target=tracing.bind(execute), args=(code,), daemon=True)
+                running["thread"].start()
+
+            def execute(code):
+                try:
+                    candidate.result = run_code(code, use_openroad=True, use_pool=False,
+                                                limits=exec_limits, cancel_event=cancel)
+                except Exception as e:
+                    candidate.error = f"{type(e).__name__}: {e}"
+
+            try:
+                watcher = FenceWatcher(start)
+                candidate.reply = stream_step(agent, user_msg, watcher.feed,
+                                              temperature=candidate.temperature, cancel_event=cancel)
+                candidate.code = watcher.code or extract_python_code(candidate.reply)
+                if candidate.code is None or cancel.is_set():
+                    candidate.generated_at = candidate.generated_at or time.perf_counter() - started
+                elif "thread" not in running:
+                    start(candidate.code)
+                if "thread" in running:
+                    running["thread"].join()
+            except Exception as e:
+                candidate.error = f"{type(e).__name__}: {e}"
+            candidate.cancelled = cancel.is_set() and choice.get("winner") is not candidate
+            candidate.finished_at = time.perf_counter() - started
+            finished.put(candidate)
+            # Keep the conversation until we know whether this candidate gets the follow-up.
+            decided.wait()
+            if choice.get("winner") is candidate and "followup" in choice:
+                try:
+                    candidate.final = ask_agent(agent, choice["followup"])
+                except Exception as e:
+                    candidate.error = f"{type(e).__name__}: {e}"
+                finished.put(candidate)
+
+    threads = [threading.Thread(target=tracing.bind(race), args=(c,), daemon=True) for c in pool]
+    for t in threads:
+        t.start()
+
+    done: List[Candidate] = []
+    winner = None
+    while len(done) < len(pool):
+        candidate = finished.get()
+        done.append(candidate)
+        if candidate.succeeded:
+            winner = candidate
+            break
+    if winner is None:
+        # Nothing worked: report the first script that ran, else the first that was written, else any reply.
+        winner = (next((c for c in pool if c.result is not None and c.error is None), None)
+                  or next((c for c in pool if c.code is not None and c.error is None), None)
+                  or pool[0])
+    choice["winner"] = winner
+    cancel.set()
+    time_to_winner = winner.finished_at
+
+    if winner.code is not None and winner.result is not None:
+        out = winner.result.format()
+        choice["followup"] = BaseMessage.make_user_message(
+            role_name="Executor",
+            content=f"I ran your Python block under `openroad -python` and got:\n```\n{out}\n```"
+        )
+    decided.set()
+    if "followup" in choice:
+        finished_winner = finished.get()
+        while finished_winner is not winner:
+            finished_winner = finished.get()
+        final = winner.final
+    else:
+        out = None
+        final = winner.reply if winner.error is None else None
+    for t in threads:
+        t.join(timeout=5)
+    if final is None:
+        raise RuntimeError(f"speculative run failed: {winner.error}")
+
+    record.update(answer=final, code=winner.code, execution=winner.result)
+    record["speculation"] = {
+        "candidates": len(pool),
+        "winner": winner.index,
+        "temperature": winner.temperature,
+        "succeeded": winner.succeeded,
+        "time_to_winner": round(time_to_winner, 3),
+        "total": round(time.perf_counter() - started, 3),
+        "outcomes": [
+            {
+                "index": c.index,
+                "temperature": c.temperature,
+                "has_code": c.code is not None,
+                "exit_code": c.result.exit_code if c.result else None,
+                "cancelled": c.cancelled or (c.result is not None and c.result.cancelled),
+                "error": c.error,
+            }
+            for c in pool
+        ],
+    }
+    tracing.current_span().set(candidates=len(pool), winner=winner.index, succeeded=winner.succeeded)
+    log_speculation({"query": user_query, "time": time.time(), **record["speculation"]})
+    if verbose:
+        status = "succeeded" if winner.succeeded else "failed (all candidates failed)"
+        print(f"Candidate {winner.index} of {len(pool)} (temperature {winner.temperature}) {status} "
+              f"after {time_to_winner:.2f}s; {sum(1 for c in pool if c.cancelled)} others stopped")
+        if winner.code is not None:
+            print("=== Winning Python code ===\n", winner.code, "\n=== End code ===\n")
+            print("=== Execution output ===\n", out, "\n=== End output ===\n")
+
+    if cache is not None and winner.succeeded:
+        cache.store(user_query, query_vector, namespace, final, execution=out)
+    return record
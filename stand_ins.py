@@ -0,0 +1,273 @@
+"""
+Local stand-ins for the pipeline's external services.
+
+They mimic just enough of the CAMEL / Qdrant / Neo4j / OpenAI interfaces the
+pipeline uses (embed, vector query, Cypher neighbourhood lookups, ChatAgent
+step/reset) to run it end to end with no network access and no API keys:
+deterministic hash embeddings, an in-memory vector store, a graph backed by
+GraphSnapshot, and a canned chat agent. An optional latency per call makes
+them useful for load testing the service and the benchmark.
+
+    import stand_ins
+    stand_ins.install(latency=0.05)   # before the first query
+"""
+
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# --- Configuration ---
+STAND_IN_DIM = 256
+STREAM_PIECE_CHARS = 8  # Reply characters per streamed "token"
+SAMPLE_DOCS = [
+    "OpenROAD global placement uses RePlAce to spread cells while minimizing wirelength.",
+    "Clock tree synthesis in OpenROAD is performed by TritonCTS after placement.",
+    "Detailed routing with TritonRoute produces DRC-clean routes on the metal layers.",
+    "Static timing analysis with OpenSTA reports setup and hold slack per path.",
+    "Floorplanning defines the die area, core area, IO pin placement and macro locations.",
+    "Power distribution networks are generated with pdngen using straps and rings.",
+    "Yosys synthesizes RTL Verilog into a gate-level netlist for the target library.",
+    "Antenna violations are repaired by inserting diodes during detailed routing.",
+]
+SAMPLE_EDGES = [
+    ("OpenROAD", "USES", "RePlAce"),
+    ("OpenROAD", "USES", "TritonCTS"),
+    ("OpenROAD", "USES", "TritonRoute"),
+    ("OpenROAD", "USES", "OpenSTA"),
+    ("RePlAce", "PERFORMS", "global placement"),
+    ("TritonCTS", "PERFORMS", "clock tree synthesis"),
+    ("TritonRoute", "PERFORMS", "detailed routing"),
+    ("OpenSTA", "PERFORMS", "static timing analysis"),
+    ("Yosys", "PRODUCES", "netlist"),
+]
+SCRIPT_REPLY = (
+    "```python\n"
+    "import sys\n"
+    "print('stand-in flow: synthesis -> placement -> cts -> routing -> gds')\n"
+    "```\n"
+    "The script runs the whole flow in order and writes the final layout."
+)
+# ---------------------
+
+
+def _sleep(latency: float):
+    if latency > 0:
+        time.sleep(latency)
+
+
+def hash_vector(text: str, dim: int = STAND_IN_DIM) -> List[float]:
+    """Deterministic unit vector built from hashed word tokens (similar texts → similar vectors)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    return (vec / norm if norm else vec).tolist()
+
+
+class StandInEmbedding:
+    """Drop-in for the CAMEL embedding: embed / embed_list / get_output_dim."""
+
+    def __init__(self, dim: int = STAND_IN_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def embed_list(self, objs: Sequence[str], **kwargs) -> List[List[float]]:
+        self.calls += 1
+        _sleep(self.latency)
+        return [hash_vector(o, self.dim) for o in objs]
+
+    def embed(self, obj: str, **kwargs) -> List[float]:
+        return self.embed_list([obj])[0]
+
+    def get_output_dim(self) -> int:
+        return self.dim
+
+
+class StandInVectorStore:
+    """In-memory stand-in for QdrantStorage.query / status."""
+
+    def __init__(self, docs: Sequence[str], embedding: StandInEmbedding, latency: float = 0.0):
+        self.latency = latency
+        self.records = [
+            SimpleNamespace(id=f"doc-{i}", payload={"text": text}, vector=vector)
+            for i, (text, vector) in enumerate(zip(docs, embedding.embed_list(list(docs))))
+        ]
+        self._matrix = np.asarray([r.vector for r in self.records], dtype=np.float32).reshape(len(self.records), -1)
+
+    def query(self, query) -> list:
+        _sleep(self.latency)
+        if not self.records:
+            return []
+        scores = self._matrix @ np.asarray(query.query_vector, dtype=np.float32)
+        top = np.argsort(-scores)[:query.top_k]
+        return [SimpleNamespace(record=self.records[i], similarity=float(scores[i])) for i in top]
+
+    def status(self):
+        return SimpleNamespace(vector_count=len(self.records), vector_dim=self._matrix.shape[1])
+
+
+class StandInGraph:
+    """
+    Stand-in for Neo4jGraph.query, answering the few Cypher statements the
+    pipeline issues (node IDs, neighbourhood lookup, full edge dump).
+    """
+
+    def __init__(self, edges: Sequence[Tuple[str, str, str]], latency: float = 0.0):
+        from graph_snapshot import GraphSnapshot
+        self.edges = list(edges)
+        self.snapshot = GraphSnapshot.from_edges(self.edges)
+        self.latency = latency
+
+    def query(self, query: str, params: Optional[dict] = None) -> List[dict]:
+        _sleep(self.latency)
+        params = params or {}
+        if "$ids" in query:
+            descs = self.snapshot.expand(params.get("ids", []), hops=1, limit_per_node=params.get("limit", 25))
+            return [{"desc": d} for d in descs]
+        if "RETURN n.id AS src" in query:
+            return [{"src": s, "rel": r, "dst": d} for s, r, d in self.edges]
+        if "AS id" in query:
+            return [{"id": n} for n in self.snapshot.node_names]
+        raise NotImplementedError(f"stand-in graph cannot answer: {query.strip()[:60]}")
+
+
+class StandInUnstructuredIO:
+    def create_element_from_text(self, text: str, element_id: Optional[str] = None):
+        return SimpleNamespace(text=text, element_id=element_id)
+
+
+class StandInKGAgent:
+    """Finds no entities; the local dictionary matcher does the work with stand-ins."""
+
+    def run(self, element, parse_graph_elements: bool = False):
+        return SimpleNamespace(nodes=[], relationships=[])
+
+
+class StandInChatAgent:
+    """
+    Stand-in for ChatAgent: `step()` returns a canned reply after `latency`
+    seconds and `stream_step()` streams it over the same time. Questions
+    asking for a script get a runnable ```python``` block followed by prose,
+    executor follow-ups get a short summary, anything else a one-line answer.
+    """
+
+    def __init__(self, latency: float = 0.0, reply: Optional[Callable[[str], str]] = None):
+        self.latency = latency
+        self.reply = reply or self.default_reply
+        self.history: List[str] = []
+
+    @staticmethod
+    def default_reply(content: str) -> str:
+        if content.startswith("I ran your Python block"):
+            return "The flow ran; see the execution log above."
+        if "script" in content.lower():
+            return SCRIPT_REPLY
+        return f"Stand-in answer ({len(content)} chars of prompt)."
+
+    def step(self, message):
+        content = getattr(message, "content", message)
+        self.history.append(content)
+        _sleep(self.latency)
+        return SimpleNamespace(msgs=[SimpleNamespace(content=self.reply(content))], info={})
+
+    def stream_step(self, message, on_token: Callable[[str], None], temperature: float = 0.0,
+                    cancel_event: Optional[threading.Event] = None) -> str:
+        """Like step(), but the reply arrives in small pieces spread over `latency`."""
+        content = getattr(message, "content", message)
+        self.history.append(content)
+        reply = self.reply(content)
+        pieces = [reply[i:i + STREAM_PIECE_CHARS] for i in range(0, len(reply), STREAM_PIECE_CHARS)] or [""]
+        sent = []
+        for piece in pieces:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            _sleep(self.latency / len(pieces))
+            on_token(piece)
+            sent.append(piece)
+        return "".join(sent)
+
+    def reset(self):
+        self.history.clear()
+
+
+_install_lock = threading.Lock()
+
+
+def local_qdrant_store(docs: Sequence[str], embedding: StandInEmbedding, path: str, collection_name: str = "stand_in"):
+    """A real local-path QdrantStorage filled with `docs` embedded by the stand-in embedding."""
+    from camel.storages import QdrantStorage, VectorRecord
+    storage = QdrantStorage(vector_dim=embedding.get_output_dim(), path=path, collection_name=collection_name)
+    vectors = embedding.embed_list(list(docs))
+    storage.add([VectorRecord(vector=v, payload={"text": t}) for t, v in zip(docs, vectors)])
+    return storage
+
+
+def local_mmap_index(docs: Sequence[str], embedding: StandInEmbedding, path: str):
+    """A memory-mapped index (mmap_index.py) of `docs` embedded by the stand-in embedding."""
+    from mmap_index import MmapVectorIndex, export_points
+    vectors = embedding.embed_list(list(docs))
+    points = (SimpleNamespace(id=f"doc-{i}", vector=v, payload={"text": t})
+              for i, (t, v) in enumerate(zip(docs, vectors)))
+    export_points(points, len(docs), embedding.get_output_dim(), path)
+    return MmapVectorIndex(path)
+
+
+def local_lexical_index(docs: Sequence[str]):
+    """BM25 index over `docs`, with the same point IDs as StandInVectorStore."""
+    from lexical_index import LexicalIndexBuilder
+    builder = LexicalIndexBuilder()
+    for i, text in enumerate(docs):
+        builder.add(f"doc-{i}", text)
+    return builder.build()
+
+
+def install(
+    resources=None,
+    latency: float = 0.0,
+    docs: Sequence[str] = SAMPLE_DOCS,
+    edges: Sequence[Tuple[str, str, str]] = SAMPLE_EDGES,
+    semantic_cache_path: Optional[str] = None,
+    chat_latency: Optional[float] = None,
+    qdrant_path: Optional[str] = None,
+    reply: Optional[Callable[[str], str]] = None,
+    mmap_path: Optional[str] = None,
+):
+    """
+    Replace OpenAI, Qdrant and Neo4j in `resources` (default: the pipeline's
+    process-wide container) with the stand-ins above. `latency` is added to
+    every embedding, vector and graph call, `chat_latency` (default: the
+    same) to every chat reply. With `qdrant_path`, a local-path Qdrant
+    collection is used instead of the in-memory vector store, with `mmap_path`
+    a memory-mapped index. Returns the resources.
+    """
+    from semantic_cache import SemanticCache
+    from sessions import SessionPool
+    if resources is None:
+        from pipeline import get_resources
+        resources = get_resources()
+    chat_latency = latency if chat_latency is None else chat_latency
+    with _install_lock:
+        embedding = StandInEmbedding(latency=latency)
+        resources.install("embedding", embedding)
+        if qdrant_path:
+            resources.install("vector_store", local_qdrant_store(docs, embedding, qdrant_path))
+        elif mmap_path:
+            resources.install("vector_store", local_mmap_index(docs, embedding, mmap_path))
+        else:
+            resources.install("vector_store", StandInVectorStore(docs, embedding, latency=latency))
+        resources.install("lexical_index", local_lexical_index(docs))
+        resources.install("n4j", StandInGraph(edges, latency=latency))
+        resources.install("uio", StandInUnstructuredIO())
+        resources.install("kg_agent", StandInKGAgent())
+        resources.install("camel_agent", StandInChatAgent(latency=chat_latency, reply=reply))
+        resources.install("sessions", SessionPool(lambda: StandInChatAgent(latency=chat_latency, reply=reply)))
+        resources.install("semantic_cache", SemanticCache(path=semantic_cache_path))
+        for name in ("entity_matcher", "graph_store"):
+            resources.reset(name)
+    return resources
@@ -0,0 +1,112 @@
+"""
+Token streaming for chat replies.
+
+stream_step() is the streaming counterpart of ChatAgent.step(): it sends the
+agent's memory plus the new message to the OpenAI chat API with stream=True,
+forwards every text delta to `on_token` as it arrives, and records both
+messages back into the agent's memory so the conversation continues as if
+step() had been called. FenceWatcher spots the first complete ```python```
+block in a token stream so execution can start before generation ends.
+"""
+
+import threading
+from typing import Callable, Optional
+
+from pipeline import CHAT_TEMPERATURE, OPENAI_API_KEY
+
+# --- Configuration ---
+STREAM_MODEL = "gpt-4o-mini"  # Same model as pipeline.openai_model (ModelType.GPT_4O_MINI)
+FENCE_OPEN = "```python"
+FENCE_CLOSE = "```"
+# ---------------------
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=OPENAI_API_KEY)
+        return _client
+
+
+class FenceWatcher:
+    """
+    Fed a reply chunk by chunk, calls `on_code(code)` once, as soon as the
+    first ```python ... ``` block is closed. Matches extract_python_code():
+    the contents between the fences, stripped.
+    """
+
+    def __init__(self, on_code: Callable[[str], None]):
+        self.on_code = on_code
+        self.text = ""
+        self.code: Optional[str] = None
+        self._open_at: Optional[int] = None  # Index just past the opening fence
+        self._scan_from = 0
+
+    def feed(self, chunk: str):
+        if self.code is not None:
+            return
+        self.text += chunk
+        if self._open_at is None:
+            start = self.text.find(FENCE_OPEN, self._scan_from)
+            if start < 0:
+                # A fence may be split across chunks; rescan the tail next time.
+                self._scan_from = max(0, len(self.text) - len(FENCE_OPEN))
+                return
+            self._open_at = self._scan_from = start + len(FENCE_OPEN)
+        end = self.text.find(FENCE_CLOSE, self._scan_from)
+        if end < 0:
+            self._scan_from = max(self._open_at, len(self.text) - len(FENCE_CLOSE))
+            return
+        self.code = self.text[self._open_at:end].strip()
+        self.on_code(self.code)
+
+
+def stream_step(
+    agent,
+    message,
+    on_token: Callable[[str], None],
+    temperature: float = CHAT_TEMPERATURE,
+    cancel_event: Optional[threading.Event] = None,
+) -> str:
+    """
+    Send `message` through `agent`'s conversation, streaming the reply to
+    `on_token`. Returns the full reply text, or what was received before
+    `cancel_event` was set. Agents that provide their own `stream_step`
+    (e.g. stand_ins.StandInChatAgent) are used as is.
+    """
+    if hasattr(agent, "stream_step"):
+        return agent.stream_step(message, on_token, temperature=temperature, cancel_event=cancel_event)
+
+    from camel.messages import BaseMessage
+    from camel.types import OpenAIBackendRole
+
+    agent.update_memory(message, OpenAIBackendRole.USER)
+    messages, _ = agent.memory.get_context()
+    stream = get_openai_client().chat.completions.create(
+        model=STREAM_MODEL,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+    )
+    parts = []
+    for event in stream:
+        if cancel_event is not None and cancel_event.is_set():
+            stream.close()  # Stop paying for tokens nobody will read
+            break
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+    reply = "".join(parts)
+    agent.update_memory(
+        BaseMessage.make_assistant_message(role_name="VLSI Engineer", content=reply),
+        OpenAIBackendRole.ASSISTANT,
+    )
+    return reply
@@ -0,0 +1,54 @@
+"""
+Token counting shared by embedding batching and prompt assembly.
+Uses tiktoken when it is installed (it ships with camel-ai) and falls back
+to a ~4 characters per token estimate otherwise.
+"""
+
+from functools import lru_cache
+from typing import List, Optional
+
+DEFAULT_ENCODING = "cl100k_base"  # Encoding used by text-embedding-3-* and gpt-4o-mini is close enough
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, encoding: Optional[str] = DEFAULT_ENCODING) -> int:
+    """Number of tokens in `text` (estimated if tiktoken is unavailable)."""
+    enc = _get_encoding(encoding) if encoding else None
+    if enc is None:
+        return max(1, (len(text) + 3) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: Optional[str] = DEFAULT_ENCODING) -> str:
+    """Cut `text` down to at most `max_tokens` tokens."""
+    enc = _get_encoding(encoding) if encoding else None
+    if enc is None:
+        return text[:max_tokens * 4]
+    ids = enc.encode(text, disallowed_special=())
+    return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+
+
+def split_to_tokens(text: str, max_tokens: int, encoding: Optional[str] = DEFAULT_ENCODING) -> List[str]:
+    """Consecutive pieces of `text` of about `max_tokens` tokens each; joined, they give back `text`."""
+    enc = _get_encoding(encoding) if encoding else None
+    if enc is None:
+        step = max(1, max_tokens) * 4
+        return [text[i:i + step] for i in range(0, len(text), step)] or [text]
+    ids = enc.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return [text]
+    # Cut at token starts (as character offsets), so no character is split or lost.
+    _, starts = enc.decode_with_offsets(ids)
+    cuts = sorted({0, *(starts[i] for i in range(max_tokens, len(ids), max(1, max_tokens)))} | {len(text)})
+    return [text[a:b] for a, b in zip(cuts, cuts[1:]) if a < b]
@@ -0,0 +1,304 @@
+"""
+Per-stage tracing and metrics for the query pipeline.
+
+    with tracing.request("answer"):                 # new request ID
+        with tracing.span("vector", top_k=7) as sp:
+            ...
+            sp.set(hits=len(hits))
+
+Every span records its duration into the `pipeline_stage_seconds` histogram
+(labelled by stage and status) and, when TRACE_LOG is set, is written as one
+JSON line with its request ID, parent span and attributes (token counts,
+cache hits, exit codes, ...). Counters such as cache hits and tokens go
+through `count()`. `render_prometheus()` returns everything in the
+Prometheus text format; service.py serves it on GET /metrics.
+
+Disabled (the default), span() and request() return a shared no-op object
+and count() returns immediately, so the instrumented code pays one global
+lookup and one call per stage. Request IDs live in a contextvar; use
+`bind(fn)` when handing work to another thread so spans keep their parent.
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+# --- Configuration ---
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") not in ("0", "false", "False", "")
+TRACE_LOG = os.getenv("TRACE_LOG", "")  # JSONL path for span logs, "-" for stderr, empty for none
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# ---------------------
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Registry:
+    """Counters and histograms keyed by (name, sorted label items)."""
+
+    def __init__(self, buckets: Sequence[float] = STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], list] = {}  # [bucket counts..., +Inf count, sum]
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[len(self.buckets)] += 1
+            hist[-1] += value
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _labels(items: Tuple, extra: str = "") -> str:
+        parts = [f'{k}="{str(v)}"' for k, v in items]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        lines, described = [], set()
+
+        def header(name, default_kind):
+            if name not in described:
+                described.add(name)
+                kind, text = self._help.get(name, (default_kind, name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, hist):
+                le = 'le="%g"' % bound
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{name}_bucket{self._labels(labels, inf)} {hist[len(self.buckets)]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist[len(self.buckets)]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.describe("pipeline_stage_seconds", "histogram", "Duration of pipeline stages in seconds")
+registry.describe("pipeline_requests_total", "counter", "Pipeline requests by kind and status")
+registry.describe("pipeline_cache_total", "counter", "Cache lookups by cache and result")
+registry.describe("pipeline_retrieval_total", "counter", "Retrievals by path (vector, hybrid, lexical-only)")
+registry.describe("pipeline_tokens_total", "counter", "Tokens by kind (context, prompt, completion)")
+registry.describe("http_requests_total", "counter", "HTTP requests served by path and status code")
+
+
+class _LogSink:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self.path = ""
+
+    def open(self, path: str):
+        with self._lock:
+            if self._file is not None and self._file is not sys.stderr:
+                self._file.close()
+            self.path = path
+            self._file = None if not path else sys.stderr if path == "-" else open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        if self._file is None:
+            return
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+_sink = _LogSink()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "span_id", "parent", "request_id", "started", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent = parent.span_id if parent is not None else None
+        self.request_id = _request_id.get()
+        self.span_id = next(_span_ids)
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        _current_span.reset(self._token)
+        status = "ok" if exc_type is None else "error"
+        registry.observe("pipeline_stage_seconds", duration, stage=self.name, status=status)
+        record = {
+            "ts": round(time.time(), 6),
+            "request_id": self.request_id,
+            "span": self.name,
+            "span_id": self.span_id,
+            "parent": self.parent,
+            "duration_ms": round(duration * 1000, 3),
+            "status": status,
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        record.update(self.attrs)
+        _sink.write(record)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def enable(log_path: Optional[str] = None):
+    """Turn tracing on at runtime (e.g. from a CLI flag); `log_path` as for TRACE_LOG."""
+    global TRACING_ENABLED
+    if log_path is not None:
+        _sink.open(log_path)
+    TRACING_ENABLED = True
+
+
+def disable():
+    global TRACING_ENABLED
+    TRACING_ENABLED = False
+
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; attributes can be added with `.set()`."""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name, attrs)
+
+
+def current_span():
+    """The innermost open span (NOOP_SPAN when there is none or tracing is off)."""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def count(name: str, value: float = 1.0, **labels):
+    if TRACING_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+@contextmanager
+def _request(kind: str, request_id: Optional[str], attrs: Dict[str, Any]):
+    token = _request_id.set(request_id or uuid.uuid4().hex[:16])
+    status = "error"
+    try:
+        with Span(kind, attrs) as sp:
+            yield sp
+            status = "ok"
+    finally:
+        registry.inc("pipeline_requests_total", kind=kind, status=status)
+        _request_id.reset(token)
+
+
+def request(kind: str, request_id: Optional[str] = None, **attrs):
+    """
+    Root span for one request. Nested requests (e.g. answer_vlsi_query inside
+    the execute flow) keep the outer request ID and become ordinary spans.
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    if _request_id.get() is not None and request_id is None:
+        return Span(kind, attrs)
+    return _request(kind, request_id, attrs)
+
+
+def traced(name: str, root: bool = False):
+    """
+    Decorator: run the function inside span(name) (request(name) with
+    root=True). Inside, `current_span().set(...)` adds attributes.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with (request(name) if root else Span(name, {})):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn` bound to the caller's context, for thread pools (a no-op when tracing is off)."""
+    if not TRACING_ENABLED:
+        return fn
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of a non-empty sequence."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def render_prometheus() -> str:
+    return registry.render()
+
+
+if TRACE_LOG:
+    _sink.open(TRACE_LOG)
@@ -1,8 +1,20 @@
+import concurrent.futures
+import hashlib
 import json
+import math
 import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+import uuid
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import ScrollRequest
 
+from collection_config import get_collection_config
+
 # --- Configuration ---
 QDRANT_PATH = "my_vectors"  # Path to your Qdrant data directory
 COLLECTION_NAME = "or_rag_docs"  # The collection name you used
@@ -11,6 +23,17 @@ JSONL_FILE_PATH = "/home/german/Desktop/cse291/camel/query_dataset.jsonl" # Path
 MARKDOWN_SOURCE_DIR = "/home/german/Desktop/cse291/camel/processed_output" # FIXME: Update this path
 # Payload field in Qdrant that stores the text. CAMEL usually uses "text".
 QDRANT_TEXT_PAYLOAD_KEY = "text"
+# Payload field set on markdown documentation chunks (ingest_docs.py); those points have no JSONL line
+DOC_SOURCE_PAYLOAD_KEY = "source"
+# Reconciliation (--reconcile): digests are spilled to hash-partitioned files and compared one partition at a time
+RECONCILE_PARTITIONS = 16  # Minimum partitions; raised automatically to stay within RECONCILE_MEMORY_MB
+RECONCILE_MAX_PARTITIONS = 256
+RECONCILE_MEMORY_MB = 256  # Budget for the partitions being compared at once
+RECONCILE_WORKERS = 4  # Partitions compared in parallel
+RECONCILE_SCROLL_LIMIT = 5000  # Points per Qdrant scroll page
+RECONCILE_SPILL_BUFFER = 32 * 1024  # Bytes buffered per partition file before writing
+RECONCILE_REPORT = "reconcile_report.jsonl"
+DIGEST_BYTES = 16  # Prefix of the sha256 content digest (same hash as ingest_manifest.content_digest)
 # ---------------------
 
 def get_qdrant_data(client, collection_name):
@@ -177,6 +200,281 @@ def verify_data():
 
     print("\n--- Verification Complete ---")
 
+# --- Streaming reconciliation ---
+# Both sides are reduced to fixed-size records (content digest plus line number
+# or point ID), spilled to one file per digest-prefix partition, and each
+# partition is then sorted and compared on its own. Memory is bounded by the
+# largest partition, not by the corpus.
+SOURCE_RECORD = struct.Struct(f"<{DIGEST_BYTES}sQ")  # digest, JSONL line number
+POINT_RECORD = struct.Struct(f"<{DIGEST_BYTES}sB16s")  # digest, ID kind, ID bytes
+SOURCE_DTYPE = np.dtype([("digest", f"S{DIGEST_BYTES}"), ("line", "<u8")])
+POINT_DTYPE = np.dtype([("digest", f"S{DIGEST_BYTES}"), ("kind", "u1"), ("id", "S16")])
+ID_INT, ID_UUID = 0, 1
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()[:DIGEST_BYTES]
+
+def encode_point_id(point_id):
+    """(kind, 16 bytes) for an integer or UUID point ID."""
+    if isinstance(point_id, int):
+        return ID_INT, point_id.to_bytes(16, "big")
+    return ID_UUID, uuid.UUID(str(point_id)).bytes
+
+def decode_point_id(kind, raw):
+    raw = raw.ljust(16, b"\0")  # numpy drops trailing NUL bytes from S16 fields
+    if kind == ID_INT:
+        return int.from_bytes(raw, "big")
+    return str(uuid.UUID(bytes=raw))
+
+def normalized_jsonl_text(line):
+    """The payload text the ingestion script stores for a JSONL line (None for blank or malformed lines)."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.dumps(json.loads(line))
+    except json.JSONDecodeError:
+        return None
+
+class PartitionSpill:
+    """Appends fixed-size records to one file per digest-prefix partition."""
+
+    def __init__(self, directory, name, partitions, record):
+        self.paths = [os.path.join(directory, f"{name}_{p:04d}.bin") for p in range(partitions)]
+        self.partitions = partitions
+        self.record = record
+        self._buffers = [bytearray() for _ in range(partitions)]
+        self.count = 0
+
+    def add(self, digest, *fields):
+        p = int.from_bytes(digest[:8], "big") % self.partitions
+        buf = self._buffers[p]
+        buf += self.record.pack(digest, *fields)
+        self.count += 1
+        if len(buf) >= RECONCILE_SPILL_BUFFER:
+            self._flush(p)
+
+    def _flush(self, p):
+        with open(self.paths[p], "ab") as f:
+            f.write(self._buffers[p])
+        self._buffers[p] = bytearray()
+
+    def close(self):
+        for p in range(self.partitions):
+            self._flush(p)
+
+def spill_jsonl(file_path, spill):
+    """Digest every JSONL line into `spill`; returns (lines read, malformed lines skipped)."""
+    lines = skipped = 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            lines += 1
+            text = normalized_jsonl_text(line)
+            if text is None:
+                skipped += line.strip() != ""
+                continue
+            spill.add(text_digest(text), line_number)
+    spill.close()
+    return lines, skipped
+
+def scroll_pages(client, collection_name, limit=RECONCILE_SCROLL_LIMIT):
+    """Yield scroll pages, fetching the next page while the caller digests the current one."""
+    pages = queue.Queue(maxsize=2)
+
+    def fetch():
+        offset = None
+        try:
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name,
+                    limit=limit,
+                    offset=offset,
+                    with_payload=[QDRANT_TEXT_PAYLOAD_KEY, DOC_SOURCE_PAYLOAD_KEY],
+                    with_vectors=False
+                )
+                pages.put(points)
+                if not offset:
+                    break
+        except Exception as e:
+            pages.put(e)
+        pages.put(None)
+
+    threading.Thread(target=fetch, daemon=True).start()
+    while True:
+        page = pages.get()
+        if page is None:
+            return
+        if isinstance(page, Exception):
+            raise page
+        yield page
+
+def spill_qdrant(client, collection_name, spill, no_text, limit=RECONCILE_SCROLL_LIMIT):
+    """
+    Digest every point's payload text into `spill`; IDs of points without text
+    go to `no_text`. Documentation chunks are not compared against the JSONL;
+    returns how many were skipped.
+    """
+    doc_chunks = 0
+    for page in scroll_pages(client, collection_name, limit):
+        for point in page:
+            payload = point.payload or {}
+            if DOC_SOURCE_PAYLOAD_KEY in payload:
+                doc_chunks += 1
+                continue
+            text = payload.get(QDRANT_TEXT_PAYLOAD_KEY)
+            if not isinstance(text, str):
+                no_text.append(point.id)
+                continue
+            spill.add(text_digest(text), *encode_point_id(point.id))
+    spill.close()
+    return doc_chunks
+
+def compare_partition(source_path, points_path):
+    """Findings for one partition: missing lines, extra points, duplicated points and source lines."""
+    src = np.fromfile(source_path, dtype=SOURCE_DTYPE) if os.path.exists(source_path) else np.empty(0, SOURCE_DTYPE)
+    pts = np.fromfile(points_path, dtype=POINT_DTYPE) if os.path.exists(points_path) else np.empty(0, POINT_DTYPE)
+    src.sort(order=["digest", "line"])
+    pts.sort(order="digest")
+    src_digests, src_first, src_counts = np.unique(src["digest"], return_index=True, return_counts=True)
+    pt_digests, pt_first, pt_counts = np.unique(pts["digest"], return_index=True, return_counts=True)
+    findings = []
+
+    def hex_digest(d):
+        return d.ljust(DIGEST_BYTES, b"\0").hex()
+
+    for i in np.flatnonzero(~np.isin(src_digests, pt_digests)):
+        findings.append({"kind": "missing", "digest": hex_digest(src_digests[i]), "line": int(src["line"][src_first[i]])})
+    extra = ~np.isin(pts["digest"], src_digests)
+    for row in pts[extra]:
+        findings.append({"kind": "extra", "digest": hex_digest(row["digest"]),
+                         "point_id": decode_point_id(row["kind"], row["id"])})
+    for i in np.flatnonzero(pt_counts > 1):
+        rows = pts[pt_first[i]:pt_first[i] + pt_counts[i]]
+        findings.append({"kind": "duplicate", "digest": hex_digest(pt_digests[i]),
+                         "point_ids": [decode_point_id(r["kind"], r["id"]) for r in rows]})
+    for i in np.flatnonzero(src_counts > 1):
+        lines = src["line"][src_first[i]:src_first[i] + src_counts[i]]
+        findings.append({"kind": "source_duplicate", "digest": hex_digest(src_digests[i]),
+                         "lines": [int(n) for n in lines]})
+    return findings
+
+def choose_partitions(expected_records, workers, memory_mb=RECONCILE_MEMORY_MB, minimum=RECONCILE_PARTITIONS):
+    """Enough partitions that `workers` of them (both sides, plus sort/unique copies) fit in `memory_mb`."""
+    per_record = (SOURCE_DTYPE.itemsize + POINT_DTYPE.itemsize) * 3
+    needed = math.ceil(expected_records * per_record * workers / (memory_mb * 1024 * 1024))
+    return max(1, min(RECONCILE_MAX_PARTITIONS, max(minimum, needed)))
+
+def reconcile(
+    jsonl_path=JSONL_FILE_PATH,
+    qdrant_path=None,
+    collection_name=None,
+    report_path=RECONCILE_REPORT,
+    partitions=None,
+    workers=RECONCILE_WORKERS,
+    memory_mb=RECONCILE_MEMORY_MB,
+    scroll_limit=RECONCILE_SCROLL_LIMIT,
+    client=None
+):
+    """
+    Streaming counterpart of verify_data(): compares content digests of the
+    JSONL lines (normalized as the ingestion script stores them) with the
+    payload texts in Qdrant, and writes every missing line, extra point,
+    duplicated point and duplicated source line to `report_path` as JSONL.
+    The collection defaults to the one in collection_config.py; documentation
+    chunks (ingest_docs.py) are counted separately, not reported as extra.
+    Returns a summary dict of counts.
+    """
+    config = get_collection_config()
+    qdrant_path = qdrant_path or config.path
+    collection_name = collection_name or config.name
+    print("--- Starting Streaming Reconciliation ---")
+    if not os.path.exists(jsonl_path):
+        print(f"Error: JSONL file '{jsonl_path}' not found.")
+        return None
+    client = client or QdrantClient(path=qdrant_path)
+    total_points = client.get_collection(collection_name=collection_name).points_count or 0
+    if partitions is None:
+        partitions = choose_partitions(total_points, workers, memory_mb)
+    print(f"Qdrant collection '{collection_name}' has {total_points} points; using {partitions} partitions.")
+
+    spill_dir = tempfile.mkdtemp(prefix="reconcile_")
+    try:
+        source_spill = PartitionSpill(spill_dir, "source", partitions, SOURCE_RECORD)
+        point_spill = PartitionSpill(spill_dir, "points", partitions, POINT_RECORD)
+        no_text = []
+        # Read the JSONL while scrolling Qdrant; the scroll is I/O bound.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as reader:
+            source_job = reader.submit(spill_jsonl, jsonl_path, source_spill)
+            doc_chunks = spill_qdrant(client, collection_name, point_spill, no_text, scroll_limit)
+            lines, skipped = source_job.result()
+        print(f"Digested {source_spill.count} JSONL entries ({skipped} malformed lines skipped) "
+              f"and {point_spill.count} Qdrant points ({doc_chunks} documentation chunks not compared).")
+
+        counts = {"missing": 0, "extra": 0, "duplicate": 0, "duplicate_points": 0, "source_duplicate": 0,
+                  "no_text": len(no_text), "doc_chunks": doc_chunks}
+        examples = {}
+        with open(report_path, "w", encoding="utf-8") as report, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for point_id in no_text:
+                report.write(json.dumps({"kind": "no_text", "point_id": point_id}) + "\n")
+            jobs = [pool.submit(compare_partition, source_spill.paths[p], point_spill.paths[p])
+                    for p in range(partitions)]
+            for job in concurrent.futures.as_completed(jobs):
+                for finding in job.result():
+                    counts[finding["kind"]] += 1
+                    if finding["kind"] == "duplicate":
+                        counts["duplicate_points"] += len(finding["point_ids"]) - 1
+                    found = examples.setdefault(finding["kind"], [])
+                    if len(found) < 5:
+                        found.append(finding)
+                    report.write(json.dumps(finding) + "\n")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    summary = {"jsonl_lines": lines, "jsonl_entries": source_spill.count, "malformed_lines": skipped,
+               "qdrant_points": total_points, "digested_points": point_spill.count, **counts}
+    print("\n--- Reconciliation Results ---")
+    print(f"Missing in Qdrant: {counts['missing']} entries")
+    print(f"Extra in Qdrant: {counts['extra']} points")
+    print(f"Duplicated in Qdrant: {counts['duplicate']} texts ({counts['duplicate_points']} surplus points)")
+    print(f"Duplicated in JSONL: {counts['source_duplicate']} texts")
+    print(f"Points without '{QDRANT_TEXT_PAYLOAD_KEY}' payload: {counts['no_text']}")
+    print(f"Documentation chunks (ingest_docs.py, not in the JSONL): {counts['doc_chunks']}")
+    for kind, found in examples.items():
+        for i, finding in enumerate(found):
+            print(f"  {kind} example {i+1}: {json.dumps(finding)[:160]}")
+    print(f"Full list written to {report_path}")
+    print("\n--- Reconciliation Complete ---")
+    return summary
+
 # Run the verification
 if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Check that a Qdrant collection matches its source JSONL.")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="Streaming digest comparison with missing/extra/duplicate IDs (fixed memory)")
+    parser.add_argument("--jsonl", default=JSONL_FILE_PATH, help="Source JSONL file")
+    parser.add_argument("--qdrant_path", default=get_collection_config().path)
+    parser.add_argument("--collection", default=get_collection_config().name)
+    parser.add_argument("--report", default=RECONCILE_REPORT, help="JSONL file listing every discrepancy")
+    parser.add_argument("--partitions", type=int, help="Digest partitions (default: sized from --memory_mb)")
+    parser.add_argument("--workers", type=int, default=RECONCILE_WORKERS, help="Partitions compared in parallel")
+    parser.add_argument("--memory_mb", type=int, default=RECONCILE_MEMORY_MB)
+    parser.add_argument("--scroll_limit", type=int, default=RECONCILE_SCROLL_LIMIT)
+    args = parser.parse_args()
+    if args.reconcile:
+        summary = reconcile(
+            jsonl_path=args.jsonl,
+            qdrant_path=args.qdrant_path,
+            collection_name=args.collection,
+            report_path=args.report,
+            partitions=args.partitions,
+            workers=args.workers,
+            memory_mb=args.memory_mb,
+            scroll_limit=args.scroll_limit
+        )
+        if summary is None:
+            sys.exit(2)
+        sys.exit(1 if summary["missing"] or summary["extra"] or summary["duplicate"] else 0)
     verify_data()
\ No newline at end of file
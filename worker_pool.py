@@ -0,0 +1,224 @@
+"""
+Pool of warm, long-lived script-execution workers.
+
+Each worker is a `python exec_worker.py` (or `openroad -python exec_worker.py`)
+process that has already paid interpreter / OpenROAD start-up. Scripts are
+sent over a pipe and run in a fresh namespace; a worker is replaced after
+EXEC_WORKER_MAX_JOBS jobs, when it crashes, or when a job exceeds its timeout.
+Workers run under the same address-space cap as bounded_exec; since they are
+long-lived, per-script CPU time is bounded by the job's wall-clock timeout.
+Scripts with other limits, or that must be cancellable, need a fresh process
+(see honours()).
+"""
+
+import itertools
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from bounded_exec import (
+    EXEC_CPU_SECONDS, EXEC_MEMORY_MB, EXEC_OUTPUT_HEAD_BYTES, EXEC_OUTPUT_TAIL_BYTES, ExecLimits, rlimits, spawn_limited,
+)
+from exec_worker import HANDSHAKE, read_message, write_message
+
+# --- Configuration ---
+EXEC_POOL_WORKERS = int(os.getenv("EXEC_POOL_WORKERS", "0"))  # 0 = fresh subprocess per script (no pool)
+EXEC_WORKER_MAX_JOBS = int(os.getenv("EXEC_WORKER_MAX_JOBS", "50"))  # Recycle a worker after this many scripts
+EXEC_WORKER_START_TIMEOUT = 60.0  # Seconds to wait for a worker's handshake
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exec_worker.py")
+# ---------------------
+
+
+def worker_command(kind: str) -> List[str]:
+    if kind == "openroad":
+        return ["openroad", "-python", WORKER_SCRIPT]
+    return [sys.executable, WORKER_SCRIPT]
+
+
+def honours(limits: ExecLimits) -> bool:
+    """Whether a warm worker runs a script under `limits`: only the defaults the workers were started with."""
+    return (limits.cpu_seconds, limits.memory_mb, limits.head_bytes, limits.tail_bytes) == \
+        (EXEC_CPU_SECONDS, EXEC_MEMORY_MB, EXEC_OUTPUT_HEAD_BYTES, EXEC_OUTPUT_TAIL_BYTES)
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class ExecWorker:
+    """One worker process plus the pipes used to talk to it."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.command = worker_command(kind)
+        self.jobs_done = 0
+        self.proc = spawn_limited(
+            self.command,
+            rlimits(memory_mb=EXEC_MEMORY_MB),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._wait_for_handshake()
+
+    def _wait_for_handshake(self):
+        # Tools such as OpenROAD print a banner first; skip anything before the handshake.
+        deadline = time.monotonic() + EXEC_WORKER_START_TIMEOUT
+        result = {}
+
+        def read():
+            line = b""
+            while line != HANDSHAKE:
+                line = self.proc.stdout.readline()
+                if not line:
+                    return
+            result["ok"] = True
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        reader.join(timeout=max(0.0, deadline - time.monotonic()))
+        if not result.get("ok"):
+            self.kill()
+            raise WorkerCrashed(f"worker '{' '.join(self.command)}' did not start")
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, job_id: int, code: str, timeout: Optional[float]) -> Dict:
+        """Send one job and wait for its result; kills the worker on timeout or crash."""
+        write_message(self.proc.stdin, {
+            "id": job_id,
+            "code": code,
+            "head_bytes": EXEC_OUTPUT_HEAD_BYTES,
+            "tail_bytes": EXEC_OUTPUT_TAIL_BYTES,
+        })
+        result = {}
+
+        def read():
+            try:
+                result["message"] = read_message(self.proc.stdout)
+            except Exception as e:
+                result["error"] = e
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        reader.join(timeout=timeout)
+        if reader.is_alive():
+            self.kill()
+            raise TimeoutError(f"script exceeded {timeout:.1f}s")
+        message = result.get("message")
+        if message is None:
+            self.kill()
+            code = self.proc.wait()
+            raise WorkerCrashed(f"worker exited with code {code} while running the script")
+        self.jobs_done += 1
+        return message
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+
+class ExecWorkerPool:
+    """Fixed-size pool of warm workers; `run()` is thread-safe and blocks until a worker is free."""
+
+    def __init__(self, workers: int = 2, kind: str = "python", max_jobs: int = EXEC_WORKER_MAX_JOBS):
+        self.kind = kind
+        self.size = workers
+        self.max_jobs = max_jobs
+        self.recycled = 0
+        self._idle: "queue.Queue[Optional[ExecWorker]]" = queue.Queue()
+        self._ids = itertools.count(1)
+        self._closed = False
+        # Start workers concurrently; a slot that fails to start is retried lazily on first use.
+        starters = [threading.Thread(target=self._start_slot, daemon=True) for _ in range(workers)]
+        for t in starters:
+            t.start()
+        for t in starters:
+            t.join()
+
+    def _start_slot(self):
+        try:
+            self._idle.put(ExecWorker(self.kind))
+        except Exception as e:
+            print(f"Warning: could not start {self.kind} exec worker: {e}")
+            self._idle.put(None)
+
+    @property
+    def command(self) -> str:
+        return " ".join(worker_command(self.kind))
+
+    def run(self, code: str, timeout: Optional[float] = None) -> Dict:
+        """
+        Execute `code` on a free worker. Returns the worker's result dict
+        (exit_code, stdout, stderr, duration, truncated). Crashes and timeouts are
+        reported as non-zero exit codes; the worker is replaced either way.
+        """
+        if self._closed:
+            raise RuntimeError("pool is shut down")
+        worker = self._idle.get()
+        started = time.perf_counter()
+        try:
+            if worker is None or not worker.alive():
+                worker = ExecWorker(self.kind)
+            result = worker.run(next(self._ids), code, timeout)
+            if worker.jobs_done >= self.max_jobs:
+                worker.close()
+                worker = None
+                self.recycled += 1
+            return result
+        except TimeoutError as e:
+            worker = None
+            self.recycled += 1
+            return {"exit_code": -9, "stdout": "", "stderr": f"Timed out: {e}",
+                    "duration": time.perf_counter() - started, "timed_out": True}
+        except (WorkerCrashed, OSError) as e:
+            worker = None
+            self.recycled += 1
+            return {"exit_code": -1, "stdout": "", "stderr": f"Worker crashed: {e}",
+                    "duration": time.perf_counter() - started}
+        finally:
+            if worker is None and not self._closed:
+                # Replace the lost worker in the background so the slot is warm again.
+                threading.Thread(target=self._start_slot, daemon=True).start()
+            else:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        self._closed = True
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get(timeout=5)
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.close()
+
+
+_pools: Dict[str, ExecWorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_exec_pool(kind: str = "python", workers: Optional[int] = None) -> ExecWorkerPool:
+    """Process-wide pool per runner kind ("python" or "openroad")."""
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = ExecWorkerPool(workers or max(1, EXEC_POOL_WORKERS), kind=kind)
+            _pools[kind] = pool
+        return pool